@@ -0,0 +1,265 @@
+"""
+Admission control for routes that call CyberSource.
+
+Two checks run before a request is allowed to reach the upstream API:
+
+  - a per-client token bucket (``rate`` tokens/second, ``burst`` capacity)
+  - a global concurrency limit that adapts to upstream latency (AIMD): it
+    grows by ~1 per round trip while latency stays near the observed
+    baseline, and shrinks multiplicatively when latency exceeds
+    ``baseline * latency_tolerance`` or the call fails
+
+Rejected requests get a retry-after hint so the caller can answer 429 quickly.
+
+All counters live in a memory-mapped state file guarded by fcntl.flock, so
+every worker process that points at the same file shares the same buckets
+and the same limit. Each process's share of the in-flight count is also
+kept against its pid, so requests a dead process never released (killed by
+the debug reloader, say) are given back: when the limit looks full, and
+when a process starts up.
+"""
+
+import contextlib
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+_MAGIC = 0x55434144  # "UCAD" (v2: per-process in-flight table)
+# magic, slot count, in_flight, limit, baseline latency, ewma latency
+_HEADER = struct.Struct("<IIqddd")
+# pid, requests it has in flight
+_PID_SLOT = struct.Struct("<qq")
+_PID_SLOTS = 64
+# client hash, tokens, last refill time
+_SLOT = struct.Struct("<Qdd")
+_PROBE = 8
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AdmissionRejected(Exception):
+    """A call was not admitted; retry_after is the suggested wait in seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too Many Requests (retry after {max(1, math.ceil(retry_after))}s)")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Per-client token buckets plus an adaptive global concurrency limit."""
+
+    def __init__(
+        self,
+        state_file: str,
+        rate: float,
+        burst: float,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        latency_tolerance: float = 2.0,
+        slots: int = 4096,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.slots = slots
+        self._slots_offset = _HEADER.size + _PID_SLOTS * _PID_SLOT.size
+        self._size = self._slots_offset + slots * _SLOT.size
+        # flock does not exclude threads sharing one file description
+        self._thread_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+        self._fd = os.open(state_file, os.O_RDWR | os.O_CREAT, 0o600)
+        self._map = None
+        with self._locked():
+            self._initialize()
+
+    # Locking / layout ------------------------------------------------
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _initialize(self):
+        if os.fstat(self._fd).st_size < self._size:
+            os.ftruncate(self._fd, self._size)
+        self._map = mmap.mmap(self._fd, self._size)
+        magic, slots, *_ = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or slots != self.slots:
+            self._map[:] = b"\0" * self._size
+            _HEADER.pack_into(
+                self._map, 0, _MAGIC, self.slots, 0, float(self.initial_limit), 0.0, 0.0
+            )
+        # A slot already holding this pid belongs to an earlier process that had it
+        self._reap(lambda pid: pid != os.getpid() and _pid_alive(pid))
+
+    def _reap(self, alive) -> None:
+        """Give back the in-flight requests of processes for which alive(pid) is False."""
+        in_flight, limit, baseline, ewma = self._read_header()
+        for i in range(_PID_SLOTS):
+            offset = _HEADER.size + i * _PID_SLOT.size
+            pid, count = _PID_SLOT.unpack_from(self._map, offset)
+            if pid and not alive(pid):
+                in_flight -= count
+                _PID_SLOT.pack_into(self._map, offset, 0, 0)
+        self._write_header(max(0, in_flight), limit, baseline, ewma)
+
+    def _count_own(self, delta: int) -> None:
+        """Add delta to this process's in-flight slot (claiming one if needed)."""
+        pid = os.getpid()
+        free = None
+        for i in range(_PID_SLOTS):
+            offset = _HEADER.size + i * _PID_SLOT.size
+            slot_pid, count = _PID_SLOT.unpack_from(self._map, offset)
+            if slot_pid == pid:
+                _PID_SLOT.pack_into(self._map, offset, pid, max(0, count + delta))
+                return
+            if slot_pid == 0 and free is None:
+                free = offset
+        if free is not None and delta > 0:
+            _PID_SLOT.pack_into(self._map, free, pid, delta)
+        # With every slot taken the request is only counted in the header
+
+    def _read_header(self):
+        _, _, in_flight, limit, baseline, ewma = _HEADER.unpack_from(self._map, 0)
+        return in_flight, limit, baseline, ewma
+
+    def _write_header(self, in_flight, limit, baseline, ewma):
+        _HEADER.pack_into(self._map, 0, _MAGIC, self.slots, in_flight, limit, baseline, ewma)
+
+    def _find_slot(self, client_hash: int, now: float):
+        """Return (offset, tokens, updated) for a client, claiming a slot if needed."""
+        start = client_hash % self.slots
+        victim = None
+        for i in range(_PROBE):
+            offset = self._slots_offset + ((start + i) % self.slots) * _SLOT.size
+            stored_hash, tokens, updated = _SLOT.unpack_from(self._map, offset)
+            if stored_hash == client_hash:
+                return offset, tokens, updated
+            if stored_hash == 0:
+                return offset, float(self.burst), now
+            # Evict the least recently refilled slot in the probe window
+            if victim is None or updated < victim[1]:
+                victim = (offset, updated)
+        return victim[0], float(self.burst), now
+
+    # Public API --------------------------------------------------------
+
+    def try_acquire(self, client_key: str):
+        """
+        Admit or reject one request from client_key.
+
+        Returns (admitted, retry_after_seconds). An admitted request must be
+        followed by exactly one release().
+        """
+        # Never 0: 0 marks an empty slot
+        client_hash = (zlib.crc32(client_key.encode("utf-8")) << 1) | 1
+        now = time.time()
+        with self._locked():
+            offset, tokens, updated = self._find_slot(client_hash, now)
+            tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.rate)
+            if tokens < 1.0:
+                _SLOT.pack_into(self._map, offset, client_hash, tokens, now)
+                return False, (1.0 - tokens) / self.rate if self.rate else 60.0
+
+            in_flight, limit, baseline, ewma = self._read_header()
+            if in_flight >= int(limit):
+                # Before rejecting, drop requests held by processes that died
+                self._reap(_pid_alive)
+                in_flight, limit, baseline, ewma = self._read_header()
+            if in_flight >= int(limit):
+                _SLOT.pack_into(self._map, offset, client_hash, tokens, now)
+                return False, max(ewma, 1.0)
+
+            _SLOT.pack_into(self._map, offset, client_hash, tokens - 1.0, now)
+            self._write_header(in_flight + 1, limit, baseline, ewma)
+            self._count_own(1)
+            return True, 0.0
+
+    def release(self, latency: float, ok: bool = True) -> None:
+        """Record the outcome of an admitted request and adapt the limit."""
+        with self._locked():
+            in_flight, limit, baseline, ewma = self._read_header()
+            in_flight = max(0, in_flight - 1)
+            self._count_own(-1)
+            ewma = latency if ewma == 0 else ewma * 0.9 + latency * 0.1
+            # Baseline tracks the fastest recent latency and drifts up slowly
+            if baseline == 0 or latency < baseline:
+                baseline = latency
+            else:
+                baseline += (latency - baseline) * 0.01
+
+            if not ok or latency > baseline * self.latency_tolerance:
+                limit = max(float(self.min_limit), limit * 0.9)
+            elif in_flight + 1 >= limit / 2:
+                # Only grow when the limit is actually being used
+                limit = min(float(self.max_limit), limit + 1.0 / limit)
+            self._write_header(in_flight, limit, baseline, ewma)
+
+    def call(self, client_key: str, fn):
+        """
+        Run fn() as one admitted request from client_key and return its result.
+
+        Raises AdmissionRejected when it is not admitted. An exception from
+        fn() counts as a failure unless it carries a 4xx status attribute.
+        """
+        admitted, retry_after = self.try_acquire(client_key)
+        if not admitted:
+            raise AdmissionRejected(retry_after)
+        started = time.monotonic()
+        ok = False
+        try:
+            result = fn()
+            ok = True
+            return result
+        except Exception as e:
+            status = getattr(e, "status", None)
+            ok = isinstance(status, int) and status < 500
+            raise
+        finally:
+            self.release(time.monotonic() - started, ok)
+
+    def snapshot(self) -> dict:
+        """Return the shared global counters."""
+        with self._locked():
+            in_flight, limit, baseline, ewma = self._read_header()
+        return {
+            "in_flight": in_flight,
+            "limit": round(limit, 2),
+            "baseline_latency_s": round(baseline, 4),
+            "ewma_latency_s": round(ewma, 4),
+        }
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_admission_controller(state_file: str, **settings) -> AdmissionController:
+    """Return this process's controller for state_file (created on first use)."""
+    key = (state_file, tuple(sorted(settings.items())))
+    with _controllers_lock:
+        if key not in _controllers:
+            _controllers[key] = AdmissionController(state_file, **settings)
+        return _controllers[key]
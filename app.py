@@ -16,25 +16,132 @@ Flow (with completeMandate):
   5. Server displays the authorization result
 """
 
+import functools
 import glob
+import hashlib
+import hmac
 import json
 import base64
+import contextlib
+import math
 import os
+import random
+import re
+import secrets
 import ssl
+import threading
+import time
 import traceback
+from urllib.parse import urlsplit
 
-from flask import Flask, render_template, request
+from flask import (
+    Flask,
+    Response,
+    abort,
+    before_render_template,
+    g,
+    has_request_context,
+    redirect,
+    render_template,
+    request,
+    send_file,
+    template_rendered,
+    url_for,
+)
+from flask.json.provider import DefaultJSONProvider
 
 from CyberSource import (
     ApiClient,
+    CustomerApi,
+    DecisionManagerApi,
+    PayerAuthenticationApi,
+    PaymentsApi,
+    TokenizeApi,
     UnifiedCheckoutCaptureContextApi,
 )
 from CyberSource.rest import ApiException
 
-from data.configuration import MerchantConfiguration
+import server_timing
+from admission_control import get_admission_controller
+from batch_capture_context import parse_orders, run_batch, to_ndjson
+from capture_context_store import get_capture_context_store
+from client_library_mirror import NAME_RE as MIRROR_NAME_RE, get_client_library_mirror
+from data.capture_context_templates import get_capture_context_templates
+from data.configuration import MerchantConfiguration as _MerchantConfiguration
+from early_hints import EarlyHintsRequestHandler, send_early_hints
+from endpoint_selection import get_endpoint_selector
+from http_signature import SigningApiClient
+from idempotency import IdempotencyKeyReused, get_idempotency_cache
+from job_queue import get_job_queue, start_worker_pool
+from memory_diagnostics import (
+    get_memory_tracker,
+    record_request as record_memory_request,
+    start_memory_session,
+    stop_memory_session,
+)
+from message_encryption import decrypt_jwe, decryption_unavailable, encrypt_request_body
+from payment_jobs import HANDLERS as JOB_HANDLERS, REFERENCE_RE as PAYMENT_REFERENCE_RE
+from payment_orchestration import ServiceError, orchestrate
+from rum_metrics import MAX_DURATION_MS, get_rum_aggregator
+from sampling_profiler import (
+    ProfilerBusy,
+    SamplingProfiler,
+    collapsed_stacks,
+    flamegraph_svg,
+    profiling_session,
+)
+from sdk_pool import get_sdk_pool
+from sdk_recording import get_sdk_recorder
+from server_timing import get_server_timing_stats
+from template_routing import SESSION_COOKIE, get_template_router, get_variant_stats
+
+
+class MerchantConfiguration(_MerchantConfiguration):
+    """config.ini settings; each load is timed as the Server-Timing "config" phase."""
+
+    def __init__(self):
+        with server_timing.phase("config"):
+            super().__init__()
+
+
+def _request_config() -> MerchantConfiguration:
+    """
+    The current request's MerchantConfiguration, loaded on first use and kept
+    on g so decorators, helpers and the view share one config.ini parse.
+    Outside a request (job workers, batch threads) every call is a fresh load.
+    """
+    if not has_request_context():
+        return MerchantConfiguration()
+    config = g.get("merchant_config")
+    if config is None:
+        config = g.merchant_config = MerchantConfiguration()
+    return config
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with serialization timed as the "json" phase."""
+
+    def dumps(self, obj, **kwargs):
+        with server_timing.phase("json"):
+            return super().dumps(obj, **kwargs)
+
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
+app.json = _TimedJSONProvider(app)
+# JSON responses stay compact even when running with debug=True
+app.json.compact = True
+
+# MAX_CONTENT_LENGTH is enforced by Werkzeug while reading the body (413).
+# MAX_FORM_MEMORY_SIZE only covers multipart fields; urlencoded form fields and
+# JSON strings are checked by _enforce_field_length before any route runs
+_app_config = MerchantConfiguration()
+app.config["MAX_CONTENT_LENGTH"] = _app_config.max_content_length
+app.config["MAX_FORM_MEMORY_SIZE"] = _app_config.max_field_length
+
+_jwe_off_reason = decryption_unavailable(_app_config.jwe_pem_file_directory)
+if _jwe_off_reason:
+    print(f"[jwe] JWE widget results will not be decrypted: {_jwe_off_reason}")
 
 # -------------------------------------------------------------------
 # Utility
@@ -67,15 +174,47 @@ def _get_available_capture_context_configs():
     return result
 
 
-def _load_capture_context_config(filename: str) -> str:
-    """Load capture context JSON from data dir."""
-    path = os.path.join(DATA_DIR, filename)
-    if not os.path.isfile(path):
+def _get_capture_context_template(filename: str):
+    """Return the composed capture context template for a data dir preset."""
+    templates = get_capture_context_templates(DATA_DIR, CONFIG_FILE_PATTERN)
+    if filename not in templates:
         raise FileNotFoundError(f"Config not found: {filename}")
-    with open(path, "r") as f:
-        return f.read()
+    return templates[filename]
+
+
+def _load_capture_context_config(filename: str) -> str:
+    """Load capture context JSON (with $extends layers applied) from data dir."""
+    return _get_capture_context_template(filename).text
+
+
+def _build_capture_context_request(filename: str, params) -> str:
+    """
+    Render a preset with per-order fields from a form or JSON mapping.
+
+    Recognised keys: totalAmount, currency, billTo, shipTo, targetOrigins.
+    billTo/shipTo/targetOrigins may be given as JSON strings (form posts);
+    malformed JSON raises ValueError.
+    """
+
+    def structured(key):
+        value = params.get(key)
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError as e:
+                raise ValueError(f"'{key}' is not valid JSON: {e}") from None
+        return value
+
+    return _get_capture_context_template(filename).render(
+        total_amount=params.get("totalAmount"),
+        currency=params.get("currency"),
+        bill_to=structured("billTo"),
+        ship_to=structured("shipTo"),
+        target_origins=structured("targetOrigins"),
+    )
 
 
+@server_timing.timed("jwt")
 def _decode_jwt_payload(jwt_token: str) -> dict:
     """Decode the payload (second segment) of a JWT without verification."""
     payload_segment = jwt_token.split(".")[1]
@@ -87,12 +226,671 @@ def _decode_jwt_payload(jwt_token: str) -> dict:
     return json.loads(decoded_bytes)
 
 
+def _seconds_until_expiry(decoded_data: dict):
+    """Seconds before a decoded capture context's exp claim, or None without one."""
+    exp = decoded_data.get("exp") if isinstance(decoded_data, dict) else None
+    if not isinstance(exp, (int, float)):
+        return None
+    return exp - time.time()
+
+
+def _extract_client_library(decoded_data: dict):
+    """Return (clientLibrary URL, clientLibraryIntegrity) from a decoded capture context."""
+    ctx_data = decoded_data["ctx"][0]["data"]
+    return ctx_data["clientLibrary"], ctx_data["clientLibraryIntegrity"]
+
+
+def _extract_client_version(decoded_data: dict, client_library_url: str) -> str:
+    """UC client version from the capture context, else from the library URL path."""
+    try:
+        version = decoded_data["ctx"][0]["data"].get("clientVersion")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        version = None
+    if not version:
+        match = re.search(r"/(\d+(?:\.\d+)+)/", urlsplit(client_library_url).path)
+        version = match.group(1) if match else "unknown"
+    return str(version)
+
+
+def _get_client_library_mirror(config):
+    return get_client_library_mirror(
+        config.client_library_mirror_directory, config.client_library_mirror_hosts
+    )
+
+
+def _page_client_library(decoded_data: dict, config):
+    """
+    (URL, integrity) the checkout page should load the client library from:
+    the same-origin mirror copy when mirroring is on and it is stored,
+    otherwise the capture context's clientLibrary URL.
+    """
+    url, integrity = _extract_client_library(decoded_data)
+    if config.client_library_mirror:
+        name = _get_client_library_mirror(config).lookup(url, integrity)
+        if name:
+            return url_for("client_library", name=name), integrity
+    return url, integrity
+
+
+def _url_origin(url: str):
+    """scheme://host[:port] of an absolute URL, or None."""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}" if parts.scheme and parts.netloc else None
+
+
+def _client_library_links(url: str, integrity: str) -> list:
+    """Link header values that preconnect to the client library host and preload the script."""
+    origin = _url_origin(url)
+    links = [f"<{origin}>; rel=preconnect; crossorigin"] if origin else []
+    links.append(
+        f'<{url}>; rel=preload; as=script; crossorigin=anonymous; integrity="{integrity}"'
+    )
+    return links
+
+
+_B64URL = "[A-Za-z0-9_-]"
+_JWS_RE = re.compile(rf"{_B64URL}+\.{_B64URL}+\.{_B64URL}*")
+_JWE_RE = re.compile(rf"{_B64URL}+\.{_B64URL}*\.{_B64URL}+\.{_B64URL}+\.{_B64URL}+")
+
+
+def _classify_widget_response(widget_response: str) -> str:
+    """
+    Pick a decoder from the leading byte and segment structure, in one pass.
+
+    Returns "json", "jwt" (3 base64url segments), "jwe" (5 segments) or "raw".
+    """
+    head = widget_response[:1]
+    if head in ("{", "[") or (head.isspace() and widget_response.lstrip()[:1] in ("{", "[")):
+        return "json"
+    if _JWS_RE.fullmatch(widget_response):
+        return "jwt"
+    if _JWE_RE.fullmatch(widget_response):
+        return "jwe"
+    return "raw"
+
+
+@server_timing.timed("jwt")
+def _decode_widget_response(widget_response: str, jwe_key_file: str = None):
+    """
+    Decode the up.complete() result: a JWT, else raw JSON, else a truncated string.
+
+    A JWE is decrypted with the private key in jwe_key_file and its plaintext
+    decoded the same way.
+    """
+    kind = _classify_widget_response(widget_response)
+    if kind == "jwe" and not jwe_key_file:
+        print("[jwe] JWE widget result left encrypted: decryption is off (see jwe_pem_file)")
+    if kind == "jwe" and jwe_key_file:
+        try:
+            plaintext = decrypt_jwe(widget_response, jwe_key_file)
+        except Exception as e:
+            print(f"[jwe] Could not decrypt widget response: {e}")
+        else:
+            return _decode_widget_response(plaintext)
+    try:
+        if kind == "jwt":
+            return _decode_jwt_payload(widget_response)
+        if kind == "json":
+            return json.loads(widget_response)
+    except ValueError:
+        # Right shape, bad content (bad base64 / JSON): fall through to raw
+        pass
+    return {"rawResponse": widget_response[:2000]}
+
+
+def _jwe_key_file():
+    """jwe_pem_file when it can decrypt JWE results (holds a private key), else None."""
+    key_file = _app_config.jwe_pem_file_directory
+    return None if decryption_unavailable(key_file) else key_file
+
+
+def _extract_payment_result(decoded):
+    """Return (payment_status, transaction_id) from a decoded widget response."""
+    if not isinstance(decoded, dict):
+        return "UNKNOWN", None
+    # The complete mandate response may contain different structures
+    # depending on the outcome (authorized, declined, error, etc.)
+    payment_status = (
+        decoded.get("status")
+        or decoded.get("paymentStatus")
+        or decoded.get("orderStatus")
+        or "COMPLETED"
+    )
+    txn_id = decoded.get("id", decoded.get("transactionId"))
+    return payment_status, txn_id
+
+
 def _get_cybersource_config():
     """Build and return a CyberSource configuration dictionary."""
-    config = MerchantConfiguration()
+    config = _request_config()
     return config.get_configuration()
 
 
+_CAPTURE_CONTEXT_PATH = "/up/v1/capture-contexts"
+
+
+def _get_endpoint_selector(config):
+    """The run_environments selector, or None with a single run environment."""
+    if len(config.run_environments) < 2:
+        return None
+    return get_endpoint_selector(
+        config.run_environments,
+        alpha=config.endpoint_ewma_alpha,
+        max_error_rate=config.endpoint_max_error_rate,
+        probe_interval=config.endpoint_probe_interval_seconds,
+        explore_ratio=config.endpoint_explore_ratio,
+    )
+
+
+def _with_run_environment(config_dict: dict, host: str) -> dict:
+    """A copy of the SDK configuration that sends requests to host."""
+    config_dict = dict(config_dict, run_environment=host)
+    if host.split(":")[0] in ("localhost", "127.0.0.1"):
+        # Local stubs (stub_cybersource.py) use the self-signed certs/ pair
+        config_dict["ssl_verify"] = False
+    return config_dict
+
+
+@contextlib.contextmanager
+def _logged_sdk_call(logger, method: str, path: str, template=None):
+    """
+    Bracket one SDK call with paired SDK REQUEST / SDK RESPONSE lines in the
+    SDK log (log/cybs.log) for log_analyzer.py. Set outcome["status"] to the
+    HTTP status; an ApiException records its own.
+    """
+    call_id = os.urandom(6).hex()
+    logger.info(f"SDK REQUEST id={call_id} {method} {path} template={template or '-'}")
+    outcome = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except ApiException as e:
+        outcome["status"] = e.status
+        raise
+    finally:
+        logger.info(
+            f"SDK RESPONSE id={call_id} status={outcome['status']} "
+            f"elapsed_ms={(time.perf_counter() - started) * 1000:.1f}"
+        )
+
+
+def _generate_capture_context(request_json_str: str, config_dict=None, template=None):
+    """
+    Call the Capture Context API; return (jwt, http_status).
+
+    Goes through the SDK record/replay layer, so in replay mode no API call
+    (or SDK configuration) is made. template is the data/ preset name used
+    to key recordings.
+    """
+    config = _request_config()
+    # template keys recordings on disk and comes from the request: anything
+    # that is not a known preset is recorded as ad hoc
+    if template and template not in get_capture_context_templates(DATA_DIR, CONFIG_FILE_PATTERN):
+        template = None
+    recorder = get_sdk_recorder(
+        config.sdk_recording_mode,
+        config.sdk_recordings_directory,
+        config.sdk_replay_latency_ms,
+    )
+
+    def live_call():
+        body = request_json_str
+        if config.use_mle:
+            body = encrypt_request_body(request_json_str, config.mle_request_cert_file)
+        merchant_config = config_dict if config_dict is not None else config.get_configuration()
+        selector = _get_endpoint_selector(config)
+        if selector is not None:
+            host = selector.choose()
+            merchant_config = _with_run_environment(merchant_config, host)
+        api_client = SigningApiClient() if config.precomputed_signer else ApiClient()
+        api_instance = UnifiedCheckoutCaptureContextApi(merchant_config, api_client)
+        started = time.perf_counter()
+        ok, error = False, None
+        try:
+            with _logged_sdk_call(api_instance.logger, "POST", _CAPTURE_CONTEXT_PATH, template) as outcome:
+                data, outcome["status"], _ = (
+                    api_instance.generate_unified_checkout_capture_context_with_http_info(body)
+                )
+            ok = True
+        except ApiException as e:
+            # A 4xx is an answer from a working host; 5xx / no status is the host failing
+            ok = bool(e.status) and e.status < 500
+            error = f"HTTP {e.status}: {e.reason}"
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if selector is not None:
+                selector.record(host, (time.perf_counter() - started) * 1000, ok, error)
+        return data, outcome["status"]
+
+    with server_timing.phase("sdk"):
+        data, status = recorder.call(template, request_json_str, live_call)
+    if data:
+        _remember_capture_context(data, request_json_str)
+    return data, status
+
+
+def _remember_capture_context(capture_context_jwt: str, request_json_str: str) -> None:
+    """
+    Record the order and completeMandate this context was requested with, under
+    its jti, so server-side orchestration never takes them from the browser.
+    """
+    try:
+        config = _request_config()
+        claims = _decode_jwt_payload(capture_context_jwt)
+        jti = claims.get("jti")
+        # A replayed recording's exp has passed; it gets the store's default lifetime
+        exp = None if config.sdk_recording_mode == "replay" else claims.get("exp")
+        request_doc = json.loads(request_json_str)
+        if not jti or not isinstance(request_doc, dict):
+            return
+        get_capture_context_store(config.capture_context_store_db).remember(
+            jti, request_doc.get("orderInformation"), request_doc.get("completeMandate"), exp
+        )
+    except Exception as e:
+        print(f"[capture-context] Could not record issued capture context: {e}")
+
+
+def _generate_capture_context_for_order(order: dict, config_dict=None) -> str:
+    """Generate a capture context for one batch order spec; raise on failure."""
+    if "config" not in order:
+        raise ValueError("Order is missing 'config' (preset file name)")
+    request_json_str = _build_capture_context_request(order["config"], order)
+    data, status = _generate_capture_context(
+        request_json_str, config_dict, template=order["config"]
+    )
+    if not data:
+        raise RuntimeError(f"No data returned. Status: {status}")
+    return data
+
+
+# -------------------------------------------------------------------
+# Admission control
+# -------------------------------------------------------------------
+
+
+def _get_admission_controller():
+    """Return the shared admission controller, or None when disabled."""
+    config = _request_config()
+    if not config.admission_control:
+        return None
+    return get_admission_controller(
+        config.admission_state_file,
+        rate=config.admission_rate_per_client,
+        burst=config.admission_burst,
+        initial_limit=config.admission_initial_limit,
+        min_limit=config.admission_min_limit,
+        max_limit=config.admission_max_limit,
+        latency_tolerance=config.admission_latency_tolerance,
+    )
+
+
+def _admission_controlled(view):
+    """Reject with 429 + Retry-After before the view runs if the client or upstream is saturated."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        controller = _get_admission_controller()
+        if controller is None:
+            return view(*args, **kwargs)
+
+        admitted, retry_after = controller.try_acquire(request.remote_addr or "unknown")
+        if not admitted:
+            headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+            if request.path.startswith("/api/"):
+                return {"error": "Too Many Requests"}, 429, headers
+            return Response("Too Many Requests", 429, headers, mimetype="text/plain")
+
+        started = time.monotonic()
+        ok = False
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            ok = response.status_code < 500
+            return response
+        finally:
+            controller.release(time.monotonic() - started, ok)
+
+    return wrapper
+
+
+# -------------------------------------------------------------------
+# Idempotency
+# -------------------------------------------------------------------
+
+
+def _request_fingerprint() -> str:
+    """Hash of the request body (form fields sorted, idempotencyKey excluded)."""
+    digest = hashlib.sha256()
+    if request.form:
+        for name, value in sorted(request.form.items(multi=True)):
+            if name != "idempotencyKey":
+                digest.update(f"{name}\0{value}\0".encode("utf-8"))
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _idempotent(view):
+    """
+    Answer repeats of the same post from the idempotency cache.
+
+    The key is the Idempotency-Key header / idempotencyKey form field, else
+    the body hash within the browser session (uc_session cookie), scoped to
+    path and client address. Without a key or a session nothing is cached:
+    identical posts from different shoppers behind one address must not
+    share a response (a capture context, say).
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        ttl = _request_config().idempotency_ttl_seconds
+        if not ttl:
+            return view(*args, **kwargs)
+
+        supplied = request.headers.get("Idempotency-Key") or request.form.get("idempotencyKey")
+        session_id = request.cookies.get(SESSION_COOKIE)
+        if not supplied and not session_id:
+            return view(*args, **kwargs)
+
+        fingerprint = _request_fingerprint()
+        scope = f"key:{supplied}" if supplied else f"session:{session_id}|body:{fingerprint}"
+        key = f"{request.path}|{request.remote_addr}|{scope}"
+
+        def run():
+            response = app.make_response(view(*args, **kwargs))
+            headers = [(k, v) for k, v in response.headers.items() if k != "Content-Length"]
+            return response.get_data(), response.status_code, headers
+
+        try:
+            (data, status, headers), replayed = get_idempotency_cache(ttl).run(
+                key, fingerprint, run, lambda result: result[1] < 500 and result[1] != 429
+            )
+        except IdempotencyKeyReused:
+            return {"error": "Idempotency-Key was already used with a different request"}, 422
+
+        response = Response(data, status, headers)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+    return wrapper
+
+
+# -------------------------------------------------------------------
+# Post-payment jobs
+# -------------------------------------------------------------------
+
+
+def _get_job_queue():
+    """Return the shared job queue, starting in-process workers on first use."""
+    config = _request_config()
+    queue = get_job_queue(
+        config.job_queue_db,
+        visibility_timeout=config.job_visibility_timeout_seconds,
+        max_attempts=config.job_max_attempts,
+        backoff_base=config.job_retry_backoff_seconds,
+    )
+    if config.job_workers > 0:
+        start_worker_pool(queue, JOB_HANDLERS, config.job_workers)
+    return queue
+
+
+def _enqueue_payment_result(widget_response: str, decoded, payment_status, txn_id):
+    """Queue receipt / token bookkeeping for a payment result; return the job ID or None."""
+    # The result is unverified: keying the job by its transaction ID would let
+    # a forged post for that ID shadow the real one. A hash of the whole
+    # result still stops an identical resubmission from being processed twice
+    response_hash = hashlib.sha256(widget_response.encode("utf-8")).hexdigest()[:32]
+    if not (isinstance(txn_id, str) and PAYMENT_REFERENCE_RE.fullmatch(txn_id)):
+        txn_id = None
+    reference = txn_id or response_hash[:24]
+    try:
+        return _get_job_queue().enqueue(
+            "payment_result",
+            {
+                "reference": reference,
+                "responseHash": response_hash,
+                "status": payment_status,
+                "transactionId": txn_id,
+                "result": decoded,
+                "receivedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            dedupe_key=f"payment_result:{response_hash}",
+        )
+    except Exception as e:
+        print(f"[jobs] Could not enqueue payment result {reference}: {e}")
+        return None
+
+
+_SSE_HEARTBEAT_SECONDS = 10
+
+
+def _sse(event: str, data) -> str:
+    """One server-sent event with a JSON data line."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _sse_response(events) -> Response:
+    response = Response(events, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx-style proxies from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _job_events(queue, job_id: int, timeout: float):
+    """
+    Follow a post-payment job: "processed" once it is done or failed, or
+    "timeout" if it is still queued or running after timeout seconds.
+    Comment lines are sent meanwhile so idle connections stay open.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.wait(job_id, max(0.0, min(_SSE_HEARTBEAT_SECONDS, deadline - time.monotonic())))
+        if job is None:
+            yield _sse("error", {"error": "Unknown job", "jobId": job_id})
+            return
+        if job["status"] in ("done", "failed"):
+            event = {
+                "jobId": job_id,
+                "status": job["status"],
+                "attempts": job["attempts"],
+                "elapsedMs": round((job["finished_at"] - job["enqueued_at"]) * 1000),
+            }
+            if job["last_error"]:
+                event["error"] = job["last_error"].strip().splitlines()[-1]
+            yield _sse("processed", event)
+            return
+        if time.monotonic() >= deadline:
+            yield _sse("timeout", {"jobId": job_id, "status": job["status"], "attempts": job["attempts"]})
+            return
+        yield ": keep-alive\n\n"
+
+
+# -------------------------------------------------------------------
+# Server-side payment orchestration
+# -------------------------------------------------------------------
+
+# payment_orchestration service -> (API class, *_with_http_info method, logged path)
+_ORCHESTRATION_SERVICES = {
+    "fraud": (
+        DecisionManagerApi, "create_bundled_decision_manager_case_with_http_info", "/risk/v1/decisions",
+    ),
+    "authentication": (
+        PayerAuthenticationApi, "check_payer_auth_enrollment_with_http_info", "/risk/v1/authentications",
+    ),
+    "authorization": (PaymentsApi, "create_payment_with_http_info", "/pts/v2/payments"),
+    "tokenize": (TokenizeApi, "tokenize_with_http_info", "/tms/v2/tokenize"),
+    "delete_customer": (
+        CustomerApi, "delete_customer_with_http_info", "/tms/v2/customers/{customerId}",
+    ),
+}
+
+
+def _orchestration_call(config, config_dict):
+    """Return call(service, *args) for payment_orchestration, backed by pooled SDK clients."""
+    client_factory = SigningApiClient if config.precomputed_signer else ApiClient
+
+    def call(service, *args):
+        api_class, method_name, path = _ORCHESTRATION_SERVICES[service]
+        http_method = "DELETE" if service.startswith("delete_") else "POST"
+        args = [json.dumps(a) if isinstance(a, dict) else a for a in args]
+        with get_sdk_pool(api_class, config_dict, client_factory).lease() as api_instance:
+            try:
+                with _logged_sdk_call(api_instance.logger, http_method, path, service) as outcome:
+                    _, outcome["status"], raw = getattr(api_instance, method_name)(
+                        *args, _return_http_data_only=True, _preload_content=False
+                    )
+            except ApiException as e:
+                try:
+                    body = json.loads(e.body) if e.body else {}
+                except ValueError:
+                    body = {}
+                raise ServiceError(e.status, body) from None
+        return json.loads(raw) if raw else {}
+
+    return call
+
+
+def _capture_context_order(capture_context_jwt: str, config):
+    """
+    Return (orderInformation, completeMandate) for a checkout.
+
+    The posted capture context is unverified, so only its jti is used: the
+    order and mandate come from the record made when this app issued it
+    (capture_context_store.py). Unknown or expired contexts raise ValueError.
+    """
+    try:
+        jti = _decode_jwt_payload(capture_context_jwt).get("jti")
+    except Exception:
+        jti = None
+    issued = get_capture_context_store(config.capture_context_store_db).lookup(jti) if jti else None
+    if issued is None:
+        raise ValueError("Unknown or expired capture context")
+    return issued
+
+
+def _orchestrate_payment(transient_token: str, capture_context_jwt: str) -> dict:
+    """Run the completeMandate steps for a transient token on the server."""
+    config = _request_config()
+    order, complete_mandate = _capture_context_order(capture_context_jwt, config)
+    if not complete_mandate:
+        raise ValueError("The capture context has no completeMandate")
+    jti = _decode_jwt_payload(transient_token).get("jti")
+    call = _orchestration_call(config, config.get_configuration())
+    # The steps' SDK calls run on pool threads; time them here as one wall-clock phase
+    with server_timing.phase("sdk"):
+        return orchestrate(
+            transient_token,
+            jti,
+            order,
+            complete_mandate,
+            call,
+            fraud_screening=config.orchestration_fraud_screening,
+            speculative_tokens=config.orchestration_speculative_tokens,
+            max_workers=config.orchestration_workers,
+        )
+
+
+# -------------------------------------------------------------------
+# Template routing (weighted presets per session)
+# -------------------------------------------------------------------
+
+
+def _get_template_router():
+    """Return the configured router, or None when template_routing is off or invalid."""
+    config = _request_config()
+    try:
+        return get_template_router(config.template_routing, config.template_routing_salt)
+    except ValueError as e:
+        print(f"[routing] Ignoring template_routing: {e}")
+        return None
+
+
+def _routed_variant(template=None):
+    """
+    The preset this request's session is routed to, or None when routing is
+    off or the session has no ID. With template given, None unless the
+    request used that preset (the shopper did not pick another one by hand).
+    """
+    router = _get_template_router()
+    session_id = request.cookies.get(SESSION_COOKIE)
+    if router is None or not session_id:
+        return None
+    variant = router.assign(session_id)
+    if template is not None and template != variant:
+        return None
+    return variant
+
+
+# -------------------------------------------------------------------
+# Server-Timing
+# -------------------------------------------------------------------
+
+
+@app.before_request
+def _start_server_timing():
+    # Read from the startup config: checking per request would itself be a config load
+    if _app_config.server_timing:
+        g.server_timing_token = server_timing.start()
+
+
+@app.after_request
+def _add_server_timing(response):
+    timing = server_timing.current()
+    if timing is not None:
+        total_ms = timing.elapsed_ms()
+        response.headers["Server-Timing"] = timing.header(total_ms)
+        route = request.url_rule.rule if request.url_rule else "(unmatched)"
+        get_server_timing_stats().record(f"{request.method} {route}", dict(timing.phases), total_ms)
+    return response
+
+
+@app.teardown_request
+def _finish_server_timing(exc):
+    token = g.pop("server_timing_token", None)
+    if token is not None:
+        server_timing.finish(token)
+
+
+@before_render_template.connect_via(app)
+def _begin_render_timing(sender, template, context, **extra):
+    server_timing.begin("render")
+
+
+@template_rendered.connect_via(app)
+def _end_render_timing(sender, template, context, **extra):
+    server_timing.end("render")
+
+
+# -------------------------------------------------------------------
+# Request size limits
+# -------------------------------------------------------------------
+
+
+@app.before_request
+def _enforce_field_length():
+    """
+    413 for any form field or top-level JSON string over max_field_length,
+    before a widget response reaches _classify_widget_response. Werkzeug
+    applies MAX_FORM_MEMORY_SIZE to multipart fields only.
+    """
+    if request.method != "POST":
+        return
+    limit = _app_config.max_field_length
+    if request.mimetype in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        values = request.form.values()
+    elif request.is_json:
+        payload = request.get_json(silent=True)
+        values = payload.values() if isinstance(payload, dict) else ()
+    else:
+        return
+    if any(isinstance(value, str) and len(value) > limit for value in values):
+        abort(413)
+
+
 # -------------------------------------------------------------------
 # Routes – Capture Context Flow
 # -------------------------------------------------------------------
@@ -109,48 +907,93 @@ def uc_overview():
     """Display capture context request editor with config selection."""
     configs = _get_available_capture_context_configs()
     selected = request.args.get("config")
-    # Validate selected or use first available
     filenames = [c[0] for c in configs]
+
+    # Without an explicit choice, a weighted router (template_routing) picks
+    # the preset; the session cookie keeps that choice sticky. The cookie is
+    # issued either way, since it also scopes double-submit protection
+    router = _get_template_router()
+    session_id = request.cookies.get(SESSION_COOKIE) or secrets.token_urlsafe(16)
+    if router is not None and not selected:
+        selected = router.assign(session_id)
+        if selected in filenames:
+            get_variant_stats().record_routed(selected)
+        else:
+            print(f"[routing] Unknown preset in template_routing: {selected}")
+
+    # Validate selected or use first available
     if not selected or selected not in filenames:
         selected = filenames[0] if filenames else "default-uc-capture-context-request.json"
     json_request = _load_capture_context_config(selected)
-    return render_template(
-        "uc_overview.html",
-        json_request=json_request,
-        configs=configs,
-        selected_config=selected,
+    response = Response(
+        render_template(
+            "uc_overview.html",
+            json_request=json_request,
+            configs=configs,
+            selected_config=selected,
+            expired=request.args.get("expired") == "1",
+        ),
+        mimetype="text/html",
     )
+    if session_id != request.cookies.get(SESSION_COOKIE):
+        response.set_cookie(
+            SESSION_COOKIE, session_id, max_age=365 * 24 * 3600,
+            secure=True, httponly=True, samesite="Lax",
+        )
+    return response
 
 
 @app.route("/capture-context", methods=["POST"])
+@_idempotent
+@_admission_controlled
 def capture_context():
     """Generate a Unified Checkout Capture Context via the CyberSource API."""
     try:
         # The CyberSource SDK expects the request body as a JSON string
-        request_json_str = request.form["captureContextRequest"]
-        # Validate it's valid JSON
-        json.loads(request_json_str)
-
-        config_dict = _get_cybersource_config()
-        api_client = ApiClient()
-        api_instance = UnifiedCheckoutCaptureContextApi(config_dict, api_client)
-
-        data, status, body = (
-            api_instance.generate_unified_checkout_capture_context_with_http_info(
-                request_json_str
+        if "captureContextRequest" in request.form:
+            request_json_str = request.form["captureContextRequest"]
+            # Validate it's valid JSON
+            json.loads(request_json_str)
+        else:
+            # Per-order request built from a preset, e.g. config=<file>&totalAmount=12.00
+            request_json_str = _build_capture_context_request(
+                request.form["config"], request.form
             )
+
+        started = time.perf_counter()
+        data, status = _generate_capture_context(
+            request_json_str, template=request.form.get("config")
         )
 
         if data:
+            variant = _routed_variant(request.form.get("config"))
+            if variant:
+                get_variant_stats().record_latency(
+                    variant, "captureContextMs", (time.perf_counter() - started) * 1000
+                )
             decoded_data = _decode_jwt_payload(data)
+            with server_timing.phase("json"):
+                decoded_json = json.dumps(decoded_data, indent=2)
             return render_template(
                 "capture_context.html",
                 capture_context=data,
-                decoded_data=json.dumps(decoded_data, indent=2),
+                decoded_data=decoded_json,
+                capture_context_request=request_json_str,
+                config=request.form.get("config", ""),
             )
         else:
             return f"Error: No data returned. Status: {status}", 500
 
+    except (FileNotFoundError, ValueError) as e:
+        return (
+            render_template(
+                "error.html",
+                message="Invalid Capture Context Request",
+                status=400,
+                stack=str(e),
+            ),
+            400,
+        )
     except Exception as e:
         print(f"\nException on calling the API: {e}")
         traceback.print_exc()
@@ -165,6 +1008,48 @@ def capture_context():
         )
 
 
+@app.route("/capture-context/batch", methods=["POST"])
+def capture_context_batch():
+    """
+    Generate capture contexts for a JSON list of order specs.
+
+    Body: [{"id": ..., "config": "<preset>.json", "totalAmount": ..., ...}, ...]
+    or {"orders": [...], "concurrency": N}. Streams one NDJSON line per order
+    as each call completes; per-order failures are reported inline,
+    including orders turned away by admission control.
+    """
+    payload = request.get_json(silent=True)
+    config = _request_config()
+    concurrency = config.batch_concurrency
+    try:
+        orders = parse_orders(payload)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if isinstance(payload, dict) and payload.get("concurrency"):
+        try:
+            concurrency = min(int(payload["concurrency"]), concurrency)
+        except (TypeError, ValueError, OverflowError):
+            return {"error": "'concurrency' must be an integer"}, 400
+    config_dict = config.get_configuration()
+    controller = _get_admission_controller()
+    client_key = request.remote_addr or "unknown"
+
+    def generate(order):
+        if controller is None:
+            return _generate_capture_context_for_order(order, config_dict)
+        # Every order is an upstream call, so each is admitted and charged to
+        # the client like a single /capture-context request
+        return controller.call(
+            client_key, lambda: _generate_capture_context_for_order(order, config_dict)
+        )
+
+    results = run_batch(orders, generate, concurrency)
+    return Response(
+        (to_ndjson(result) for result in results),
+        mimetype="application/x-ndjson",
+    )
+
+
 # -------------------------------------------------------------------
 # Routes – Checkout
 # -------------------------------------------------------------------
@@ -172,34 +1057,130 @@ def capture_context():
 
 @app.route("/checkout", methods=["POST"])
 def checkout():
-    """Render the checkout page with the Unified Checkout widget."""
+    """
+    Render the checkout page with the Unified Checkout widget.
+
+    The capture context's exp claim is checked first so the browser never
+    loads the client library for a context Accept() will reject: within
+    capture_context_grace_seconds of expiry it is regenerated from the same
+    request (posted back by capture_context.html), and once expired the
+    shopper is sent back to the overview page. Early hints for the library
+    go out only after that check.
+    """
     try:
         decoded_data = json.loads(request.form["captureContextDecoded"])
         capture_context_jwt = request.form["captureContext"]
+        config_name = request.form.get("config") or None
+        config = _request_config()
+
+        try:
+            decoded_data = _decode_jwt_payload(capture_context_jwt)
+            remaining = _seconds_until_expiry(decoded_data)
+        except Exception:
+            remaining = None
+        grace = config.capture_context_grace_seconds
+        if config.sdk_recording_mode == "replay":
+            # Replayed contexts keep the exp they were recorded with
+            remaining = None
+        if remaining is not None and remaining <= grace:
+            refreshed = None
+            request_json_str = request.form.get("captureContextRequest")
+            if request_json_str:
+                try:
+                    refreshed, status = _generate_capture_context(
+                        request_json_str, template=config_name
+                    )
+                except Exception as e:
+                    print(f"[checkout] Capture context refresh failed: {e}")
+            if refreshed:
+                print(f"[checkout] Capture context refreshed ({remaining:.0f}s left)")
+                capture_context_jwt = refreshed
+                decoded_data = _decode_jwt_payload(refreshed)
+            elif remaining <= 0:
+                print(f"[checkout] Capture context expired {-remaining:.0f}s ago")
+                return redirect(url_for("uc_overview", config=config_name, expired="1"), 303)
+
+        # The context is usable: let the browser start on the client library
+        # while the page renders
+        if config.early_hints:
+            try:
+                send_early_hints(
+                    request.environ, _client_library_links(*_page_client_library(decoded_data, config))
+                )
+            except (KeyError, IndexError, TypeError):
+                pass
 
         # Extract the client library URL and integrity hash from the decoded JWT
-        client_library_url = decoded_data["ctx"][0]["data"]["clientLibrary"]
-        client_library_integrity = decoded_data["ctx"][0]["data"][
-            "clientLibraryIntegrity"
-        ]
+        # (or the mirrored copy's URL)
+        client_library_url, client_library_integrity = _page_client_library(
+            decoded_data, config
+        )
 
-        return render_template(
-            "checkout.html",
-            url=json.dumps(client_library_url),
-            client_library_integrity=json.dumps(client_library_integrity),
-            capture_context=capture_context_jwt,
+        response = Response(
+            render_template(
+                "checkout.html",
+                url=json.dumps(client_library_url),
+                client_library_integrity=json.dumps(client_library_integrity),
+                client_library_url=client_library_url,
+                client_library_sri=client_library_integrity,
+                client_library_origin=_url_origin(client_library_url),
+                capture_context=capture_context_jwt,
+                rum_template=config_name or "adhoc",
+                rum_client_version=_extract_client_version(
+                    decoded_data, _extract_client_library(decoded_data)[0]
+                ),
+                server_orchestration=config.payment_orchestration == "server",
+                stream_result=config.payment_result_transport == "sse",
+                config_name=config_name or "",
+            ),
+            mimetype="text/html",
+        )
+        response.headers["Link"] = ", ".join(
+            _client_library_links(client_library_url, client_library_integrity)
         )
+        return response
 
     except Exception as e:
         return f"Error: {e}", 500
 
 
+@app.route("/uc-library/<name>")
+def client_library(name):
+    """
+    A mirrored client library (client_library_mirror = true). The name is
+    the content digest, so the response never changes; gzip/brotli copies
+    are stored precompressed and picked by Accept-Encoding.
+    """
+    config = _request_config()
+    if not config.client_library_mirror or not MIRROR_NAME_RE.match(name):
+        abort(404)
+    mirror = _get_client_library_mirror(config)
+    accepted = {encoding for encoding, quality in request.accept_encodings if quality > 0}
+    path, encoding = mirror.open_variant(name, accepted)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(
+        path,
+        mimetype="application/javascript",
+        etag=f"{name}.{encoding}" if encoding else name,
+        conditional=True,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    # send_file names the stored file (e.g. ".js.gz"); the URL already says what it is
+    response.headers.pop("Content-Disposition", None)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 # -------------------------------------------------------------------
 # Routes – Payment Result (widget-managed via completeMandate)
 # -------------------------------------------------------------------
 
 
 @app.route("/process-payment", methods=["POST"])
+@_idempotent
 def process_payment():
     """
     Display the payment result from the Unified Checkout widget.
@@ -212,53 +1193,63 @@ def process_payment():
 
     The widget's up.complete() returns the orchestrated result as a JWT.
     This route decodes and displays that result.
+
+    With payment_orchestration = server the page posts the transient token
+    (plus its capture context) instead, and the same steps run here through
+    payment_orchestration.py; the result carries a per-step timing breakdown.
     """
     try:
         widget_response = request.form.get("response", "")
+        transient_token = request.form.get("transientToken", "")
+        server_mode = _request_config().payment_orchestration == "server"
 
-        if not widget_response:
+        if transient_token and server_mode:
+            decoded = _orchestrate_payment(
+                transient_token,
+                request.form.get("captureContext", ""),
+            )
+            steps = decoded["orchestration"]["steps"]
+            print(
+                f"\n[process-payment] Orchestrated in {decoded['orchestration']['totalMs']} ms: "
+                + ", ".join(f"{name} {step['status']} {step['elapsedMs']} ms" for name, step in steps.items())
+            )
+            # Keys the job when there is no transaction ID (as the widget JWT does)
+            widget_response = transient_token
+        elif not widget_response:
             return render_template(
                 "complete_response.html",
                 response="{}",
                 decoded_data="{}",
                 payment_status="ERROR",
             )
-
-        # The widget response is a JWT — decode its payload for display
-        try:
-            decoded = _decode_jwt_payload(widget_response)
+        else:
+            # The widget response is a JWT — decode its payload for display
+            decoded = _decode_widget_response(
+                widget_response, _jwe_key_file()
+            )
+        with server_timing.phase("json"):
             response_json = json.dumps(decoded, indent=2)
-        except Exception:
-            # If it's not a JWT, treat it as raw JSON or string
-            try:
-                decoded = json.loads(widget_response)
-                response_json = json.dumps(decoded, indent=2)
-            except (json.JSONDecodeError, TypeError):
-                decoded = {"rawResponse": widget_response[:2000]}
-                response_json = json.dumps(decoded, indent=2)
 
         # Extract payment status from the decoded response
-        payment_status = "UNKNOWN"
+        payment_status, txn_id = _extract_payment_result(decoded)
         if isinstance(decoded, dict):
-            # The complete mandate response may contain different structures
-            # depending on the outcome (authorized, declined, error, etc.)
-            payment_status = (
-                decoded.get("status")
-                or decoded.get("paymentStatus")
-                or decoded.get("orderStatus")
-                or "COMPLETED"
-            )
-
             # Log key info
-            txn_id = decoded.get("id", decoded.get("transactionId", "N/A"))
             print(f"\n[process-payment] Status: {payment_status}")
-            print(f"[process-payment] Transaction ID: {txn_id}")
+            print(f"[process-payment] Transaction ID: {txn_id or 'N/A'}")
+
+        variant = _routed_variant(request.form.get("config") or "")
+        if variant:
+            get_variant_stats().record_outcome(variant, payment_status)
+
+        # Receipts and token bookkeeping run on the job queue workers
+        _enqueue_payment_result(widget_response, decoded, payment_status, txn_id)
 
         return render_template(
             "complete_response.html",
             response=response_json,
             decoded_data=response_json,
             payment_status=payment_status,
+            orchestration=decoded.get("orchestration") if isinstance(decoded, dict) else None,
         )
 
     except Exception as e:
@@ -272,6 +1263,387 @@ def process_payment():
         )
 
 
+# -------------------------------------------------------------------
+# Routes – JSON API (headless clients)
+#
+# Same flow as the HTML routes, but JSON in / compact JSON out with only
+# the fields a front end needs, and no template rendering.
+# -------------------------------------------------------------------
+
+
+@app.route("/api/capture-context", methods=["POST"])
+@_idempotent
+@_admission_controlled
+def api_capture_context():
+    """
+    Generate a capture context.
+
+    Body: {"captureContextRequest": {...} | "<json>"} for a full request, or
+    {"config": "<preset>.json", "totalAmount": ..., ...} for a per-order preset.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {"error": "Expected a JSON object"}, 400
+    try:
+        if "captureContextRequest" in payload:
+            request_body = payload["captureContextRequest"]
+            request_json_str = (
+                request_body
+                if isinstance(request_body, str)
+                else json.dumps(request_body, separators=(",", ":"))
+            )
+        elif "config" in payload:
+            request_json_str = _build_capture_context_request(payload["config"], payload)
+        else:
+            return {"error": "Expected 'captureContextRequest' or 'config'"}, 400
+
+        data, status = _generate_capture_context(
+            request_json_str, template=payload.get("config")
+        )
+        if not data:
+            return {"error": f"No data returned. Status: {status}"}, 502
+
+        decoded_data = _decode_jwt_payload(data)
+        client_library_url, client_library_integrity = _extract_client_library(
+            decoded_data
+        )
+        return {
+            "captureContext": data,
+            "clientLibrary": client_library_url,
+            "clientLibraryIntegrity": client_library_integrity,
+            "exp": decoded_data.get("exp"),
+        }
+
+    except (FileNotFoundError, ValueError) as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        print(f"\nException on calling the API: {e}")
+        traceback.print_exc()
+        return {"error": str(e)}, 500
+
+
+@app.route("/api/checkout-params", methods=["POST"])
+def api_checkout_params():
+    """Return the client library URL and integrity hash for a capture context JWT."""
+    payload = request.get_json(silent=True) or {}
+    capture_context_jwt = payload.get("captureContext") if isinstance(payload, dict) else None
+    if not capture_context_jwt:
+        return {"error": "Expected 'captureContext'"}, 400
+    try:
+        decoded_data = _decode_jwt_payload(capture_context_jwt)
+        client_library_url, client_library_integrity = _extract_client_library(
+            decoded_data
+        )
+    except Exception as e:
+        return {"error": f"Invalid capture context: {e}"}, 400
+    return {
+        "captureContext": capture_context_jwt,
+        "clientLibrary": client_library_url,
+        "clientLibraryIntegrity": client_library_integrity,
+        "exp": decoded_data.get("exp"),
+    }
+
+
+@app.route("/api/payment-result", methods=["POST"])
+@_idempotent
+def api_payment_result():
+    """Decode the up.complete() result and return its status, transaction ID and body."""
+    payload = request.get_json(silent=True) or {}
+    widget_response = payload.get("response") if isinstance(payload, dict) else None
+    if not widget_response or not isinstance(widget_response, str):
+        return {"payment_status": "ERROR", "error": "Expected 'response' (a string)"}, 400
+
+    decoded = _decode_widget_response(widget_response, _jwe_key_file())
+    payment_status, txn_id = _extract_payment_result(decoded)
+    job_id = _enqueue_payment_result(widget_response, decoded, payment_status, txn_id)
+    return {
+        "payment_status": payment_status,
+        "transactionId": txn_id,
+        "jobId": job_id,
+        "result": decoded,
+    }
+
+
+@app.route("/api/payment-result/events", methods=["POST"])
+def api_payment_result_events():
+    """
+    /api/payment-result as a server-sent event stream, for fetch() clients.
+
+    Events: "received" as soon as the body has been read; "persisted" once
+    the decoded result is on the job queue (with the /api/payment-result
+    fields); then "processed" when the post-payment job is done or failed,
+    or "timeout" after payment_events_timeout_seconds. This route is not
+    behind _idempotent, which would buffer the whole stream; a repeated
+    post is deduplicated by the job's result hash instead.
+    """
+    payload = request.get_json(silent=True) or {}
+    widget_response = payload.get("response") if isinstance(payload, dict) else None
+    if not widget_response or not isinstance(widget_response, str):
+        return {"payment_status": "ERROR", "error": "Expected 'response' (a string)"}, 400
+    variant = _routed_variant(payload.get("config") or "")
+    timeout = _request_config().payment_events_timeout_seconds
+
+    def events():
+        yield _sse("received", {"receivedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())})
+        try:
+            decoded = _decode_widget_response(widget_response, _jwe_key_file())
+            payment_status, txn_id = _extract_payment_result(decoded)
+        except Exception as e:
+            yield _sse("error", {"payment_status": "ERROR", "error": str(e)})
+            return
+        if variant:
+            get_variant_stats().record_outcome(variant, payment_status)
+        job_id = _enqueue_payment_result(widget_response, decoded, payment_status, txn_id)
+        yield _sse("persisted", {
+            "payment_status": payment_status,
+            "transactionId": txn_id,
+            "jobId": job_id,
+            "result": decoded,
+        })
+        if job_id is None:
+            yield _sse("error", {"error": "Could not queue post-payment processing"})
+            return
+        yield from _job_events(_get_job_queue(), job_id, timeout)
+
+    return _sse_response(events())
+
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    """Post-payment queue depth, oldest ready job age and job latency percentiles."""
+    return _get_job_queue().stats()
+
+
+@app.route("/api/jobs/<int:job_id>/events", methods=["GET"])
+def api_job_events(job_id):
+    """Server-sent "processed" / "timeout" event for one job (EventSource-friendly)."""
+    queue = _get_job_queue()
+    if queue.job(job_id) is None:
+        return {"error": "Unknown job"}, 404
+    return _sse_response(_job_events(queue, job_id, _request_config().payment_events_timeout_seconds))
+
+
+@app.route("/api/rum", methods=["POST"])
+def api_rum_ingest():
+    """
+    Ingest a widget lifecycle beacon from checkout.html (navigator.sendBeacon).
+
+    Body: {"template": ..., "clientVersion": ..., "marks": {"accept": ms, ...}}
+    """
+    payload = request.get_json(force=True, silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("marks"), dict):
+        return {"error": "Expected 'marks'"}, 400
+    accepted = get_rum_aggregator().record(
+        payload.get("template"), payload.get("clientVersion"), payload["marks"]
+    )
+    variant = _routed_variant(str(payload.get("template") or ""))
+    if variant and accepted:
+        for step, metric in (("interactive", "interactiveMs"), ("total", "totalMs")):
+            value = payload["marks"].get(step)
+            # Same bounds as RumAggregator.record (also drops NaN and Infinity)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= MAX_DURATION_MS:
+                get_variant_stats().record_latency(variant, metric, value)
+    return "", 204
+
+
+@app.route("/api/rum", methods=["GET"])
+def api_rum_summary():
+    """Widget step percentiles (ms) per capture context template and client version."""
+    return {"series": get_rum_aggregator().snapshot()}
+
+
+@app.route("/api/server-timing", methods=["GET"])
+def api_server_timing():
+    """Server-Timing phase percentiles (ms) per route, over this process's timed requests."""
+    stats = get_server_timing_stats()
+    return {"enabled": _app_config.server_timing, "routes": stats.snapshot(), "droppedRoutes": stats.dropped}
+
+
+@app.route("/api/environments", methods=["GET"])
+def api_environments():
+    """EWMA latency, error rate and health per run environment (run_environments)."""
+    config = _request_config()
+    selector = _get_endpoint_selector(config)
+    if selector is None:
+        return {"selection": False, "environments": [{"host": config.run_environment}]}
+    return {"selection": True, "environments": selector.snapshot()}
+
+
+@app.route("/api/variants", methods=["GET"])
+def api_variants():
+    """Per-preset latency and payment outcomes for sessions routed by template_routing."""
+    router = _get_template_router()
+    return {
+        "routing": router is not None,
+        "variants": get_variant_stats().snapshot(router.shares() if router else None),
+    }
+
+
+# -------------------------------------------------------------------
+# Admin (diagnostics)
+# -------------------------------------------------------------------
+
+
+def _admin_required(view):
+    """Require "Authorization: Bearer <admin_token>"; admin routes 404 when no token is configured."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _request_config().admin_token
+        if not token:
+            return {"error": "Not Found"}, 404
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return {"error": "Unauthorized"}, 401, {"WWW-Authenticate": "Bearer"}
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+@app.route("/admin/profile", methods=["POST"])
+@_admin_required
+def admin_profile():
+    """
+    Run the sampling profiler and return collapsed stacks or an SVG flamegraph.
+
+    Query: seconds (default 10, max 120), interval_ms (default 5),
+    format=collapsed|svg, include_idle=1, and optionally route=<path>
+    (+ method, fraction) to sample only requests to that route.
+    """
+    try:
+        seconds = min(float(request.args.get("seconds", 10)), 120.0)
+        interval = max(float(request.args.get("interval_ms", 5)), 1.0) / 1000
+        fraction = min(max(float(request.args.get("fraction", 1)), 0.0), 1.0)
+    except ValueError:
+        return {"error": "seconds, interval_ms and fraction must be numbers"}, 400
+    output = request.args.get("format", "collapsed")
+    if output not in ("collapsed", "svg"):
+        return {"error": "format must be 'collapsed' or 'svg'"}, 400
+    route = request.args.get("route")
+
+    profiler = SamplingProfiler(interval, include_idle=request.args.get("include_idle") == "1")
+    try:
+        with profiling_session():
+            if not route:
+                samples = profiler.sample(seconds)
+            else:
+                # Swap in a wrapper for the route's view for the session only,
+                # so unprofiled requests pay nothing once it ends
+                try:
+                    endpoint, _ = app.url_map.bind("localhost").match(
+                        route, method=request.args.get("method", "POST")
+                    )
+                except Exception:
+                    return {"error": f"No route matches {route}"}, 400
+                original = app.view_functions[endpoint]
+                profiled_threads = set()
+
+                @functools.wraps(original)
+                def sampled_view(*args, **kwargs):
+                    if random.random() >= fraction:
+                        return original(*args, **kwargs)
+                    ident = threading.get_ident()
+                    profiled_threads.add(ident)
+                    try:
+                        return original(*args, **kwargs)
+                    finally:
+                        profiled_threads.discard(ident)
+
+                app.view_functions[endpoint] = sampled_view
+                try:
+                    samples = profiler.sample(seconds, profiled_threads.__contains__)
+                finally:
+                    app.view_functions[endpoint] = original
+    except ProfilerBusy as e:
+        return {"error": str(e)}, 409
+
+    title = f"{route or 'all threads'}: {seconds:g}s @ {interval * 1000:g}ms"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if output == "svg":
+        return Response(
+            flamegraph_svg(samples, title),
+            mimetype="image/svg+xml",
+            headers={"Content-Disposition": f'attachment; filename="profile-{stamp}.svg"'},
+        )
+    return Response(
+        collapsed_stacks(samples),
+        mimetype="text/plain",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{stamp}.collapsed"',
+            "X-Profile-Samples": str(profiler.sample_count),
+        },
+    )
+
+
+@app.teardown_request
+def _count_request_for_memory(exc):
+    # No-op unless an /admin/memory session is running; admin calls don't count
+    if not request.path.startswith("/admin/"):
+        record_memory_request()
+
+
+@app.route("/admin/memory/start", methods=["POST"])
+@_admin_required
+def admin_memory_start():
+    """
+    Start tracemalloc and take the baseline (restarting resets it).
+
+    Query: frames (traceback depth, default 10), soak=1 to check growth every
+    window requests (default memory_soak_window) against threshold_kb
+    (default memory_leak_threshold_kb) per 1,000 requests.
+    """
+    config = _request_config()
+    try:
+        frames = min(max(int(request.args.get("frames", 10)), 1), 50)
+        window = max(int(request.args.get("window", config.memory_soak_window)), 10)
+        threshold_kb = float(request.args.get("threshold_kb", config.memory_leak_threshold_kb))
+    except ValueError:
+        return {"error": "frames, window and threshold_kb must be numbers"}, 400
+    tracker = start_memory_session(
+        frames=frames,
+        soak=request.args.get("soak") == "1",
+        window=window,
+        threshold_kb=threshold_kb,
+    )
+    return {
+        "started": True,
+        "frames": frames,
+        "soak": tracker.soak,
+        "baseline_rss_mb": round(tracker.baseline_rss / 2**20, 1),
+        "baseline_traced_mb": round(tracker.baseline_traced / 2**20, 2),
+    }
+
+
+@app.route("/admin/memory", methods=["GET"])
+@_admin_required
+def admin_memory_report():
+    """
+    Diff against the baseline: top allocation growth (group_by=lineno|filename|traceback),
+    object count growth per type, RSS and, in soak mode, per-window growth and leak status.
+    """
+    tracker = get_memory_tracker()
+    if tracker is None:
+        return {"error": "No memory session running; POST /admin/memory/start first"}, 409
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return {"error": "group_by must be 'lineno', 'filename' or 'traceback'"}, 400
+    try:
+        limit = min(max(int(request.args.get("limit", 25)), 1), 200)
+    except ValueError:
+        return {"error": "limit must be a number"}, 400
+    return tracker.report(group_by, limit)
+
+
+@app.route("/admin/memory/stop", methods=["POST"])
+@_admin_required
+def admin_memory_stop():
+    """Stop tracemalloc and return the final report."""
+    report = stop_memory_session()
+    if report is None:
+        return {"error": "No memory session running"}, 409
+    return report
+
+
 # -------------------------------------------------------------------
 # Error handlers
 # -------------------------------------------------------------------
@@ -285,6 +1657,18 @@ def not_found(e):
     )
 
 
+@app.errorhandler(413)
+def request_too_large(e):
+    if request.path.startswith("/api/"):
+        return {"error": "Request Entity Too Large"}, 413
+    return (
+        render_template(
+            "error.html", message="Request Entity Too Large", status=413, stack=""
+        ),
+        413,
+    )
+
+
 @app.errorhandler(500)
 def internal_error(e):
     return (
@@ -305,7 +1689,7 @@ def internal_error(e):
 
 if __name__ == "__main__":
     # Read port from config
-    config = MerchantConfiguration()
+    config = _request_config()
     port = config.port
 
     cert_dir = os.path.join(os.path.dirname(__file__), "certs")
@@ -316,4 +1700,10 @@ if __name__ == "__main__":
     )
 
     print(f" * Running on https://localhost:{port}")
-    app.run(host="0.0.0.0", port=port, ssl_context=ssl_context, debug=True)
+    app.run(
+        host="0.0.0.0",
+        port=port,
+        ssl_context=ssl_context,
+        debug=True,
+        request_handler=EarlyHintsRequestHandler,
+    )
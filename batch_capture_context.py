@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Batch capture context generation.
+
+Takes a list of order specs, each naming a preset from data/ plus optional
+per-order fields, and generates one capture context per order with at most
+`concurrency` CyberSource calls in flight. Results are yielded (and written as
+NDJSON) in completion order; a failing order produces an error line and does
+not stop the rest of the batch.
+
+Order spec:
+  {"id": "order-1", "config": "default-uc-capture-context-request.json",
+   "totalAmount": "12.00", "currency": "USD",
+   "billTo": {...}, "shipTo": {...}, "targetOrigins": [...]}
+
+Usage:
+  python batch_capture_context.py orders.json                 # NDJSON to stdout
+  python batch_capture_context.py orders.json -c 8 -o out.ndjson
+  cat orders.json | python batch_capture_context.py -
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def run_batch(orders, generate, concurrency: int):
+    """
+    Yield one result dict per order as each call completes.
+
+    generate(order) must return the capture context JWT or raise.
+    """
+    concurrency = max(1, int(concurrency))
+
+    def call(index, order):
+        started = time.perf_counter()
+        result = {"index": index, "id": order.get("id"), "config": order.get("config")}
+        try:
+            result["captureContext"] = generate(order)
+            result["status"] = "ok"
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        result["elapsedMs"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(call, index, order) for index, order in enumerate(orders)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def to_ndjson(result: dict) -> str:
+    """Serialize one result dict as a compact NDJSON line."""
+    return json.dumps(result, separators=(",", ":")) + "\n"
+
+
+def parse_orders(payload):
+    """Accept either a bare list of order specs or {"orders": [...]}."""
+    orders = payload.get("orders") if isinstance(payload, dict) else payload
+    if not isinstance(orders, list) or not all(isinstance(o, dict) for o in orders):
+        raise ValueError("Expected a list of order objects or {\"orders\": [...]}")
+    return orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate capture contexts for many orders")
+    parser.add_argument("orders", help="JSON file with order specs ('-' for stdin)")
+    parser.add_argument("-c", "--concurrency", type=int, help="Max concurrent API calls")
+    parser.add_argument("-o", "--output", help="NDJSON output file (default: stdout)")
+    args = parser.parse_args()
+
+    # Imported here so the app can import run_batch without a cycle
+    from app import _generate_capture_context_for_order, _get_cybersource_config
+    from data.configuration import MerchantConfiguration
+
+    if args.orders == "-":
+        payload = json.load(sys.stdin)
+    else:
+        with open(args.orders, "r") as f:
+            payload = json.load(f)
+    orders = parse_orders(payload)
+
+    limit = MerchantConfiguration().batch_concurrency
+    concurrency = min(args.concurrency or limit, limit)
+    config_dict = _get_cybersource_config()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    failed = 0
+    try:
+        results = run_batch(
+            orders,
+            lambda order: _generate_capture_context_for_order(order, config_dict),
+            concurrency,
+        )
+        for result in results:
+            failed += result["status"] == "error"
+            out.write(to_ndjson(result))
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{len(orders) - failed}/{len(orders)} capture contexts generated", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: SDK http_signature header generation vs the precomputed
+HttpSigner in http_signature.py.
+
+Each row produces the full set of auth headers for one POST to
+/up/v1/capture-contexts with a capture context request body. The SDK rows
+call ApiClient.call_authentication_header itself, once with a prebuilt
+merchant config and once with the config rebuilt per call (what the app did
+per request before). No network access is needed; a random secret is used
+and SDK logging is disabled.
+
+Usage:
+  python bench_http_signature.py
+  python bench_http_signature.py --iterations 20000 --body-size 65536
+"""
+
+import argparse
+import base64
+import os
+import time
+
+from authenticationsdk.core.MerchantConfiguration import MerchantConfiguration as SdkMerchantConfiguration
+from CyberSource import ApiClient
+
+from data.configuration import MerchantConfiguration
+from http_signature import SigningApiClient, get_http_signer
+
+REQUEST_TARGET = "/up/v1/capture-contexts"
+BENCH_SECRET = base64.b64encode(os.urandom(32)).decode()
+
+
+def _timed(fn, iterations: int) -> float:
+    """Mean microseconds per call."""
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _config_dict() -> dict:
+    config = MerchantConfiguration()
+    config.merchant_id = "benchmerchant"
+    config.merchant_key_id = "00000000-0000-0000-0000-000000000000"
+    config.merchant_secret_key = BENCH_SECRET
+    config.enable_log = False
+    return config.get_configuration()
+
+
+def _sdk_mconfig():
+    mconfig = SdkMerchantConfiguration()
+    mconfig.set_merchantconfig(_config_dict())
+    return mconfig
+
+
+def _client(cls, mconfig):
+    # Skip ApiClient.__init__ (connection pool, SDK setup): only the auth
+    # header code path is measured
+    client = cls.__new__(cls)
+    client.mconfig = mconfig
+    client.client_id = "bench"
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTTP signature generation")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--body-size", type=int, default=0,
+                        help="Pad the request body to this many bytes (default: preset request as-is)")
+    args = parser.parse_args()
+
+    from app import _build_capture_context_request
+
+    body = _build_capture_context_request("default-uc-capture-context-request.json", {})
+    if args.body_size > len(body):
+        body = body[:-1] + f', "padding": "{"x" * (args.body_size - len(body) - 15)}"}}'
+
+    mconfig = _sdk_mconfig()
+    sdk_client = _client(ApiClient, mconfig)
+    fast_client = _client(SigningApiClient, mconfig)
+    signer = get_http_signer(mconfig.merchant_id, mconfig.merchant_keyid, mconfig.merchant_secretkey,
+                             mconfig.request_host)
+
+    def sdk_per_call_config():
+        _client(ApiClient, _sdk_mconfig()).call_authentication_header("POST", {}, body, REQUEST_TARGET)
+
+    rows = [
+        ("SDK, config rebuilt per call", _timed(sdk_per_call_config, max(1, args.iterations // 10))),
+        ("SDK, prebuilt config",
+         _timed(lambda: sdk_client.call_authentication_header("POST", {}, body, REQUEST_TARGET),
+                args.iterations)),
+        ("SigningApiClient",
+         _timed(lambda: fast_client.call_authentication_header("POST", {}, body, REQUEST_TARGET),
+                args.iterations)),
+        ("HttpSigner.sign only", _timed(lambda: signer.sign("POST", REQUEST_TARGET, body), args.iterations)),
+    ]
+
+    baseline = rows[1][1]
+    print(f"\n  Body: {len(body)} bytes")
+    print(f"  {'Path':<32} {'us/request':>11} {'vs SDK':>8}")
+    print("  " + "-" * 53)
+    for name, micros in rows:
+        print(f"  {name:<32} {micros:>11.1f} {baseline / micros:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request cost of JWE decryption and MLE request encryption.
+
+Compares the cached key path in message_encryption.py with parsing the PEM on
+every call (what a naive per-request implementation does), and measures the
+end-to-end overhead on /process-payment of a JWE-wrapped widget result versus
+a plain JWT. No network access or CyberSource credentials are needed; a
+throwaway RSA key is generated unless --key points at a PEM private key.
+
+Usage:
+  python bench_mle.py
+  python bench_mle.py --iterations 2000 --key Resource/NetworkTokenCert.pem
+"""
+
+import argparse
+import base64
+import itertools
+import json
+import os
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import message_encryption
+from message_encryption import decrypt_jwe, encrypt_jwe, encrypt_request_body
+
+
+def _timed(fn, iterations: int) -> float:
+    """Mean microseconds per call."""
+    fn()  # warm up (and populate caches)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _sample_widget_jwt() -> str:
+    def b64(doc):
+        return base64.urlsafe_b64encode(json.dumps(doc).encode()).decode().rstrip("=")
+
+    payload = {"status": "AUTHORIZED", "id": "7000000000000000000000", "details": {"x": "y" * 512}}
+    return f"{b64({'alg': 'RS256'})}.{b64(payload)}.{'s' * 342}"
+
+
+def _write_temp_key() -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    fd, path = tempfile.mkstemp(suffix=".pem")
+    with os.fdopen(fd, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWE / MLE overhead")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--key", help="PEM private key (default: generated 2048-bit RSA key)")
+    args = parser.parse_args()
+
+    key_file = args.key or _write_temp_key()
+    try:
+        from app import _app_config, _build_capture_context_request, app
+
+        request_body = _build_capture_context_request("default-uc-capture-context-request.json", {})
+        widget_jwt = _sample_widget_jwt()
+        widget_jwe = encrypt_jwe(widget_jwt, key_file)
+        encrypted_size = len(encrypt_request_body(request_body, key_file))
+
+        def uncached(fn):
+            def run():
+                message_encryption._keys.clear()
+                fn()
+            return run
+
+        rows = [
+            ("MLE encrypt request body (cached key)",
+             _timed(lambda: encrypt_request_body(request_body, key_file), args.iterations)),
+            ("MLE encrypt request body (PEM parsed per call)",
+             _timed(uncached(lambda: encrypt_request_body(request_body, key_file)), args.iterations)),
+            ("JWE decrypt widget result (cached key)",
+             _timed(lambda: decrypt_jwe(widget_jwe, key_file), args.iterations)),
+            ("JWE decrypt widget result (PEM parsed per call)",
+             _timed(uncached(lambda: decrypt_jwe(widget_jwe, key_file)), args.iterations)),
+        ]
+
+        client = app.test_client()
+        # A fresh Idempotency-Key per post so repeats aren't answered from cache
+        keys = itertools.count()
+
+        def post(response):
+            client.post(
+                "/api/payment-result",
+                json={"response": response},
+                headers={"Idempotency-Key": f"bench-{next(keys)}"},
+            )
+
+        previous_key_file = _app_config.jwe_pem_file_directory
+        _app_config.jwe_pem_file_directory = key_file
+        try:
+            plain = _timed(lambda: post(widget_jwt), args.iterations)
+            encrypted = _timed(lambda: post(widget_jwe), args.iterations)
+        finally:
+            _app_config.jwe_pem_file_directory = previous_key_file
+        rows += [
+            ("/api/payment-result with plain JWT", plain),
+            ("/api/payment-result with JWE-wrapped JWT", encrypted),
+        ]
+    finally:
+        if not args.key:
+            os.remove(key_file)
+
+    print(f"\n  {'Operation':<50} {'us/request':>11}")
+    print("  " + "-" * 62)
+    for name, micros in rows:
+        print(f"  {name:<50} {micros:>11.1f}")
+    print("  " + "-" * 62)
+    print(f"  JWE overhead per /api/payment-result: {encrypted - plain:.1f} us")
+    print(f"  Capture context request body: {len(request_body)} B plain, {encrypted_size} B encrypted")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+"""
+Server-side record of the capture contexts this app issued, keyed by jti.
+
+Server-side payment orchestration has to authorize the amount and run the
+steps that were sent to CyberSource when the capture context was created.
+It must not use what the browser posts back: the captureContext form field
+is a JWT the server does not verify, so its orderInformation and
+completeMandate could say anything. Every capture context the app generates
+is therefore recorded here, with the orderInformation and completeMandate
+of the request that created it. The record is kept until the context's exp.
+The posted JWT is only used to look its jti up.
+
+Rows live in SQLite (one connection per thread, WAL journal) so every worker
+process sees contexts issued by the others.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS capture_contexts (
+    jti TEXT PRIMARY KEY,
+    order_information TEXT NOT NULL,
+    complete_mandate TEXT NOT NULL,
+    issued_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS capture_contexts_expiry ON capture_contexts (expires_at);
+"""
+
+# Lifetime assumed for a context whose JWT has no exp claim
+DEFAULT_TTL = 15 * 60
+
+
+class CaptureContextStore:
+    """jti -> (orderInformation, completeMandate) for unexpired issued contexts."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def remember(self, jti: str, order_information: dict, complete_mandate: dict, expires_at=None) -> None:
+        """Record an issued context (and drop expired ones)."""
+        now = time.time()
+        if not isinstance(expires_at, (int, float)):
+            expires_at = now + DEFAULT_TTL
+        conn = self._connect()
+        conn.execute("DELETE FROM capture_contexts WHERE expires_at < ?", (now,))
+        conn.execute(
+            "INSERT OR REPLACE INTO capture_contexts"
+            " (jti, order_information, complete_mandate, issued_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (jti, json.dumps(order_information or {}), json.dumps(complete_mandate or {}), now, expires_at),
+        )
+
+    def lookup(self, jti: str):
+        """(orderInformation, completeMandate) for an unexpired issued context, else None."""
+        row = self._connect().execute(
+            "SELECT order_information, complete_mandate FROM capture_contexts"
+            " WHERE jti = ? AND expires_at >= ?",
+            (jti, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_capture_context_store(db_path: str) -> CaptureContextStore:
+    """Return this process's store for db_path (created on first use)."""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = CaptureContextStore(db_path)
+        return store
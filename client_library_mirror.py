@@ -0,0 +1,198 @@
+"""
+Same-origin mirror of the Unified Checkout client library.
+
+Every checkout page loads the script named by the capture context's
+clientLibrary URL from the CyberSource host. In mirror mode the server
+fetches each distinct URL once, checks the bytes against the
+clientLibraryIntegrity (SRI) value from the same capture context, and stores
+them content-addressed: the file name is the verified digest, e.g.
+sha384-<hex>.js. Next to it go gzip (and, when the brotli package is
+installed, brotli) copies. The checkout page then loads /uc-library/<name>
+from its own origin. That response is immutable, because the name changes
+whenever the content does. The browser still enforces the same integrity
+value.
+
+A miss never delays a checkout. The first page for a new URL is served the
+origin URL while a background thread fetches the library, and later pages
+get the mirror. A fetch or integrity failure is remembered for
+retry_seconds, and until then pages keep using the origin URL.
+"""
+
+import base64
+import gzip
+import hashlib
+import os
+import re
+import ssl
+import threading
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+try:
+    import brotli
+except ImportError:  # optional: gzip alone is always written
+    brotli = None
+
+# SRI algorithms, strongest first (a browser uses the strongest one given)
+_ALGORITHMS = ("sha512", "sha384", "sha256")
+NAME_RE = re.compile(r"^(sha256|sha384|sha512)-[0-9a-f]{64,128}\.js$")
+MAX_LIBRARY_BYTES = 8 * 1024 * 1024
+
+
+class IntegrityError(ValueError):
+    """The fetched bytes do not match the clientLibraryIntegrity value."""
+
+
+def parse_integrity(integrity: str) -> dict:
+    """SRI metadata ("sha384-<base64> ...") -> {algorithm: [digest bytes]}."""
+    digests = {}
+    for token in (integrity or "").split():
+        algorithm, _, value = token.partition("-")
+        value = value.split("?")[0]
+        if algorithm not in _ALGORITHMS or not value:
+            continue
+        try:
+            digests.setdefault(algorithm, []).append(base64.b64decode(value, validate=True))
+        except ValueError:
+            continue
+    return digests
+
+
+def verify(content: bytes, integrity: str) -> str:
+    """Return the content-addressed name for content; raise IntegrityError on mismatch."""
+    digests = parse_integrity(integrity)
+    for algorithm in _ALGORITHMS:
+        if algorithm not in digests:
+            continue
+        actual = hashlib.new(algorithm, content).digest()
+        if actual in digests[algorithm]:
+            return f"{algorithm}-{actual.hex()}.js"
+        raise IntegrityError(f"{algorithm} digest does not match clientLibraryIntegrity")
+    raise IntegrityError("No usable sha256/sha384/sha512 value in clientLibraryIntegrity")
+
+
+def expected_names(integrity: str) -> list:
+    """File names content matching integrity could be stored under (strongest algorithm)."""
+    digests = parse_integrity(integrity)
+    for algorithm in _ALGORITHMS:
+        if digests.get(algorithm):
+            return [f"{algorithm}-{digest.hex()}.js" for digest in digests[algorithm]]
+    return []
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ClientLibraryMirror:
+    """Fetch-once, integrity-checked, content-addressed client library store."""
+
+    def __init__(self, directory: str, allowed_hosts=(), timeout: float = 10,
+                 retry_seconds: float = 300):
+        self.directory = directory
+        self.allowed_hosts = {host.lower() for host in allowed_hosts}
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._fetching = set()
+        self._failures = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str, encoding: str = None) -> str:
+        suffix = {None: "", "gzip": ".gz", "br": ".br"}[encoding]
+        return os.path.join(self.directory, name + suffix)
+
+    def lookup(self, url: str, integrity: str):
+        """
+        The mirrored file name for this library, or None.
+
+        On a miss a background fetch is started (once per URL; failed URLs
+        are retried after retry_seconds) and None is returned. Only URLs on
+        allowed_hosts are fetched: the URL comes from a capture context the
+        browser posted back, so it is not trusted on its own.
+        """
+        names = expected_names(integrity)
+        parts = urlsplit(url)
+        if not names or parts.scheme not in ("http", "https"):
+            return None
+        if parts.netloc.lower() not in self.allowed_hosts and parts.hostname not in self.allowed_hosts:
+            return None
+        for name in names:
+            if os.path.exists(self.path(name)):
+                return name
+        key = (url, integrity)
+        with self._lock:
+            failed_at = self._failures.get(key)
+            if key in self._fetching or (failed_at and time.time() - failed_at < self.retry_seconds):
+                return None
+            self._fetching.add(key)
+        threading.Thread(target=self._fetch_in_background, args=(url, integrity), daemon=True).start()
+        return None
+
+    def _fetch_in_background(self, url: str, integrity: str) -> None:
+        key = (url, integrity)
+        try:
+            name = self.fetch(url, integrity)
+            print(f"[client-library] Mirrored {url} as {name}")
+            with self._lock:
+                self._failures.pop(key, None)
+        except Exception as e:
+            print(f"[client-library] Could not mirror {url}: {e}")
+            with self._lock:
+                self._failures[key] = time.time()
+        finally:
+            with self._lock:
+                self._fetching.discard(key)
+
+    def fetch(self, url: str, integrity: str) -> str:
+        """Download, verify and store one library (plus compressed copies); return its name."""
+        request = urllib.request.Request(url, headers={"Accept-Encoding": "identity"})
+        context = None
+        if urlsplit(url).hostname in ("localhost", "127.0.0.1"):
+            # Local stand-ins (stub_cybersource.py) use the self-signed certs/
+            # pair; the integrity check below still applies
+            context = ssl._create_unverified_context()
+        with urllib.request.urlopen(request, timeout=self.timeout, context=context) as response:
+            content = response.read(MAX_LIBRARY_BYTES + 1)
+        if len(content) > MAX_LIBRARY_BYTES:
+            raise ValueError(f"Client library larger than {MAX_LIBRARY_BYTES} bytes")
+        name = verify(content, integrity)
+        # Compressed copies first, so a visible .js always has its siblings
+        _write_atomic(self.path(name, "gzip"), gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(self.path(name, "br"), brotli.compress(content, quality=11))
+        _write_atomic(self.path(name), content)
+        return name
+
+    def open_variant(self, name: str, accepted_encodings):
+        """(path, content-encoding or None) of the best stored copy the client accepts."""
+        for encoding in ("br", "gzip"):
+            if encoding in accepted_encodings and os.path.exists(self.path(name, encoding)):
+                return self.path(name, encoding), encoding
+        return self.path(name), None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "fetching": len(self._fetching),
+                "failed": len(self._failures),
+                "stored": sorted(f for f in os.listdir(self.directory) if NAME_RE.match(f)),
+            }
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_client_library_mirror(directory: str, allowed_hosts=(), **settings) -> ClientLibraryMirror:
+    """Return this process's mirror for directory and settings (created on first use)."""
+    key = (directory, tuple(sorted(allowed_hosts)), tuple(sorted(settings.items())))
+    with _mirrors_lock:
+        mirror = _mirrors.get(key)
+        if mirror is None:
+            mirror = _mirrors[key] = ClientLibraryMirror(directory, allowed_hosts, **settings)
+        return mirror
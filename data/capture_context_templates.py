@@ -0,0 +1,192 @@
+"""
+Capture context request templates.
+
+The ``default-uc-capture-context-request*.json`` presets are composed once at
+load time. A preset may name one or more other presets under ``"$extends"``
+and carry only the keys it changes; objects are merged recursively, any other
+value (including lists) replaces the inherited one.
+
+Each composed variant is also pre-serialized into a skeleton with slots for the
+fields that change per order (amount, currency, billTo, shipTo, targetOrigins),
+so building the request for one order is a string join instead of a full
+parse, mutate and dump cycle.
+"""
+
+import copy
+import glob
+import json
+import os
+import threading
+
+EXTENDS_KEY = "$extends"
+
+# Per-order parameters and the JSON path each one patches
+ORDER_PARAMETERS = (
+    ("target_origins", ("targetOrigins",)),
+    ("total_amount", ("orderInformation", "amountDetails", "totalAmount")),
+    ("currency", ("orderInformation", "amountDetails", "currency")),
+    ("bill_to", ("orderInformation", "billTo")),
+    ("ship_to", ("orderInformation", "shipTo")),
+)
+
+_COMPACT = (",", ":")
+_SLOT_MARKER = "@@uc-slot-{}@@"
+
+
+def _deep_merge(base: dict, overlay: dict) -> dict:
+    """Return a new dict with overlay merged over base (objects merge, everything else replaces)."""
+    merged = copy.deepcopy(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _get_path(document: dict, path: tuple):
+    node = document
+    for key in path:
+        if not isinstance(node, dict) or key not in node:
+            raise KeyError(key)
+        node = node[key]
+    return node
+
+
+def _set_path(document: dict, path: tuple, value) -> None:
+    node = document
+    for key in path[:-1]:
+        node = node.setdefault(key, {})
+    node[path[-1]] = value
+
+
+class CaptureContextTemplate:
+    """A composed capture context request with a pre-serialized per-order skeleton."""
+
+    def __init__(self, name: str, document: dict):
+        self.name = name
+        self.document = document
+        # Pretty form shown in the UC Overview editor
+        self.text = json.dumps(document, indent=2)
+
+        # Swap every patchable field for a unique marker, dump once, then split
+        # the compact JSON around the markers.
+        skeleton = copy.deepcopy(document)
+        self._defaults = {}
+        markers = {}
+        for index, (param, path) in enumerate(ORDER_PARAMETERS):
+            try:
+                value = _get_path(skeleton, path)
+            except KeyError:
+                continue
+            self._defaults[param] = json.dumps(value, separators=_COMPACT)
+            marker = _SLOT_MARKER.format(index)
+            markers[json.dumps(marker)] = param
+            _set_path(skeleton, path, marker)
+
+        serialized = json.dumps(skeleton, separators=_COMPACT)
+        self._segments = []
+        self._slots = []
+        while markers:
+            position, token = min(
+                (serialized.find(token), token) for token in markers
+            )
+            self._segments.append(serialized[:position])
+            self._slots.append(markers.pop(token))
+            serialized = serialized[position + len(token):]
+        self._segments.append(serialized)
+
+    def render(
+        self,
+        total_amount=None,
+        currency=None,
+        bill_to=None,
+        ship_to=None,
+        target_origins=None,
+    ) -> str:
+        """Return the request body as compact JSON with the given order fields patched in."""
+        overrides = {
+            "total_amount": total_amount,
+            "currency": currency,
+            "bill_to": bill_to,
+            "ship_to": ship_to,
+            "target_origins": target_origins,
+        }
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+
+        # A field the variant does not define has no slot; fall back to a full rebuild.
+        if any(param not in self._defaults for param in overrides):
+            return self._render_document(overrides)
+
+        parts = [self._segments[0]]
+        for slot, segment in zip(self._slots, self._segments[1:]):
+            if slot in overrides:
+                parts.append(json.dumps(overrides[slot], separators=_COMPACT))
+            else:
+                parts.append(self._defaults[slot])
+            parts.append(segment)
+        return "".join(parts)
+
+    def _render_document(self, overrides: dict) -> str:
+        document = copy.deepcopy(self.document)
+        for param, path in ORDER_PARAMETERS:
+            if param in overrides:
+                _set_path(document, path, overrides[param])
+        return json.dumps(document, separators=_COMPACT)
+
+
+def load_capture_context_templates(data_dir: str, pattern: str) -> dict:
+    """Load every preset matching pattern in data_dir and compose its $extends layers."""
+    raw = {}
+    for path in glob.glob(os.path.join(data_dir, pattern)):
+        with open(path, "r") as f:
+            raw[os.path.basename(path)] = json.load(f)
+
+    composed = {}
+
+    def compose(name, stack=()):
+        if name in composed:
+            return composed[name]
+        if name in stack:
+            raise ValueError(f"Circular {EXTENDS_KEY} in capture context config: {name}")
+        if name not in raw:
+            raise FileNotFoundError(f"Config not found: {name}")
+        layer = dict(raw[name])
+        parents = layer.pop(EXTENDS_KEY, [])
+        if isinstance(parents, str):
+            parents = [parents]
+        document = {}
+        for parent in parents:
+            document = _deep_merge(document, compose(parent, stack + (name,)))
+        composed[name] = _deep_merge(document, layer)
+        return composed[name]
+
+    return {
+        name: CaptureContextTemplate(name, compose(name)) for name in sorted(raw)
+    }
+
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+
+def get_capture_context_templates(data_dir: str, pattern: str) -> dict:
+    """
+    Return the composed templates for data_dir, reloading only when a preset
+    file is added, removed or modified.
+    """
+    signature = tuple(
+        sorted(
+            (os.path.basename(p), os.stat(p).st_mtime_ns)
+            for p in glob.glob(os.path.join(data_dir, pattern))
+        )
+    )
+    key = (data_dir, pattern)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+    templates = load_capture_context_templates(data_dir, pattern)
+    with _cache_lock:
+        _cache[key] = (signature, templates)
+    return templates
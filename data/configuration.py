@@ -5,6 +5,7 @@ Reads credentials from ../config.ini (one level above the app directory).
 
 import os
 import configparser
+import tempfile
 
 from CyberSource.logging.log_configuration import LogConfiguration
 
@@ -37,10 +38,180 @@ class MerchantConfiguration:
         self.run_environment = cfg.get(
             "CyberSource", "run_environment", fallback="apitest.cybersource.com"
         )
+        # Hosts capture context calls may use, fastest healthy first
+        # (endpoint_selection.py); defaults to run_environment alone
+        environments = cfg.get("CyberSource", "run_environments", fallback="")
+        self.run_environments = list(dict.fromkeys(
+            host.strip() for host in environments.replace("\n", ",").split(",") if host.strip()
+        )) or [self.run_environment]
 
         # App settings
         self.port = cfg.getint("App", "port", fallback=5000)
 
+        # Request size limits: whole body, and any single form field / widget response
+        self.max_content_length = cfg.getint(
+            "App", "max_content_length", fallback=1024 * 1024
+        )
+        self.max_field_length = cfg.getint("App", "max_field_length", fallback=64 * 1024)
+
+        # /checkout regenerates a capture context this close to its exp
+        self.capture_context_grace_seconds = cfg.getfloat(
+            "App", "capture_context_grace_seconds", fallback=60
+        )
+
+        # Send 103 Early Hints for the client library from /checkout (dev server)
+        self.early_hints = cfg.getboolean("App", "early_hints", fallback=True)
+
+        # Serve the UC client library from a verified same-origin mirror
+        # (client_library_mirror.py); only URLs on these hosts are fetched
+        self.client_library_mirror = cfg.getboolean(
+            "App", "client_library_mirror", fallback=False
+        )
+        mirror_hosts = cfg.get("App", "client_library_mirror_hosts", fallback="")
+        self.client_library_mirror_hosts = [
+            host.strip() for host in mirror_hosts.split(",") if host.strip()
+        ] or list(self.run_environments)
+        self.client_library_mirror_directory = cfg.get(
+            "App",
+            "client_library_mirror_directory",
+            fallback=os.path.join(os.path.dirname(os.path.dirname(__file__)), "client_library_cache"),
+        )
+
+        # Batch capture context generation: max concurrent upstream calls
+        self.batch_concurrency = cfg.getint("App", "batch_concurrency", fallback=4)
+
+        # SDK record/replay: off | record | replay (SDK_RECORDING_MODE env overrides)
+        self.sdk_recording_mode = os.environ.get("SDK_RECORDING_MODE") or cfg.get(
+            "App", "sdk_recording_mode", fallback="off"
+        )
+        self.sdk_recordings_directory = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "recordings"
+        )
+        self.sdk_replay_latency_ms = cfg.getfloat(
+            "App", "sdk_replay_latency_ms", fallback=0
+        )
+
+        # Admission control for capture context routes (shared across workers
+        # through admission_state_file)
+        self.admission_control = cfg.getboolean("App", "admission_control", fallback=True)
+        # UC_ADMISSION_RATE_PER_CLIENT / UC_ADMISSION_BURST override the
+        # per-client bucket (run_full_test.py --soak lifts it this way)
+        self.admission_rate_per_client = float(
+            os.environ.get("UC_ADMISSION_RATE_PER_CLIENT")
+            or cfg.getfloat("App", "admission_rate_per_client", fallback=2.0)
+        )
+        self.admission_burst = float(
+            os.environ.get("UC_ADMISSION_BURST") or cfg.getfloat("App", "admission_burst", fallback=10)
+        )
+        self.admission_initial_limit = cfg.getfloat(
+            "App", "admission_initial_limit", fallback=20
+        )
+        self.admission_min_limit = cfg.getfloat("App", "admission_min_limit", fallback=2)
+        self.admission_max_limit = cfg.getfloat("App", "admission_max_limit", fallback=100)
+        self.admission_latency_tolerance = cfg.getfloat(
+            "App", "admission_latency_tolerance", fallback=2.0
+        )
+        self.admission_state_file = cfg.get(
+            "App",
+            "admission_state_file",
+            fallback=os.path.join(
+                tempfile.gettempdir(), f"uc-admission-{self.port}.bin"
+            ),
+        )
+
+        # Repeat posts to /capture-context and /process-payment within this
+        # window get the stored response (0 disables)
+        self.idempotency_ttl_seconds = cfg.getfloat(
+            "App", "idempotency_ttl_seconds", fallback=60
+        )
+
+        # Post-payment job queue (SQLite) and its in-process workers
+        # (0 = run workers separately with `python job_queue.py`)
+        self.job_queue_db = cfg.get(
+            "App",
+            "job_queue_db",
+            fallback=os.path.join(os.path.dirname(os.path.dirname(__file__)), "jobs.sqlite3"),
+        )
+        self.job_workers = cfg.getint("App", "job_workers", fallback=2)
+        # Issued capture contexts (jti -> order and completeMandate) for
+        # server-side orchestration; shared by worker processes
+        self.capture_context_store_db = cfg.get(
+            "App",
+            "capture_context_store_db",
+            fallback=os.path.join(
+                os.path.dirname(os.path.dirname(__file__)), "capture_contexts.sqlite3"
+            ),
+        )
+        self.job_max_attempts = cfg.getint("App", "job_max_attempts", fallback=5)
+        self.job_visibility_timeout_seconds = cfg.getfloat(
+            "App", "job_visibility_timeout_seconds", fallback=30
+        )
+        self.job_retry_backoff_seconds = cfg.getfloat(
+            "App", "job_retry_backoff_seconds", fallback=2
+        )
+        self.receipts_directory = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "receipts"
+        )
+
+        # run_environments selection: EWMA smoothing, error rate at which a host
+        # counts as unhealthy, probe interval, and share of exploratory calls
+        self.endpoint_ewma_alpha = cfg.getfloat("App", "endpoint_ewma_alpha", fallback=0.2)
+        self.endpoint_max_error_rate = cfg.getfloat(
+            "App", "endpoint_max_error_rate", fallback=0.5
+        )
+        self.endpoint_probe_interval_seconds = cfg.getfloat(
+            "App", "endpoint_probe_interval_seconds", fallback=10
+        )
+        self.endpoint_explore_ratio = cfg.getfloat("App", "endpoint_explore_ratio", fallback=0.05)
+
+        # Weighted preset routing for /ucoverview ("preset=weight, ..."; empty = off)
+        self.template_routing = cfg.get("App", "template_routing", fallback="")
+        self.template_routing_salt = cfg.get("App", "template_routing_salt", fallback="")
+
+        # /process-payment: "widget" (up.complete() runs the completeMandate
+        # steps in the browser) or "server" (payment_orchestration.py runs them
+        # with the transient token, through pooled SDK clients)
+        self.payment_orchestration = cfg.get(
+            "App", "payment_orchestration", fallback="widget"
+        ).strip().lower()
+        self.orchestration_workers = cfg.getint("App", "orchestration_workers", fallback=4)
+        self.orchestration_fraud_screening = cfg.getboolean(
+            "App", "orchestration_fraud_screening", fallback=False
+        )
+        self.orchestration_speculative_tokens = cfg.getboolean(
+            "App", "orchestration_speculative_tokens", fallback=True
+        )
+
+        # How checkout.html hands the up.complete() result over: "form" (full
+        # page post to /process-payment) or "sse" (fetch to
+        # /api/payment-result/events, which streams the status back)
+        self.payment_result_transport = cfg.get(
+            "App", "payment_result_transport", fallback="form"
+        ).strip().lower()
+        # Longest an events stream waits for the post-payment job to finish
+        self.payment_events_timeout_seconds = cfg.getfloat(
+            "App", "payment_events_timeout_seconds", fallback=30
+        )
+
+        # Server-Timing header (config / SDK / JWT / JSON / render phases) on
+        # every response; UC_SERVER_TIMING=0/1 overrides it per environment
+        server_timing = os.environ.get("UC_SERVER_TIMING", "").strip().lower()
+        self.server_timing = (
+            server_timing in ("1", "true", "yes", "on") if server_timing
+            else cfg.getboolean("App", "server_timing", fallback=True)
+        )
+
+        # Bearer token for /admin/* diagnostics endpoints (empty = disabled)
+        self.admin_token = os.environ.get("UC_ADMIN_TOKEN") or cfg.get(
+            "App", "admin_token", fallback=""
+        )
+        # /admin/memory soak mode: flag a leak when traced memory grows more
+        # than memory_leak_threshold_kb per 1,000 requests
+        self.memory_soak_window = cfg.getint("App", "memory_soak_window", fallback=1000)
+        self.memory_leak_threshold_kb = cfg.getfloat(
+            "App", "memory_leak_threshold_kb", fallback=256
+        )
+
         # JWT parameters
         self.keys_directory = os.path.join(
             os.path.dirname(os.path.dirname(__file__)), "Resource"
@@ -65,14 +236,27 @@ class MerchantConfiguration:
         self.log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
         self.log_date_format = "%Y-%m-%d %H:%M:%S"
 
-        # MLE (Message Level Encryption) - disabled by default
+        # Sign http_signature requests with the cached signer in http_signature.py
+        # instead of the SDK's per-request signing
+        self.precomputed_signer = cfg.getboolean("App", "precomputed_signer", fallback=True)
+
+        # SDK MLE stays off: the SDK only supports it with JWT auth, and
+        # validate_merchant_details rejects it for http_signature
         self.useMLEGlobally = False
+        # The app's own MLE (message_encryption.py): when enabled, capture
+        # context request bodies are encrypted to mle_request_cert_file
+        self.use_mle = cfg.getboolean("App", "use_mle", fallback=False)
+        self.mle_request_cert_file = cfg.get("App", "mle_request_cert_file", fallback="")
 
         # PEM Key file path for decoding JWE Response (optional)
-        self.jwe_pem_file_directory = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            "Resource",
-            "NetworkTokenCert.pem",
+        self.jwe_pem_file_directory = cfg.get(
+            "App",
+            "jwe_pem_file",
+            fallback=os.path.join(
+                os.path.dirname(os.path.dirname(__file__)),
+                "Resource",
+                "NetworkTokenCert.pem",
+            ),
         )
 
         # Override the default developerId (optional)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Scenario engine for the Unified Checkout E2E tests.
+
+One scenario per capture context preset in data/. What a scenario does is
+derived from its composed request:
+  - captureMandate.requestSaveCard       -> tick "Save my card"
+  - completeMandate.consumerAuthentication -> handle the 3DS / OTP challenge
+
+All scenarios share one Chromium process (each gets a fresh browser context),
+and skip Home -> UC Overview -> Capture Context: the capture context is created
+through /api/capture-context and the checkout page is opened with a direct
+POST, so each scenario starts at the payment widget.
+
+Usage:
+  python e2e_scenarios.py                      # All presets, one browser
+  python e2e_scenarios.py --only default no_3ds
+  python e2e_scenarios.py --list
+  python e2e_scenarios.py --report out.json    # Write results as JSON
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from urllib.parse import urlencode
+
+from data.capture_context_templates import get_capture_context_templates
+from e2e_waits import (
+    BASE_URL,
+    SCREENSHOTS_DIR,
+    wait_for_frame,
+    wait_for_payment_result,
+    wait_for_selector_in_any_frame,
+    wait_for_widget_ready,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CONFIG_FILE_PREFIX = "default-uc-capture-context-request"
+CONFIG_FILE_PATTERN = f"{CONFIG_FILE_PREFIX}*.json"
+
+OTP_VALUE = "1234"
+CARD_NUMBER = os.environ.get("E2E_TEST_CARD", "4000000000002503")
+EXP_MONTH = "12"
+EXP_YEAR = "2026"
+CVV = "123"
+
+
+def discover_scenarios() -> list:
+    """Return one scenario dict per preset, with behaviour derived from the request."""
+    templates = get_capture_context_templates(DATA_DIR, CONFIG_FILE_PATTERN)
+    scenarios = []
+    for filename, template in templates.items():
+        suffix = filename[len(CONFIG_FILE_PREFIX):-len(".json")].lstrip("-")
+        document = template.document
+        complete_mandate = document.get("completeMandate", {})
+        scenarios.append(
+            {
+                "name": suffix.replace("-", "_") or "default",
+                "config": filename,
+                "save_card": bool(document.get("captureMandate", {}).get("requestSaveCard")),
+                "three_ds": bool(complete_mandate.get("consumerAuthentication")),
+            }
+        )
+    # Keep "default" first, like the UC Overview selector
+    scenarios.sort(key=lambda s: (s["name"] != "default", s["name"]))
+    return scenarios
+
+
+# -------------------------------------------------------------------
+# Widget actions shared by the scenarios and the standalone test scripts
+# -------------------------------------------------------------------
+
+
+async def tick_save_card(page, mce_frame) -> bool:
+    """Find and tick 'Save my card for future ...' checkbox. Searches MCE frame and all frames."""
+    frames_to_try = [mce_frame] + [f for f in page.frames if f != mce_frame]
+    for frame in frames_to_try:
+        try:
+            # Playwright getByLabel finds by associated label text
+            lb = frame.get_by_label(re.compile(r"save my card", re.I))
+            if await lb.count() > 0:
+                await lb.first.click()
+                print("  Tick Save card: clicked via getByLabel('save my card')")
+                return True
+        except Exception:
+            pass
+        try:
+            cb = frame.get_by_role("checkbox", name=re.compile(r"save|future", re.I))
+            if await cb.count() > 0:
+                el = cb.first
+                if not await el.is_checked():
+                    await el.check()
+                print("  Tick Save card: checked via getByRole(checkbox)")
+                return True
+        except Exception:
+            pass
+    selectors = [
+        "label:has-text('Save my card')",
+        "label:has-text('Save my card for future')",
+        "label:has-text('save my card' i)",
+        "text=Save my card for future",
+        "label:has-text('future')",
+        "input[type='checkbox'][id*='save']",
+        "input[type='checkbox'][name*='save']",
+        "input[type='checkbox'][aria-label*='save' i]",
+        "label:has-text('Save'):has(input[type='checkbox'])",
+        "input[type='checkbox']",
+    ]
+    for frame in frames_to_try:
+        for sel in selectors:
+            try:
+                loc = frame.locator(sel)
+                if await loc.count() > 0:
+                    el = loc.first
+                    tag = await el.evaluate("e => e.tagName.toLowerCase()")
+                    if tag == "label":
+                        await el.click()
+                        print(f"  Tick Save card: clicked label '{sel}'")
+                        return True
+                    if tag == "input":
+                        is_checked = await el.is_checked()
+                        if not is_checked:
+                            await el.check()
+                            print(f"  Tick Save card: checked ({sel})")
+                            return True
+                        print(f"  Save card already checked")
+                        return True
+            except Exception:
+                continue
+    return False
+
+
+async def fill_otp_if_visible(page) -> bool:
+    """Fill OTP 1234 in any visible OTP field. Returns True if filled."""
+    for frame in page.frames:
+        try:
+            otp = frame.locator(
+                "input[type='text'], input[type='password'], "
+                "input[name*='otp' i], input[name*='code' i], "
+                "input[id*='otp' i], input[placeholder*='code' i], input[placeholder*='OTP' i]"
+            )
+            if await otp.count() > 0:
+                await otp.first.fill(OTP_VALUE)
+                print(f"  OTP screen: entered {OTP_VALUE}")
+                # Click submit/authenticate after OTP
+                btn = frame.locator(
+                    "button[type='submit'], input[type='submit'], "
+                    "button:has-text('Submit'), button:has-text('Continue'), "
+                    "button:has-text('Authenticate'), button:has-text('Approve'), "
+                    "button:has-text('Verify'), button:has-text('Complete')"
+                )
+                if await btn.count() > 0:
+                    await btn.first.click()
+                    print(f"  OTP: clicked submit/authenticate")
+                return True
+        except Exception:
+            pass
+    return False
+
+
+# -------------------------------------------------------------------
+# Scenario steps
+# -------------------------------------------------------------------
+
+
+def _decode_jwt_payload(jwt_token: str) -> dict:
+    payload_segment = jwt_token.split(".")[1]
+    payload_segment += "=" * (-len(payload_segment) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload_segment))
+
+
+async def open_checkout(context, page, config: str, base_url: str) -> None:
+    """Create a capture context for config and load /checkout with it via a direct POST."""
+    # A fresh Idempotency-Key so the capture context comes from the SDK, not the cache
+    response = await context.request.post(
+        f"{base_url}/api/capture-context",
+        data={"config": config},
+        headers={"Idempotency-Key": uuid.uuid4().hex},
+    )
+    body = await response.json()
+    if not response.ok:
+        raise RuntimeError(f"Capture context failed ({response.status}): {body.get('error')}")
+
+    capture_context = body["captureContext"]
+    form = urlencode(
+        {
+            "captureContext": capture_context,
+            "captureContextDecoded": json.dumps(_decode_jwt_payload(capture_context)),
+        }
+    )
+
+    async def as_form_post(route):
+        headers = dict(route.request.headers)
+        headers["content-type"] = "application/x-www-form-urlencoded"
+        await route.continue_(method="POST", post_data=form, headers=headers)
+
+    checkout_url = f"{base_url}/checkout"
+    await page.route(checkout_url, as_form_post)
+    try:
+        await page.goto(checkout_url, wait_until="domcontentloaded")
+    finally:
+        await page.unroute(checkout_url, as_form_post)
+
+
+async def run_scenario(browser, scenario: dict, base_url: str = BASE_URL) -> dict:
+    """Run one scenario in a fresh browser context and return its result record."""
+    out_dir = os.path.join(SCREENSHOTS_DIR, scenario["name"])
+    os.makedirs(out_dir, exist_ok=True)
+    steps = {}
+    result = {"scenario": scenario["name"], "config": scenario["config"], "steps": steps}
+
+    context = await browser.new_context(
+        ignore_https_errors=True,
+        viewport={"width": 1280, "height": 900},
+    )
+    page = await context.new_page()
+
+    async def screenshot(name):
+        try:
+            await page.screenshot(path=os.path.join(out_dir, name), timeout=5000, full_page=True)
+        except Exception as e:
+            print(f"  Screenshot {name} skipped: {e}")
+
+    started = time.monotonic()
+    mark = started
+
+    def step(name):
+        nonlocal mark
+        now = time.monotonic()
+        steps[name] = round(now - mark, 2)
+        mark = now
+
+    try:
+        print(f"\n=== [{scenario['name']}] {scenario['config']} ===")
+        await open_checkout(context, page, scenario["config"], base_url)
+        step("checkout_loaded")
+
+        buttonlist_frame = await wait_for_widget_ready(page, timeout=30000)
+        if not buttonlist_frame:
+            raise RuntimeError("Payment widget button list did not load")
+        step("widget_ready")
+        await screenshot("05_widget.png")
+
+        card_btn = buttonlist_frame.locator("button:has-text('Checkout With Card'), button:has-text('Card')")
+        if await card_btn.count() > 0:
+            await card_btn.first.click()
+        else:
+            await buttonlist_frame.locator("button").first.click()
+        mce_frame = await wait_for_frame(page, "mce", "input[id*='card-number']", timeout=30000)
+        if not mce_frame:
+            raise RuntimeError("Manual card entry frame did not load")
+        step("card_form_ready")
+
+        await mce_frame.locator("input[id*='card-number']").first.fill(CARD_NUMBER)
+        month_sel = mce_frame.locator("#card-expiry-month")
+        if await month_sel.count() > 0:
+            await month_sel.first.select_option(EXP_MONTH)
+        year_sel = mce_frame.locator("#card-expiry-year")
+        if await year_sel.count() > 0:
+            await year_sel.first.select_option(EXP_YEAR)
+        cvv_input = mce_frame.locator("input[name*='securityCode'], input[id*='securityCode']")
+        if await cvv_input.count() > 0:
+            await cvv_input.first.fill(CVV)
+        await screenshot("07_filled.png")
+
+        ticked = await tick_save_card(page, mce_frame) if scenario["save_card"] else True
+        submit_btn = mce_frame.locator(
+            "button:has-text('Pay'), button:has-text('Submit'), "
+            "button:has-text('Continue'), button[type='submit']"
+        )
+        if await submit_btn.count() > 0:
+            await submit_btn.first.click()
+        step("card_submitted")
+
+        _, confirm_btn = await wait_for_selector_in_any_frame(
+            page, "button:has-text('Confirm and Continue'), button:has-text('Confirm')", timeout=30000
+        )
+        # Save card may only appear on the confirm step
+        if not ticked:
+            await tick_save_card(page, mce_frame)
+        await screenshot("07b_confirm_step.png")
+        if confirm_btn:
+            await confirm_btn.click()
+        step("confirmed")
+
+        if scenario["three_ds"]:
+            for _ in range(90):
+                if await wait_for_payment_result(page, timeout=1000):
+                    break
+                await fill_otp_if_visible(page)
+        else:
+            await wait_for_payment_result(page, timeout=60000)
+        await page.wait_for_load_state("load", timeout=30000)
+        step("payment_result")
+        await screenshot("08_result.png")
+
+        content = await page.content()
+        match = re.search(r"Status:\s*([A-Z_]+)", content)
+        result["status"] = match.group(1) if match else None
+        result["passed"] = result["status"] == "AUTHORIZED" or bool(
+            os.environ.get("E2E_ALLOW_DECLINED") and "/process-payment" in page.url
+        )
+        if not result["passed"]:
+            result["error"] = f"Transaction was not AUTHORIZED (status: {result['status']})"
+
+    except Exception as e:
+        result["passed"] = False
+        result["error"] = str(e)
+        await screenshot("99_error.png")
+    finally:
+        await context.close()
+
+    result["duration_s"] = round(time.monotonic() - started, 1)
+    print(f"  [{scenario['name']}] {'PASS' if result['passed'] else 'FAIL'} "
+          f"in {result['duration_s']}s {result.get('error', '')}")
+    return result
+
+
+async def run_scenarios(scenarios, headed: bool = False, base_url: str = BASE_URL) -> list:
+    """Run scenarios one after another in a single shared browser process."""
+    from playwright.async_api import async_playwright
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=not headed)
+        try:
+            return [await run_scenario(browser, s, base_url) for s in scenarios]
+        finally:
+            await browser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run preset-driven E2E scenarios in one browser")
+    parser.add_argument("--only", nargs="*", help="Scenario names to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="List scenarios and exit")
+    parser.add_argument("--headed", action="store_true", help="Run with visible browser")
+    parser.add_argument("--report", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    scenarios = discover_scenarios()
+    if args.list:
+        for s in scenarios:
+            flags = ", ".join(k for k in ("save_card", "three_ds") if s[k]) or "-"
+            print(f"  {s['name']:<30} {flags:<20} {s['config']}")
+        return 0
+    if args.only:
+        unknown = set(args.only) - {s["name"] for s in scenarios}
+        if unknown:
+            parser.error(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        scenarios = [s for s in scenarios if s["name"] in args.only]
+
+    results = asyncio.run(run_scenarios(scenarios, headed=args.headed))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
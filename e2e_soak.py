@@ -0,0 +1,464 @@
+"""
+Soak mode for the E2E flows: loop them against one server for hours and
+report resource and latency drift.
+
+Flows run either at a fixed rate (open loop: --rate flows per minute, missed
+starts are counted when every slot is still busy) or with a concurrency
+target (closed loop: --concurrency flows always in flight). A flow is the
+browser scenario from e2e_scenarios.py or, with --flow http, just the server
+side of it (/api/capture-context + /checkout) without a browser.
+
+Every --sample-interval seconds the server's RSS, open file descriptors and
+thread count are sampled. With app.py's debug reloader that is the serving
+child process, not the reloader parent. Resource samples and per-flow step
+timings are appended to e2e_soak_samples.jsonl as they are taken. At the end
+the drift checks below are evaluated and written to e2e_soak_report.json:
+
+  error_rate       failed + missed flows / scheduled flows
+  rss_growth       RSS slope after warm-up (least squares), MB per hour
+  fd_growth        open fds, last window median - first window median
+  thread_growth    threads, last window median - first window median
+  latency_creep    per step: p95 of the last third / p95 of the first third
+"""
+
+import asyncio
+import base64
+import json
+import os
+import re
+import ssl
+import subprocess
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT = os.path.join(DIR, "e2e_soak_report.json")
+SAMPLES = os.path.join(DIR, "e2e_soak_samples.jsonl")
+SERVER_LOG = os.path.join(DIR, "e2e_soak_server.log")
+
+# Browsers are relaunched after this many flows so client-side growth
+# doesn't show up as server latency creep
+BROWSER_RECYCLE_FLOWS = 50
+# Each step needs this many flows in both the first and last third
+MIN_LATENCY_SAMPLES = 10
+
+
+def parse_duration(text: str) -> float:
+    """'90s', '30m', '4h', '1h30m' or plain seconds -> seconds."""
+    text = text.strip().lower()
+    if re.fullmatch(r"\d+(\.\d+)?", text):
+        return float(text)
+    parts = re.findall(r"(\d+(?:\.\d+)?)([hms])", text)
+    if not parts or "".join(n + u for n, u in parts) != text:
+        raise ValueError(f"Invalid duration '{text}' (use e.g. 90s, 30m, 4h, 1h30m)")
+    return sum(float(n) * {"h": 3600, "m": 60, "s": 1}[u] for n, u in parts)
+
+
+def add_soak_arguments(parser) -> None:
+    group = parser.add_argument_group("soak mode")
+    group.add_argument("--soak", metavar="DURATION", help="Loop the flows for DURATION (e.g. 30m, 4h)")
+    load = group.add_mutually_exclusive_group()
+    load.add_argument("--rate", type=float, help="Start this many flows per minute (open loop)")
+    load.add_argument("--concurrency", type=int, help="Keep this many flows in flight (closed loop, default 1)")
+    group.add_argument("--max-in-flight", type=int, default=4, help="Slots for --rate mode (default 4)")
+    group.add_argument("--flow", choices=("browser", "http"), default="browser",
+                       help="browser: full widget flow; http: capture context + checkout page only")
+    group.add_argument("--only", nargs="*", help="Scenarios to rotate through (default: all presets)")
+    group.add_argument("--sample-interval", type=float, default=10, help="Seconds between resource samples")
+    group.add_argument("--warmup", default="5m", help="Ignore this initial period in the checks (default 5m)")
+    group.add_argument("--max-error-rate", type=float, default=0.05)
+    group.add_argument("--max-rss-growth", type=float, default=50, help="MB per hour after warm-up")
+    group.add_argument("--max-fd-growth", type=int, default=16)
+    group.add_argument("--max-thread-growth", type=int, default=8)
+    group.add_argument("--max-latency-creep", type=float, default=1.5, help="p95 ratio, last / first third")
+    group.add_argument("--soak-report", default=REPORT)
+
+
+# -------------------------------------------------------------------
+# Server process sampling
+# -------------------------------------------------------------------
+
+
+def _children(pid: int) -> list:
+    if os.path.isdir("/proc"):
+        children = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # Field 4 is the parent pid; comm (field 2) may contain spaces
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            if ppid == pid:
+                children.append(int(entry))
+        return children
+    proc = subprocess.run(["pgrep", "-P", str(pid)], capture_output=True, text=True)
+    return [int(p) for p in proc.stdout.split()]
+
+
+class ProcessSampler:
+    """RSS, open fds and threads of the process actually serving requests."""
+
+    def __init__(self, root_pid: int):
+        self.root_pid = root_pid
+
+    def target_pid(self) -> int:
+        # Follow the youngest child down: the debug reloader re-spawns the server
+        pid = self.root_pid
+        while True:
+            children = _children(pid)
+            if not children:
+                return pid
+            pid = max(children)
+
+    def sample(self) -> dict:
+        pid = self.target_pid()
+        if os.path.isdir(f"/proc/{pid}"):
+            with open(f"/proc/{pid}/status") as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+            rss_kb = int(status["VmRSS"].split()[0])
+            threads = int(status["Threads"])
+            fds = len(os.listdir(f"/proc/{pid}/fd"))
+        else:
+            rss_kb = int(subprocess.run(["ps", "-o", "rss=", "-p", str(pid)],
+                                        capture_output=True, text=True).stdout or 0)
+            threads = max(0, len(subprocess.run(["ps", "-M", "-p", str(pid)],
+                                                capture_output=True, text=True).stdout.splitlines()) - 1)
+            fds = max(0, len(subprocess.run(["lsof", "-p", str(pid)],
+                                            capture_output=True, text=True).stdout.splitlines()) - 1)
+        return {"pid": pid, "rss_mb": round(rss_kb / 1024, 1), "fds": fds, "threads": threads}
+
+
+def find_server_pid(port: int):
+    """Pid listening on port (for --no-server), or None."""
+    proc = subprocess.run(["lsof", f"-ti:{port}", "-sTCP:LISTEN"], capture_output=True, text=True)
+    pids = [int(p) for p in proc.stdout.split()]
+    return min(pids) if pids else None
+
+
+# -------------------------------------------------------------------
+# Flows
+# -------------------------------------------------------------------
+
+
+def _http_flow(scenario: dict, base_url: str) -> dict:
+    """Server-side part of a scenario: create a capture context, render /checkout."""
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    steps = {}
+    result = {"scenario": scenario["name"], "config": scenario["config"], "steps": steps}
+    mark = started = time.monotonic()
+
+    def post(path, data, content_type):
+        # A fresh Idempotency-Key per post: identical bodies would otherwise
+        # be answered from the idempotency cache instead of the SDK
+        headers = {"Content-Type": content_type, "Idempotency-Key": uuid.uuid4().hex}
+        request = urllib.request.Request(base_url + path, data=data, method="POST", headers=headers)
+        with urllib.request.urlopen(request, context=ctx, timeout=60) as response:
+            return response.read()
+
+    try:
+        body = json.loads(post(
+            "/api/capture-context", json.dumps({"config": scenario["config"]}).encode(), "application/json"
+        ))
+        now = time.monotonic()
+        steps["capture_context"], mark = round(now - mark, 3), now
+        token = body["captureContext"]
+        payload = token.split(".")[1]
+        decoded = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)).decode()
+        form = urllib.parse.urlencode({"captureContext": token, "captureContextDecoded": decoded})
+        post("/checkout", form.encode(), "application/x-www-form-urlencoded")
+        steps["checkout"] = round(time.monotonic() - mark, 3)
+        result["passed"] = True
+    except Exception as e:
+        result["passed"] = False
+        result["error"] = str(e)
+    result["duration_s"] = round(time.monotonic() - started, 2)
+    return result
+
+
+class _Slot:
+    """One in-flight flow at a time; owns a browser in browser mode."""
+
+    def __init__(self, flow: str, base_url: str):
+        self.flow = flow
+        self.base_url = base_url
+        self.browser = None
+        self.flows = 0
+
+    async def run(self, playwright, scenario: dict) -> dict:
+        if self.flow == "http":
+            return await asyncio.to_thread(_http_flow, scenario, self.base_url)
+        from e2e_scenarios import run_scenario
+
+        if self.browser is None or self.flows >= BROWSER_RECYCLE_FLOWS:
+            if self.browser is not None:
+                await self.browser.close()
+            self.browser = await playwright.chromium.launch(headless=True)
+            self.flows = 0
+        self.flows += 1
+        return await run_scenario(self.browser, scenario, self.base_url)
+
+    async def close(self) -> None:
+        if self.browser is not None:
+            await self.browser.close()
+
+
+# -------------------------------------------------------------------
+# Analysis
+# -------------------------------------------------------------------
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def _median(values):
+    return _percentile(values, 0.5)
+
+
+def _slope(points) -> float:
+    """Least-squares slope of (x, y) points."""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+def _check(name, value, limit, passed, detail=""):
+    return {"check": name, "value": value, "limit": limit,
+            "result": "SKIP" if passed is None else ("PASS" if passed else "FAIL"), "detail": detail}
+
+
+def analyze(resources: list, flows: list, scheduled: int, missed: int, args, warmup_s: float) -> list:
+    """Evaluate the drift checks; returns one record per check."""
+    checks = []
+    failed = sum(1 for f in flows if not f["passed"])
+    error_rate = (failed + missed) / scheduled if scheduled else 0.0
+    checks.append(_check("error_rate", round(error_rate, 4), args.max_error_rate,
+                         error_rate <= args.max_error_rate,
+                         f"{failed} failed, {missed} missed of {scheduled}"))
+
+    steady = [r for r in resources if r["t"] >= warmup_s]
+    if len(steady) < 6:
+        for name in ("rss_growth", "fd_growth", "thread_growth"):
+            checks.append(_check(name, None, None, None, "Not enough samples after warm-up"))
+    else:
+        rss_per_hour = _slope([(r["t"], r["rss_mb"]) for r in steady]) * 3600
+        checks.append(_check("rss_growth", round(rss_per_hour, 2), args.max_rss_growth,
+                             rss_per_hour <= args.max_rss_growth,
+                             f"{steady[0]['rss_mb']} -> {steady[-1]['rss_mb']} MB"))
+        window = max(3, len(steady) // 10)
+        for name, key, limit in (("fd_growth", "fds", args.max_fd_growth),
+                                 ("thread_growth", "threads", args.max_thread_growth)):
+            first = _median([r[key] for r in steady[:window]])
+            last = _median([r[key] for r in steady[-window:]])
+            checks.append(_check(name, last - first, limit, last - first <= limit, f"{first} -> {last}"))
+
+    steady_flows = [f for f in flows if f["t"] >= warmup_s and f["passed"]]
+    third = len(steady_flows) // 3
+    step_names = sorted({s for f in steady_flows for s in f["steps"]})
+    for step in step_names:
+        first = [f["steps"][step] for f in steady_flows[:third] if step in f["steps"]]
+        last = [f["steps"][step] for f in steady_flows[-third:] if step in f["steps"]] if third else []
+        if min(len(first), len(last)) < MIN_LATENCY_SAMPLES:
+            checks.append(_check(f"latency_creep:{step}", None, args.max_latency_creep, None,
+                                 f"Need {MIN_LATENCY_SAMPLES} flows in each third"))
+            continue
+        p95_first, p95_last = _percentile(first, 0.95), _percentile(last, 0.95)
+        ratio = p95_last / p95_first if p95_first else 1.0
+        checks.append(_check(f"latency_creep:{step}", round(ratio, 2), args.max_latency_creep,
+                             ratio <= args.max_latency_creep,
+                             f"p95 {p95_first:.3f}s -> {p95_last:.3f}s"))
+    return checks
+
+
+def latency_timeline(flows: list, bucket_s: float) -> list:
+    """Per-step p50/p95 for each bucket_s slice of the run."""
+    buckets = {}
+    for f in flows:
+        if f["passed"]:
+            buckets.setdefault(int(f["t"] // bucket_s), []).append(f["steps"])
+    timeline = []
+    for index in sorted(buckets):
+        steps = {}
+        for name in sorted({s for flow_steps in buckets[index] for s in flow_steps}):
+            values = [s[name] for s in buckets[index] if name in s]
+            steps[name] = {"n": len(values), "p50": round(_percentile(values, 0.5), 3),
+                           "p95": round(_percentile(values, 0.95), 3)}
+        timeline.append({"t": index * bucket_s, "flows": len(buckets[index]), "steps": steps})
+    return timeline
+
+
+# -------------------------------------------------------------------
+# Runner
+# -------------------------------------------------------------------
+
+
+async def _soak(args, scenarios: list, sampler: ProcessSampler, base_url: str) -> dict:
+    duration = parse_duration(args.soak)
+    slots = [_Slot(args.flow, base_url)
+             for _ in range(args.max_in_flight if args.rate else (args.concurrency or 1))]
+    resources, flows = [], []
+    counters = {"scheduled": 0, "missed": 0}
+    started = time.monotonic()
+    deadline = started + duration
+    samples_file = open(SAMPLES, "w")
+
+    def record(kind, entry):
+        entry = {"type": kind, "t": round(time.monotonic() - started, 1), **entry}
+        samples_file.write(json.dumps(entry) + "\n")
+        samples_file.flush()
+        return entry
+
+    async def sample_resources():
+        while time.monotonic() < deadline:
+            try:
+                r = record("resource", await asyncio.to_thread(sampler.sample))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[soak] resource sample failed: {e}")
+            else:
+                resources.append(r)
+                failed = sum(1 for f in flows if not f["passed"])
+                print(f"[soak] {r['t']:>7.0f}s  flows={len(flows)} failed={failed} missed={counters['missed']}"
+                      f"  rss={r['rss_mb']}MB fds={r['fds']} threads={r['threads']}", flush=True)
+            await asyncio.sleep(args.sample_interval)
+
+    async def run_one(playwright, slot, scenario):
+        result = await slot.run(playwright, scenario)
+        flows.append(record("flow", {
+            "scenario": result["scenario"],
+            "passed": bool(result.get("passed")),
+            "steps": result.get("steps", {}),
+            "error": result.get("error"),
+        }))
+
+    async def closed_loop(playwright, slot, offset):
+        i = offset
+        while time.monotonic() < deadline:
+            counters["scheduled"] += 1
+            await run_one(playwright, slot, scenarios[i % len(scenarios)])
+            i += len(slots)
+
+    async def open_loop(playwright):
+        idle = list(slots)
+        interval = 60.0 / args.rate
+        next_start = time.monotonic()
+        tasks = set()
+        i = 0
+        while next_start < deadline:
+            await asyncio.sleep(max(0.0, next_start - time.monotonic()))
+            next_start += interval
+            counters["scheduled"] += 1
+            if not idle:
+                counters["missed"] += 1
+                continue
+            slot = idle.pop()
+
+            async def run_and_release(slot=slot, scenario=scenarios[i % len(scenarios)]):
+                try:
+                    await run_one(playwright, slot, scenario)
+                finally:
+                    idle.append(slot)
+
+            task = asyncio.ensure_future(run_and_release())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            i += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def drive(playwright):
+        sampler_task = asyncio.ensure_future(sample_resources())
+        try:
+            if args.rate:
+                await open_loop(playwright)
+            else:
+                await asyncio.gather(*(closed_loop(playwright, s, n) for n, s in enumerate(slots)))
+        finally:
+            sampler_task.cancel()
+            for slot in slots:
+                await slot.close()
+
+    try:
+        if args.flow == "browser":
+            from playwright.async_api import async_playwright
+
+            async with async_playwright() as p:
+                await drive(p)
+        else:
+            await drive(None)
+        try:
+            resources.append(record("resource", sampler.sample()))
+        except (OSError, ValueError, KeyError):
+            pass
+    finally:
+        samples_file.close()
+
+    elapsed = time.monotonic() - started
+    warmup_s = min(parse_duration(args.warmup), elapsed / 2)
+    checks = analyze(resources, flows, counters["scheduled"], counters["missed"], args, warmup_s)
+    return {
+        "duration_s": round(elapsed, 1),
+        "mode": f"rate {args.rate}/min" if args.rate else f"concurrency {len(slots)}",
+        "flow": args.flow,
+        "scenarios": [s["name"] for s in scenarios],
+        "warmup_s": warmup_s,
+        "flows": len(flows),
+        "scheduled": counters["scheduled"],
+        "missed": counters["missed"],
+        "server_restarts": len({r["pid"] for r in resources}) - 1,
+        "passed": all(c["result"] != "FAIL" for c in checks),
+        "checks": checks,
+        "resources": resources,
+        "latency": latency_timeline(flows, max(args.sample_interval, elapsed / 20)),
+        "samples": os.path.relpath(SAMPLES, DIR),
+    }
+
+
+def print_report(report: dict) -> None:
+    print("\n" + "=" * 72)
+    print(f"  Soak: {report['duration_s']}s, {report['mode']}, {report['flow']} flow, "
+          f"{report['flows']} flows ({report['missed']} missed)")
+    print("-" * 72)
+    print(f"  {'Check':<32} {'Value':>10} {'Limit':>8}  Result  Detail")
+    for c in report["checks"]:
+        value = "-" if c["value"] is None else c["value"]
+        limit = "-" if c["limit"] is None else c["limit"]
+        print(f"  {c['check']:<32} {value!s:>10} {limit!s:>8}  {c['result']:<6}  {c['detail']}")
+    print("-" * 72)
+    if report["server_restarts"]:
+        print(f"  Note: the server process restarted {report['server_restarts']} time(s) during the run")
+    print(f"  Overall: {'PASS' if report['passed'] else 'FAIL'}")
+    print("=" * 72)
+
+
+def run_soak(args, server_pid: int, base_url: str) -> int:
+    """Run soak mode with the parsed arguments; returns the process exit code."""
+    from e2e_scenarios import discover_scenarios
+
+    scenarios = discover_scenarios()
+    if args.only:
+        unknown = set(args.only) - {s["name"] for s in scenarios}
+        if unknown:
+            print(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+            return 2
+        scenarios = [s for s in scenarios if s["name"] in args.only]
+
+    report = asyncio.run(_soak(args, scenarios, ProcessSampler(server_pid), base_url))
+    with open(args.soak_report, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nReport: {os.path.relpath(args.soak_report, DIR)} (samples: {report['samples']})")
+    return 0 if report["passed"] else 1
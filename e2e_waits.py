@@ -0,0 +1,91 @@
+"""
+Readiness conditions for the Playwright E2E tests.
+
+The Unified Checkout widget renders into cross-origin iframes (buttonlist,
+mce, 3DS/ACS), which page.wait_for_function() cannot see into. These helpers
+wait on the frame tree itself: they return as soon as a frame whose URL
+matches and that contains the requested element exists, instead of sleeping
+for a fixed time and hoping it has appeared.
+"""
+
+import os
+import time
+
+POLL_INTERVAL_MS = 100
+
+BASE_URL = os.environ.get("E2E_BASE_URL", "https://localhost:5000")
+SCREENSHOTS_DIR = os.environ.get(
+    "E2E_SCREENSHOTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_screenshots"),
+)
+
+
+async def _first_visible(frame, selector: str):
+    """Return the first visible match for selector in frame, or None."""
+    try:
+        locator = frame.locator(selector)
+        for i in range(await locator.count()):
+            if await locator.nth(i).is_visible():
+                return locator.nth(i)
+    except Exception:
+        # Frame detached or navigating mid-check
+        pass
+    return None
+
+
+async def wait_for_frame(page, url_part: str, selector: str, timeout: float = 30000):
+    """
+    Wait until a frame whose URL contains url_part has a visible selector.
+
+    Returns the frame, or None on timeout.
+    """
+    deadline = time.monotonic() + timeout / 1000
+    while True:
+        for frame in page.frames:
+            if url_part in frame.url and await _first_visible(frame, selector):
+                return frame
+        if time.monotonic() >= deadline:
+            return None
+        await page.wait_for_timeout(POLL_INTERVAL_MS)
+
+
+async def wait_for_selector_in_any_frame(page, selector: str, timeout: float = 30000):
+    """
+    Wait until selector is visible in any frame of the page.
+
+    Returns (frame, locator), or (None, None) on timeout.
+    """
+    deadline = time.monotonic() + timeout / 1000
+    while True:
+        for frame in page.frames:
+            locator = await _first_visible(frame, selector)
+            if locator:
+                return frame, locator
+        if time.monotonic() >= deadline:
+            return None, None
+        await page.wait_for_timeout(POLL_INTERVAL_MS)
+
+
+async def wait_for_widget_ready(page, timeout: float = 30000):
+    """
+    Wait for the UC button list to be interactive.
+
+    Returns the buttonlist frame once it shows an enabled button, or None.
+    """
+    await page.wait_for_function(
+        """() => {
+            const c = document.getElementById('buttonPaymentListContainer');
+            return c && c.querySelectorAll('iframe').length > 0;
+        }""",
+        timeout=timeout,
+    )
+    return await wait_for_frame(page, "buttonlist", "button:enabled", timeout)
+
+
+async def wait_for_payment_result(page, timeout: float = 30000) -> bool:
+    """Wait for navigation to /process-payment; return True if it happened."""
+    try:
+        await page.wait_for_url("**/process-payment*", timeout=timeout, wait_until="load")
+        return True
+    except Exception:
+        return False
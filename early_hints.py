@@ -0,0 +1,47 @@
+"""
+103 Early Hints for the Werkzeug development server.
+
+WSGI has no API for informational responses, so EarlyHintsRequestHandler
+puts a callable in the environ under EARLY_HINTS_KEY that writes a
+``103 Early Hints`` response with the given Link values straight to the
+socket, the same way Werkzeug itself answers ``Expect: 100-continue``.
+Views call send_early_hints(); under servers without the hook it is a no-op
+and only the final response's Link header is sent (which CDNs and proxies
+such as nginx can turn into a 103 themselves).
+"""
+
+from werkzeug.serving import WSGIRequestHandler
+
+EARLY_HINTS_KEY = "uc.early_hints"
+
+
+class EarlyHintsRequestHandler(WSGIRequestHandler):
+    """Werkzeug request handler that can send 103 Early Hints."""
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ[EARLY_HINTS_KEY] = self._send_early_hints
+        return environ
+
+    def _send_early_hints(self, links) -> bool:
+        # 1xx responses are HTTP/1.1 only, on both sides (Werkzeug answers
+        # with HTTP/1.1 when threaded, which app.run() is by default)
+        if self.request_version != "HTTP/1.1" or self.protocol_version != "HTTP/1.1" or not links:
+            return False
+        lines = ["HTTP/1.1 103 Early Hints\r\n"]
+        lines += [f"Link: {link}\r\n" for link in links]
+        lines.append("\r\n")
+        self.wfile.write("".join(lines).encode("latin-1"))
+        self.wfile.flush()
+        return True
+
+
+def send_early_hints(environ, links) -> bool:
+    """Send a 103 with the Link values if the server supports it; return whether it was sent."""
+    send = environ.get(EARLY_HINTS_KEY)
+    if send is None:
+        return False
+    try:
+        return send(links)
+    except OSError:
+        return False
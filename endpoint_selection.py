@@ -0,0 +1,123 @@
+"""
+Latency-aware choice between several CyberSource run environments.
+
+run_environments in config.ini lists hosts that can serve the same merchant:
+regional hosts, and proxies in front of them. For every call the selector
+records its outcome, and per host keeps an exponentially weighted moving
+average (EWMA) of latency (successful calls) and of the error rate. A 5xx
+response or a connection failure counts as an error; a 4xx response means
+the host answered, so it does not.
+
+choose() returns the fastest healthy host:
+
+- Hosts that have no latency sample yet are tried first, so every host gets
+  measured.
+- A host is healthy while its error EWMA is below max_error_rate. Errors
+  drain it out gradually, not all at once: it is skipped with probability
+  error_ewma / max_error_rate, and that traffic goes to the next fastest host.
+- Once a host is unhealthy it gets one probe call per probe_interval
+  seconds. Successful probes bring its error EWMA back down.
+- A small share of calls (explore_ratio) goes to another healthy host, so
+  the latency figures of hosts that are not the fastest stay current.
+"""
+
+import random
+import threading
+import time
+
+
+class EndpointStats:
+    """EWMA latency / error rate and counters for one host."""
+
+    __slots__ = ("host", "latency_ewma", "error_ewma", "calls", "errors", "last_probe", "last_error")
+
+    def __init__(self, host: str):
+        self.host = host
+        self.latency_ewma = None
+        self.error_ewma = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_probe = 0.0
+        self.last_error = None
+
+    def as_dict(self, max_error_rate: float) -> dict:
+        return {
+            "host": self.host,
+            "healthy": self.error_ewma < max_error_rate,
+            "latencyEwmaMs": None if self.latency_ewma is None else round(self.latency_ewma, 1),
+            "errorRateEwma": round(self.error_ewma, 4),
+            "calls": self.calls,
+            "errors": self.errors,
+            "lastError": self.last_error,
+        }
+
+
+class EndpointSelector:
+    """Pick a host per call from EWMA latency and error tracking (see module docstring)."""
+
+    def __init__(self, hosts, alpha: float = 0.2, max_error_rate: float = 0.5,
+                 probe_interval: float = 10.0, explore_ratio: float = 0.05, rng=None):
+        if not hosts:
+            raise ValueError("At least one run environment is required")
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.probe_interval = probe_interval
+        self.explore_ratio = explore_ratio
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._endpoints = {host: EndpointStats(host) for host in hosts}
+
+    def choose(self) -> str:
+        now = time.monotonic()
+        with self._lock:
+            endpoints = list(self._endpoints.values())
+            healthy = [e for e in endpoints if e.error_ewma < self.max_error_rate]
+            for endpoint in endpoints:
+                if endpoint.error_ewma >= self.max_error_rate and now - endpoint.last_probe >= self.probe_interval:
+                    endpoint.last_probe = now
+                    return endpoint.host
+            if not healthy:
+                return min(endpoints, key=lambda e: e.error_ewma).host
+
+            healthy.sort(key=lambda e: e.latency_ewma or 0.0)
+            if len(healthy) > 1 and self._rng.random() < self.explore_ratio:
+                return self._rng.choice(healthy[1:]).host
+            for endpoint in healthy:
+                if self._rng.random() >= endpoint.error_ewma / self.max_error_rate:
+                    return endpoint.host
+            return min(healthy, key=lambda e: e.error_ewma).host
+
+    def record(self, host: str, elapsed_ms: float, ok: bool, error: str = None) -> None:
+        """Feed one call's outcome into the host's averages."""
+        with self._lock:
+            endpoint = self._endpoints.get(host)
+            if endpoint is None:
+                return
+            endpoint.calls += 1
+            endpoint.error_ewma += self.alpha * ((0.0 if ok else 1.0) - endpoint.error_ewma)
+            if ok:
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = float(elapsed_ms)
+                else:
+                    endpoint.latency_ewma += self.alpha * (elapsed_ms - endpoint.latency_ewma)
+            else:
+                endpoint.errors += 1
+                endpoint.last_error = (error or "error")[:200]
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [e.as_dict(self.max_error_rate) for e in self._endpoints.values()]
+
+
+_selectors = {}
+_selectors_lock = threading.Lock()
+
+
+def get_endpoint_selector(hosts, **settings) -> EndpointSelector:
+    """Return this process's selector for these hosts and settings (created on first use)."""
+    key = (tuple(hosts), tuple(sorted(settings.items())))
+    with _selectors_lock:
+        selector = _selectors.get(key)
+        if selector is None:
+            selector = _selectors[key] = EndpointSelector(hosts, **settings)
+        return selector
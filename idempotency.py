@@ -0,0 +1,113 @@
+"""
+Idempotency cache for form posts that trigger upstream calls.
+
+A request is identified by a client-supplied ``Idempotency-Key`` header (or
+``idempotencyKey`` form field) or, failing that, by a hash of its body within
+the browser session (the ``uc_session`` cookie), so a double-click or browser
+resubmission of the same form maps to the same key. Either way the key is
+also scoped to the path and the client's address. A request with neither a
+key nor a session is not cached at all, so clients behind one NAT address
+never share results. app.py builds the keys; this module only stores them.
+
+The first request for a key runs; concurrent repeats block until it finishes
+and then receive the same response, and later repeats within the TTL are
+answered from the cache. Failures (5xx, 429) are not cached so a retry can
+succeed.
+"""
+
+import collections
+import threading
+import time
+
+
+class IdempotencyKeyReused(ValueError):
+    """A client-supplied key was reused with a different request body."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "expires")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.expires = None
+
+
+class IdempotencyCache:
+    """In-process cache of in-flight and completed results, keyed by idempotency key."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000, wait_timeout: float = 60):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            expired = entry.expires is not None and entry.expires <= now
+            if not expired and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def run(self, key: str, fingerprint: str, fn, cacheable):
+        """
+        Return (result, replayed).
+
+        fn() produces the result; cacheable(result) decides whether it is kept
+        for repeats. fingerprint identifies the request body so a reused key
+        with different content raises IdempotencyKeyReused.
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._evict(now)
+                entry = self._entries.get(key)
+                if entry is not None and entry.fingerprint != fingerprint:
+                    raise IdempotencyKeyReused(key)
+                if entry is None:
+                    entry = _Entry(fingerprint)
+                    self._entries[key] = entry
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                if entry.done.wait(self.wait_timeout) and entry.result is not None:
+                    return entry.result, True
+                # First attempt failed (not cached) or timed out: try again ourselves
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                continue
+
+            try:
+                result = fn()
+            except BaseException:
+                with self._lock:
+                    self._entries.pop(key, None)
+                entry.done.set()
+                raise
+
+            with self._lock:
+                if cacheable(result):
+                    entry.result = result
+                    entry.expires = time.monotonic() + self.ttl
+                else:
+                    self._entries.pop(key, None)
+            entry.done.set()
+            return result, False
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_idempotency_cache(ttl: float) -> IdempotencyCache:
+    """Return the process-wide cache for the given TTL."""
+    with _caches_lock:
+        if ttl not in _caches:
+            _caches[ttl] = IdempotencyCache(ttl)
+        return _caches[ttl]
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Durable SQLite-backed job queue for work that should not block a request.
+
+Jobs are rows in a single table. A worker claims the oldest ready job inside
+an IMMEDIATE transaction and holds a lease on it for ``visibility_timeout``
+seconds; if the worker crashes or hangs, the lease expires and the job is
+delivered again. Failed jobs are retried with exponential backoff (plus
+jitter) up to ``max_attempts``, then kept as "failed" for inspection.
+
+The queue is safe to share between threads and processes (one connection
+per thread, WAL journal), so workers can run inside app.py or separately:
+
+  python job_queue.py --workers 4      # Standalone worker process
+  python job_queue.py --stats          # Print queue depth and latency
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (status, finished_at);
+"""
+
+
+class JobQueue:
+    """Jobs table with leased claims, retries and backoff."""
+
+    def __init__(
+        self,
+        db_path: str,
+        visibility_timeout: float = 30,
+        max_attempts: int = 5,
+        backoff_base: float = 2,
+        backoff_max: float = 300,
+    ):
+        self.db_path = db_path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        # Called after each enqueue so in-process workers wake up immediately
+        self.listeners = []
+        # Notified when a job finishes or is rescheduled, for wait()
+        self._finished = threading.Condition()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload, dedupe_key: str = None, delay: float = 0) -> int:
+        """
+        Add a job and return its id.
+
+        A job with the same dedupe_key as an existing job is not added again;
+        the existing job's id is returned.
+        """
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs (kind, payload, dedupe_key, available_at, enqueued_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (kind, json.dumps(payload), dedupe_key, now + delay, now),
+        )
+        if cursor.rowcount:
+            for listener in self.listeners:
+                listener()
+            return cursor.lastrowid
+        return conn.execute("SELECT id FROM jobs WHERE dedupe_key = ?", (dedupe_key,)).fetchone()[0]
+
+    def claim(self, worker_id: str):
+        """Lease the oldest ready job; return (id, kind, payload, attempt) or None."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                # Ready jobs, plus running jobs whose lease expired (worker died)
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs"
+                    " WHERE status IN ('queued', 'running') AND available_at <= ?"
+                    " ORDER BY available_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                job_id, kind, payload, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, lease_owner = NULL,"
+                    " last_error = COALESCE(last_error, 'Lease expired') WHERE id = ?",
+                    (now, job_id),
+                )
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, available_at = ?,"
+                " started_at = ?, lease_owner = ? WHERE id = ?",
+                (attempts + 1, now + self.visibility_timeout, now, worker_id, job_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id, kind, json.loads(payload), attempts + 1
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """Mark a leased job done; False if the lease was lost to another worker."""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, lease_owner = NULL, last_error = NULL"
+            " WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (time.time(), job_id, worker_id),
+        )
+        self._notify_finished()
+        return bool(cursor.rowcount)
+
+    def fail(self, job_id: int, worker_id: str, attempt: int, error: str) -> None:
+        """Schedule a retry with backoff, or give up after max_attempts."""
+        now = time.time()
+        if attempt >= self.max_attempts:
+            status, available_at, finished_at = "failed", now, now
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            status, available_at, finished_at = "queued", now + delay * random.uniform(0.8, 1.2), None
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, available_at = ?, finished_at = ?, lease_owner = NULL,"
+            " last_error = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (status, available_at, finished_at, error[-2000:], job_id, worker_id),
+        )
+        self._notify_finished()
+
+    def _notify_finished(self) -> None:
+        with self._finished:
+            self._finished.notify_all()
+
+    def job(self, job_id: int):
+        """One job's state as a dict, or None if there is no such job."""
+        row = self._connect().execute(
+            "SELECT id, kind, status, attempts, enqueued_at, started_at, finished_at, last_error"
+            " FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "status", "attempts", "enqueued_at", "started_at", "finished_at", "last_error")
+        return dict(zip(keys, row))
+
+    def wait(self, job_id: int, timeout: float, poll_interval: float = 0.5):
+        """
+        Return job(job_id) once it is done or failed, or as it is after timeout.
+
+        In-process workers wake the waiter as soon as they finish a job; jobs
+        run by other processes are noticed within poll_interval.
+        """
+        deadline = time.monotonic() + timeout
+        with self._finished:
+            while True:
+                # Read under the condition so a notify cannot slip in before wait()
+                job = self.job(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in ("done", "failed") or remaining <= 0:
+                    return job
+                self._finished.wait(min(poll_interval, remaining))
+
+    def purge(self, older_than: float) -> int:
+        """Delete done jobs finished more than older_than seconds ago."""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?",
+            (time.time() - older_than,),
+        )
+        return cursor.rowcount
+
+    def stats(self, window: int = 1000) -> dict:
+        """Queue depth by state, oldest ready job age and recent job latency percentiles."""
+        now = time.time()
+        conn = self._connect()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        ready, oldest = conn.execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM jobs WHERE status = 'queued' AND available_at <= ?",
+            (now,),
+        ).fetchone()
+        recent = conn.execute(
+            "SELECT finished_at - enqueued_at, finished_at - started_at FROM jobs"
+            " WHERE status = 'done' ORDER BY finished_at DESC LIMIT ?",
+            (window,),
+        ).fetchall()
+        return {
+            "ready": ready,
+            "delayed": counts.get("queued", 0) - ready,
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_ready_age_s": round(now - oldest, 3) if oldest else 0.0,
+            "latency_s": _percentiles([r[0] for r in recent]),
+            "run_time_s": _percentiles([r[1] for r in recent]),
+        }
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[int(q * (len(values) - 1))], 3)
+
+    return {"count": len(values), "p50": pick(0.5), "p95": pick(0.95), "max": round(values[-1], 3)}
+
+
+class WorkerPool:
+    """Threads that claim jobs and dispatch them to handlers by kind."""
+
+    def __init__(self, queue: JobQueue, handlers: dict, workers: int = 2, poll_interval: float = 0.5):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self) -> "WorkerPool":
+        self.queue.listeners.append(self.notify)
+        for i in range(self.workers):
+            worker_id = f"{os.getpid()}-{i}-{uuid.uuid4().hex[:8]}"
+            thread = threading.Thread(
+                target=self._run, args=(worker_id,), name=f"job-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def notify(self) -> None:
+        """Wake idle workers (called after an in-process enqueue)."""
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 5) -> None:
+        if self.notify in self.queue.listeners:
+            self.queue.listeners.remove(self.notify)
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker_id)
+            except sqlite3.Error as e:
+                print(f"[jobs] claim failed: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, kind, payload, attempt = job
+            handler = self.handlers.get(kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for job kind '{kind}'")
+                handler(payload)
+            except Exception:
+                error = traceback.format_exc()
+                print(f"[jobs] {kind} #{job_id} attempt {attempt} failed: {error.strip().splitlines()[-1]}")
+                self.queue.fail(job_id, worker_id, attempt, error)
+            else:
+                self.queue.complete(job_id, worker_id)
+
+
+_queues = {}
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_job_queue(db_path: str, **settings) -> JobQueue:
+    """Return this process's queue for db_path (created on first use)."""
+    with _lock:
+        if db_path not in _queues:
+            _queues[db_path] = JobQueue(db_path, **settings)
+        return _queues[db_path]
+
+
+def start_worker_pool(queue: JobQueue, handlers: dict, workers: int) -> WorkerPool:
+    """Start (once per queue and process) and return the worker pool."""
+    with _lock:
+        pool = _pools.get(queue.db_path)
+        if pool is None:
+            pool = _pools[queue.db_path] = WorkerPool(queue, handlers, workers).start()
+        return pool
+
+
+def main():
+    from data.configuration import MerchantConfiguration
+    from payment_jobs import HANDLERS
+
+    parser = argparse.ArgumentParser(description="Run job queue workers")
+    parser.add_argument("--workers", type=int, help="Worker threads (default: job_workers from config.ini)")
+    parser.add_argument("--stats", action="store_true", help="Print queue stats and exit")
+    parser.add_argument("--purge-days", type=float, help="Delete done jobs older than N days and exit")
+    args = parser.parse_args()
+
+    config = MerchantConfiguration()
+    queue = get_job_queue(
+        config.job_queue_db,
+        visibility_timeout=config.job_visibility_timeout_seconds,
+        max_attempts=config.job_max_attempts,
+        backoff_base=config.job_retry_backoff_seconds,
+    )
+    if args.stats:
+        print(json.dumps(queue.stats(), indent=2))
+        return 0
+    if args.purge_days is not None:
+        print(f"Purged {queue.purge(args.purge_days * 86400)} job(s)")
+        return 0
+
+    workers = args.workers or config.job_workers or 1
+    pool = WorkerPool(queue, HANDLERS, workers).start()
+    print(f"Running {workers} worker(s) on {config.job_queue_db} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Upstream latency report from the CyberSource SDK logs and E2E run logs.
+
+Reads every rotated SDK log (log/cybs.log, cybs.log.1 ... .10, and .gz
+copies) plus e2e_run.log line by line, never whole files. It recognises:
+
+  SDK REQUEST id=<id> POST <path> ...          written by app.py before each
+  SDK RESPONSE id=<id> status=<s> elapsed_ms=  SDK call and after it returns
+  CALL TO METHOD `<method>` STARTED            the SDK's own entry (count only)
+  "POST /api/... HTTP/1.1" 200                 Werkzeug access lines (count only)
+
+Requests and responses are paired by id, also across rotated files, and
+each pair's latency goes into a mergeable sketch per (endpoint, status):
+elapsed_ms when logged, otherwise the timestamp difference. Requests that
+never got a response are reported as unanswered.
+
+Large inputs are split into byte ranges on line boundaries and scanned in
+parallel worker processes; each worker returns sketches and unpaired
+entries, which are merged at the end.
+
+Usage:
+  python log_analyzer.py                                 # log/cybs* + e2e_run.log, summary table
+  python log_analyzer.py --since "2026-10-18" --until "2026-10-19" --bucket hour
+  python log_analyzer.py --csv latency.csv               # Also write the table as CSV
+  python log_analyzer.py /archive/cybs.log.* --jobs 8
+"""
+
+import argparse
+import csv
+import glob
+import gzip
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from rum_metrics import LatencySketch
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUTS = (os.path.join(DIR, "log", "cybs*"), os.path.join(DIR, "e2e_run.log"))
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# "2026-10-19 10:00:00,123 - <logger> - INFO - <message>" (milliseconds only
+# with the SDK's masking formatter)
+_SDK_LINE = re.compile(rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(\d{3}))? - [^-]*- \w+ - (.*)$")
+_REQUEST = re.compile(rb"SDK REQUEST id=(\S+) (\S+) (\S+)")
+_RESPONSE = re.compile(rb"SDK RESPONSE id=(\S+) status=(\S+)(?: elapsed_ms=([\d.]+))?")
+_SDK_CALL = re.compile(rb"CALL TO METHOD `(\w+)` STARTED")
+# Werkzeug: 127.0.0.1 - - [19/Oct/2026 10:00:00] "POST /checkout HTTP/1.1" 200 -
+_ACCESS = re.compile(rb'\[(\d\d/\w{3}/\d{4} \d\d:\d\d:\d\d)\] "(\w+) (\S+?)(?:\?\S*)? HTTP/[\d.]+" (\d{3})')
+
+BUCKETS = {"none": None, "minute": 16, "hour": 13, "day": 10}
+
+
+def _timestamp(stamp: bytes, millis) -> str:
+    """Normalized 'YYYY-mm-dd HH:MM:SS.fff' (sorts as text)."""
+    return f"{stamp.decode()}.{(millis or b'000').decode()}"
+
+
+def _seconds(timestamp: str) -> float:
+    return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f").timestamp()
+
+
+def _bucket(timestamp: str, bucket: str) -> str:
+    width = BUCKETS[bucket]
+    return timestamp[:width] if width else "all"
+
+
+def _in_range(timestamp: str, since, until) -> bool:
+    return (since is None or timestamp >= since) and (until is None or timestamp < until)
+
+
+def _normalize_bound(text):
+    """'2026-10-18', '2026-10-18 13:00' etc. -> comparable timestamp prefix."""
+    if text is None:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d %H", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S.000")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time '{text}' (use YYYY-mm-dd[ HH[:MM[:SS]]])")
+
+
+# -------------------------------------------------------------------
+# Scanning (runs in worker processes)
+# -------------------------------------------------------------------
+
+
+def _lines(path: str, start: int, end: int):
+    """Lines that start within [start, end) of path; .gz files are read whole."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            yield from f
+        return
+    with open(path, "rb") as f:
+        position = start
+        if start:
+            # The line straddling start belongs to the previous chunk
+            f.seek(start - 1)
+            position = start - 1 + len(f.readline())
+        for line in f:
+            if position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def scan(path: str, start: int, end: int, since, until, bucket: str) -> dict:
+    """Scan one byte range; return sketches, counters and entries left unpaired."""
+    latency = {}
+    pending = {}  # id -> (timestamp, endpoint)
+    responses = {}  # id -> (timestamp, status, elapsed_ms)
+    sdk_calls = Counter()
+    access = Counter()
+    lines = 0
+
+    for line in _lines(path, start, end):
+        lines += 1
+        if b"SDK RE" in line or b"CALL TO METHOD" in line:
+            match = _SDK_LINE.match(line.rstrip(b"\r\n"))
+            if match is None:
+                continue
+            timestamp = _timestamp(match.group(1), match.group(2))
+            message = match.group(3)
+            request = _REQUEST.match(message)
+            if request:
+                endpoint = f"{request.group(2).decode()} {request.group(3).decode()}"
+                call_id = request.group(1).decode()
+                response = responses.pop(call_id, None)
+                if response is None:
+                    pending[call_id] = (timestamp, endpoint)
+                else:
+                    _add_pair(latency, (timestamp, endpoint), response, since, until, bucket)
+                continue
+            response = _RESPONSE.match(message)
+            if response:
+                call_id = response.group(1).decode()
+                elapsed = float(response.group(3)) if response.group(3) else None
+                entry = (timestamp, response.group(2).decode(), elapsed)
+                request_entry = pending.pop(call_id, None)
+                if request_entry is None:
+                    responses[call_id] = entry
+                else:
+                    _add_pair(latency, request_entry, entry, since, until, bucket)
+                continue
+            call = _SDK_CALL.search(message)
+            if call and _in_range(timestamp, since, until):
+                sdk_calls[(_bucket(timestamp, bucket), call.group(1).decode())] += 1
+        elif b"HTTP/" in line:
+            match = _ACCESS.search(line)
+            if match is None:
+                continue
+            stamp = datetime.strptime(match.group(1).decode(), "%d/%b/%Y %H:%M:%S")
+            timestamp = stamp.strftime("%Y-%m-%d %H:%M:%S.000")
+            if _in_range(timestamp, since, until):
+                key = (_bucket(timestamp, bucket), f"{match.group(2).decode()} {match.group(3).decode()}",
+                       match.group(4).decode())
+                access[key] += 1
+
+    return {"latency": latency, "pending": pending, "responses": responses,
+            "sdk_calls": sdk_calls, "access": access, "lines": lines}
+
+
+def _add_pair(latency: dict, request_entry, response_entry, since, until, bucket) -> None:
+    request_ts, endpoint = request_entry
+    response_ts, status, elapsed = response_entry
+    if not _in_range(request_ts, since, until):
+        return
+    if elapsed is None:
+        elapsed = max(0.0, (_seconds(response_ts) - _seconds(request_ts)) * 1000)
+    key = (_bucket(request_ts, bucket), endpoint, status)
+    sketch = latency.get(key)
+    if sketch is None:
+        sketch = latency[key] = LatencySketch()
+    sketch.add(elapsed)
+
+
+# -------------------------------------------------------------------
+# Planning and merging
+# -------------------------------------------------------------------
+
+
+def expand_inputs(patterns) -> list:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or ([pattern] if os.path.isfile(pattern) else [])
+        paths.extend(p for p in matches if os.path.isfile(p) and p not in paths)
+    return paths
+
+
+def plan_chunks(paths, chunk_bytes: int = None) -> list:
+    """(path, start, end) ranges of about chunk_bytes; gzip files are one range each."""
+    chunk_bytes = chunk_bytes or CHUNK_BYTES
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if path.endswith(".gz") or size <= chunk_bytes:
+            chunks.append((path, 0, size))
+            continue
+        for start in range(0, size, chunk_bytes):
+            chunks.append((path, start, min(size, start + chunk_bytes)))
+    return chunks
+
+
+def analyze(paths, since=None, until=None, bucket: str = "none", jobs: int = 0, chunk_bytes: int = None) -> dict:
+    """Scan all paths (in parallel when there is more than one chunk) and merge."""
+    chunks = plan_chunks(paths, chunk_bytes)
+    args = [(path, start, end, since, until, bucket) for path, start, end in chunks]
+    jobs = min(jobs or os.cpu_count() or 1, len(chunks))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(scan, *zip(*args)))
+    else:
+        results = [scan(*a) for a in args]
+
+    merged = {"latency": {}, "sdk_calls": Counter(), "access": Counter(), "lines": 0,
+              "files": len(paths), "chunks": len(chunks)}
+    pending, responses = {}, {}
+    for result in results:
+        for key, sketch in result["latency"].items():
+            if key in merged["latency"]:
+                merged["latency"][key].merge(sketch)
+            else:
+                merged["latency"][key] = sketch
+        merged["sdk_calls"].update(result["sdk_calls"])
+        merged["access"].update(result["access"])
+        merged["lines"] += result["lines"]
+        pending.update(result["pending"])
+        responses.update(result["responses"])
+
+    # Pairs split across chunks or rotated files
+    orphans = 0
+    for call_id, response in responses.items():
+        request_entry = pending.pop(call_id, None)
+        if request_entry is None:
+            orphans += 1
+        else:
+            _add_pair(merged["latency"], request_entry, response, since, until, bucket)
+    merged["unanswered"] = Counter(
+        (_bucket(ts, bucket), endpoint) for ts, endpoint in pending.values() if _in_range(ts, since, until)
+    )
+    merged["orphan_responses"] = orphans
+    return merged
+
+
+# -------------------------------------------------------------------
+# Output
+# -------------------------------------------------------------------
+
+LATENCY_COLUMNS = ("bucket", "endpoint", "status", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")
+
+
+def latency_rows(merged: dict) -> list:
+    rows = []
+    for (bucket, endpoint, status), sketch in sorted(merged["latency"].items()):
+        summary = sketch.summary(quantiles=(0.5, 0.9, 0.99))
+        rows.append({
+            "bucket": bucket, "endpoint": endpoint, "status": status, "count": sketch.count,
+            "mean_ms": summary["mean"], "p50_ms": summary["p50"], "p90_ms": summary["p90"],
+            "p99_ms": summary["p99"], "max_ms": summary["max"],
+        })
+    for (bucket, endpoint), count in sorted(merged["unanswered"].items()):
+        rows.append({"bucket": bucket, "endpoint": endpoint, "status": "no response", "count": count})
+    return rows
+
+
+def print_tables(merged: dict, rows: list, show_bucket: bool) -> None:
+    print(f"Scanned {merged['lines']:,} lines in {merged['files']} file(s) ({merged['chunks']} chunk(s))\n")
+    columns = LATENCY_COLUMNS if show_bucket else LATENCY_COLUMNS[1:]
+    widths = {c: max([len(c)] + [len(str(r.get(c, ""))) for r in rows]) for c in columns}
+    print("Upstream latency (SDK REQUEST/RESPONSE pairs)")
+    if rows:
+        print("  " + "  ".join(c.ljust(widths[c]) if c in ("bucket", "endpoint", "status")
+                               else c.rjust(widths[c]) for c in columns))
+        for r in rows:
+            print("  " + "  ".join(str(r.get(c, "")).ljust(widths[c]) if c in ("bucket", "endpoint", "status")
+                                   else str(r.get(c, "")).rjust(widths[c]) for c in columns))
+    else:
+        print("  (no paired entries)")
+    if merged["orphan_responses"]:
+        print(f"  {merged['orphan_responses']} response(s) without a request (rotated out?)")
+
+    for title, counter in (
+        ("SDK method calls (CALL TO METHOD, no timing)", merged["sdk_calls"]),
+        ("Server requests (Werkzeug access log)", merged["access"]),
+    ):
+        if not counter:
+            continue
+        print(f"\n{title}")
+        for key, count in sorted(counter.items()):
+            name = " ".join(key if show_bucket else key[1:])
+            print(f"  {name:<60} {count:>8}")
+
+
+def write_csv(path: str, rows: list) -> None:
+    with (open(path, "w", newline="") if path != "-" else sys.stdout) as f:
+        writer = csv.DictWriter(f, fieldnames=LATENCY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency distributions from SDK and E2E logs")
+    parser.add_argument("inputs", nargs="*", help="Files or globs (default: log/cybs* and e2e_run.log)")
+    parser.add_argument("--since", help="Only requests at or after this time (YYYY-mm-dd[ HH[:MM[:SS]]])")
+    parser.add_argument("--until", help="Only requests before this time")
+    parser.add_argument("--bucket", choices=tuple(BUCKETS), default="none", help="Group rows by time")
+    parser.add_argument("--csv", metavar="PATH", help="Write the latency table as CSV ('-' for stdout)")
+    parser.add_argument("--jobs", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 2**20,
+                        help="Split files larger than this into parallel ranges (default 64)")
+    args = parser.parse_args()
+
+    try:
+        since, until = _normalize_bound(args.since), _normalize_bound(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    paths = expand_inputs(args.inputs or DEFAULT_INPUTS)
+    if not paths:
+        print("No log files found.")
+        return 1
+
+    merged = analyze(paths, since, until, args.bucket, args.jobs, int(args.chunk_mb * 2**20))
+    rows = latency_rows(merged)
+    if args.csv == "-":
+        write_csv("-", rows)
+        return 0
+    print_tables(merged, rows, args.bucket != "none")
+    if args.csv:
+        write_csv(args.csv, rows)
+        print(f"\nCSV: {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Memory diagnostics for long-running workers.
+
+A session starts tracemalloc and records a baseline: a snapshot, per-type
+live object counts (gc.get_objects()) and RSS. Reports diff the current
+state against that baseline, grouped by allocating line (or file, or full
+traceback), so growth points at the code that allocated it. tracemalloc is
+only on between start() and stop(); outside a session the per-request hook
+returns immediately.
+
+Soak mode watches growth per request window: every ``window`` requests it
+checks traced memory and RSS, and flags a leak once traced memory grew by
+more than ``threshold_kb`` per 1,000 requests in ``confirm_windows``
+consecutive windows (a single window is usually cache warm-up). The top
+growing lines are captured when the leak is first flagged.
+"""
+
+import gc
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def type_counts() -> Counter:
+    """Live gc-tracked objects per type name."""
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+
+def _top_stats(snapshot, baseline, group_by: str, limit: int) -> list:
+    stats = snapshot.compare_to(baseline, group_by)
+    result = []
+    for stat in stats[:limit]:
+        frames = stat.traceback.format() if group_by == "traceback" else [str(stat.traceback[0])]
+        result.append({
+            "where": frames if group_by == "traceback" else frames[0],
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        })
+    return result
+
+
+class MemoryTracker:
+    """One diagnostics session: baseline, reports and optional soak checks."""
+
+    def __init__(self, frames: int = 10, soak: bool = False, window: int = 1000,
+                 threshold_kb: float = 256, confirm_windows: int = 3):
+        self.frames = frames
+        self.soak = soak
+        self.window = window
+        self.threshold_kb = threshold_kb
+        self.confirm_windows = confirm_windows
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        self.requests = 0
+        self.windows = []
+        self.leak = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        gc.collect()
+        self.baseline = _snapshot()
+        self.baseline_types = type_counts()
+        self.baseline_rss = rss_bytes()
+        self.baseline_traced = tracemalloc.get_traced_memory()[0]
+        self.started_at = time.time()
+        self._last_checkpoint = (0, self.baseline_traced, self.baseline_rss)
+
+    def stop(self) -> None:
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            due = self.soak and self.requests % self.window == 0
+        if due:
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        traced = tracemalloc.get_traced_memory()[0]
+        rss = rss_bytes()
+        with self._lock:
+            last_requests, last_traced, last_rss = self._last_checkpoint
+            per_1k = 1000 / max(1, self.requests - last_requests)
+            window = {
+                "requests": self.requests,
+                "traced_growth_kb_per_1k": round((traced - last_traced) / 1024 * per_1k, 1),
+                "rss_growth_kb_per_1k": round((rss - last_rss) / 1024 * per_1k, 1),
+            }
+            self.windows.append(window)
+            del self.windows[:-100]
+            self._last_checkpoint = (self.requests, traced, rss)
+            recent = self.windows[-self.confirm_windows:]
+            leaking = len(recent) == self.confirm_windows and all(
+                w["traced_growth_kb_per_1k"] > self.threshold_kb for w in recent
+            )
+            flag = leaking and self.leak is None
+        if flag:
+            self.leak = {
+                "detected_at_requests": window["requests"],
+                "traced_growth_kb_per_1k": window["traced_growth_kb_per_1k"],
+                "top_growth": _top_stats(_snapshot(), self.baseline, "lineno", 10),
+            }
+            print(
+                f"[memory] Possible leak: +{window['traced_growth_kb_per_1k']} KiB per 1k requests "
+                f"for {self.confirm_windows} windows (threshold {self.threshold_kb} KiB)"
+            )
+
+    def report(self, group_by: str = "lineno", limit: int = 25) -> dict:
+        gc.collect()
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        types_now = type_counts()
+        type_diff = Counter(types_now)
+        type_diff.subtract(self.baseline_types)
+        report = {
+            "elapsed_s": round(time.time() - self.started_at, 1),
+            "requests": self.requests,
+            "rss_mb": round(rss / 2**20, 1),
+            "rss_growth_mb": round((rss - self.baseline_rss) / 2**20, 2),
+            "traced_mb": round(traced / 2**20, 2),
+            "traced_peak_mb": round(peak / 2**20, 2),
+            "traced_growth_mb": round((traced - self.baseline_traced) / 2**20, 2),
+            "top_growth": _top_stats(_snapshot(), self.baseline, group_by, limit),
+            "object_count_growth": [
+                {"type": name, "count": types_now[name], "diff": diff}
+                for name, diff in type_diff.most_common(limit)
+                if diff > 0
+            ],
+        }
+        if self.requests:
+            report["traced_growth_kb_per_1k_requests"] = round(
+                (traced - self.baseline_traced) / 1024 * 1000 / self.requests, 1
+            )
+        if self.soak:
+            report["soak"] = {
+                "window": self.window,
+                "threshold_kb_per_1k": self.threshold_kb,
+                "leak_detected": self.leak is not None,
+                "leak": self.leak,
+                "windows": self.windows[-10:],
+            }
+        return report
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def start_memory_session(**settings) -> MemoryTracker:
+    """Start (or restart with a new baseline) this process's session."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is not None:
+            _tracker.stop()
+        _tracker = MemoryTracker(**settings)
+        _tracker.start()
+        return _tracker
+
+
+def stop_memory_session():
+    """End the session and return its final report (None if none was running)."""
+    global _tracker
+    with _tracker_lock:
+        tracker, _tracker = _tracker, None
+    if tracker is None:
+        return None
+    report = tracker.report()
+    tracker.stop()
+    return report
+
+
+def get_memory_tracker():
+    """The running session's tracker, or None."""
+    return _tracker
+
+
+def record_request() -> None:
+    """Per-request hook; a no-op unless a session is running."""
+    tracker = _tracker
+    if tracker is not None:
+        tracker.record_request()
@@ -0,0 +1,140 @@
+"""
+JWE decryption of widget results and message-level encryption (MLE) of
+outbound request bodies.
+
+Key material comes from PEM files: a private key (``jwe_pem_file_directory``,
+Resource/NetworkTokenCert.pem by default) decrypts JWE payloads, and a
+certificate or public key (``mle_request_cert_file``) encrypts outbound
+bodies. Each file is parsed once into jwcrypto JWK objects; later calls only
+stat() the file and reparse it when its mtime or size changes, so a rotated
+key is picked up without a restart.
+
+Outbound bodies are wrapped the same way the CyberSource SDK does it:
+``{"encryptedRequest": "<compact JWE>"}`` with RSA-OAEP-256 / A256GCM and the
+certificate serial number as ``kid``.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from jwcrypto import jwe, jwk
+
+MLE_ALG = "RSA-OAEP-256"
+MLE_ENC = "A256GCM"
+_PRIVATE_KEY_RE = re.compile(
+    rb"-----BEGIN ([A-Z ]*)PRIVATE KEY-----.+?-----END \1PRIVATE KEY-----", re.DOTALL
+)
+
+
+class KeyMaterial:
+    """Parsed keys from one PEM file."""
+
+    __slots__ = ("path", "private_jwk", "public_jwk", "kid")
+
+    def __init__(self, path, private_jwk, public_jwk, kid):
+        self.path = path
+        self.private_jwk = private_jwk
+        self.public_jwk = public_jwk
+        self.kid = kid
+
+
+def _cert_serial_number(cert) -> str:
+    """The serialNumber subject attribute (what CyberSource uses as kid), else the certificate serial."""
+    attrs = cert.subject.get_attributes_for_oid(x509.oid.NameOID.SERIAL_NUMBER)
+    return attrs[0].value if attrs else format(cert.serial_number, "x")
+
+
+def load_key_material(path: str) -> KeyMaterial:
+    """Parse a PEM private key, certificate or public key."""
+    with open(path, "rb") as f:
+        pem = f.read()
+
+    private_jwk = None
+    kid = None
+    if b"PRIVATE KEY-----" in pem:
+        # A key may share the file with its certificate; load each block on its own
+        key_pem = _PRIVATE_KEY_RE.search(pem)
+        if key_pem is None:
+            raise ValueError(f"{path}: malformed PEM private key")
+        private_key = serialization.load_pem_private_key(key_pem.group(0), password=None)
+        public_key = private_key.public_key()
+        private_jwk = jwk.JWK.from_pyca(private_key)
+    if b"CERTIFICATE-----" in pem:
+        cert = x509.load_pem_x509_certificate(pem)
+        if private_jwk is None:
+            public_key = cert.public_key()
+        kid = _cert_serial_number(cert)
+    elif private_jwk is None:
+        public_key = serialization.load_pem_public_key(pem)
+        private_jwk = None
+        kid = None
+
+    public_jwk = jwk.JWK.from_pyca(public_key)
+    if kid is None:
+        der = public_key.public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        kid = hashlib.sha256(der).hexdigest()[:32]
+    return KeyMaterial(path, private_jwk, public_jwk, kid)
+
+
+_keys = {}
+_keys_lock = threading.Lock()
+
+
+def get_key_material(path: str) -> KeyMaterial:
+    """Return the cached keys for path, reparsing only when the file changed."""
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _keys.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _keys_lock:
+        cached = _keys.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, load_key_material(path))
+            _keys[path] = cached
+        return cached[1]
+
+
+def decryption_unavailable(key_file: str):
+    """Why JWE payloads cannot be decrypted with key_file, or None when they can."""
+    if not key_file:
+        return "no jwe_pem_file configured"
+    try:
+        keys = get_key_material(key_file)
+    except (OSError, ValueError) as e:
+        return f"cannot load {key_file}: {e}"
+    if keys.private_jwk is None:
+        return f"{key_file} has no private key (a certificate or public key only)"
+    return None
+
+
+def decrypt_jwe(token: str, key_file: str) -> str:
+    """Decrypt a compact JWE with the private key in key_file."""
+    keys = get_key_material(key_file)
+    if keys.private_jwk is None:
+        raise ValueError(f"{key_file} has no private key to decrypt JWE payloads")
+    jwe_token = jwe.JWE()
+    jwe_token.deserialize(token, keys.private_jwk)
+    return jwe_token.payload.decode("utf-8")
+
+
+def encrypt_jwe(plaintext: str, key_file: str) -> str:
+    """Encrypt plaintext to the public key in key_file as a compact JWE."""
+    keys = get_key_material(key_file)
+    headers = {"alg": MLE_ALG, "enc": MLE_ENC, "kid": keys.kid, "iat": int(time.time())}
+    jwe_token = jwe.JWE(plaintext.encode("utf-8"), protected=json.dumps(headers))
+    jwe_token.add_recipient(keys.public_jwk)
+    return jwe_token.serialize(compact=True)
+
+
+def encrypt_request_body(request_json_str: str, key_file: str) -> str:
+    """Wrap a request body for MLE: {"encryptedRequest": "<JWE>"}."""
+    return json.dumps({"encryptedRequest": encrypt_jwe(request_json_str, key_file)})
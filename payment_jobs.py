@@ -0,0 +1,79 @@
+"""
+Post-payment job handlers, run by job_queue workers after /process-payment
+has enqueued the widget result.
+
+payment_result jobs write a receipt and record the TMS tokens created by
+tms.tokenCreate. Both steps are idempotent (files are named by the hash of
+the posted result and rewritten atomically), so a retried or re-delivered
+job is safe. The result is not verified, so nothing in it (a transaction ID
+included) is used in a file name.
+Register further post-payment work (e.g. order-system updates) in HANDLERS.
+"""
+
+import json
+import os
+import re
+import threading
+
+from data.configuration import MerchantConfiguration
+
+# Use with fullmatch: these strings end up in file names and job keys
+REFERENCE_RE = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+def _write_json(path: str, document) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def extract_tokens(result) -> dict:
+    """TMS token IDs (customer, paymentInstrument, ...) from an orchestrated result."""
+    if not isinstance(result, dict):
+        return {}
+    token_info = result.get("tokenInformation") or {}
+    if not isinstance(token_info, dict):
+        return {}
+    return {
+        name: value["id"]
+        for name, value in token_info.items()
+        if isinstance(value, dict) and value.get("id")
+    }
+
+
+def handle_payment_result(payload: dict) -> None:
+    """Write the receipt and token records for one completed payment."""
+    config = MerchantConfiguration()
+    reference = payload["reference"]
+    if not isinstance(reference, str) or not REFERENCE_RE.fullmatch(reference):
+        raise ValueError(f"Bad payment reference {reference!r}")
+    name = payload.get("responseHash")
+    if not isinstance(name, str) or not REFERENCE_RE.fullmatch(name):
+        raise ValueError(f"Bad receipt name {name!r}")
+    tokens = extract_tokens(payload.get("result"))
+
+    _write_json(
+        os.path.join(config.receipts_directory, f"{name}.json"),
+        {
+            "reference": reference,
+            "status": payload.get("status"),
+            "transactionId": payload.get("transactionId"),
+            "receivedAt": payload.get("receivedAt"),
+            "tokens": tokens,
+            "result": payload.get("result"),
+        },
+    )
+
+    if tokens:
+        # One record per result; re-delivery overwrites it
+        _write_json(
+            os.path.join(config.receipts_directory, "tokens", f"{name}.json"),
+            {"reference": reference, "status": payload.get("status"), "tokens": tokens},
+        )
+
+
+HANDLERS = {
+    "payment_result": handle_payment_result,
+}
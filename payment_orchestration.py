@@ -0,0 +1,313 @@
+"""
+Server-side payment orchestration.
+
+The widget's up.complete() runs Payer Authentication, authorization and TMS
+token creation one after another in the browser. In server mode the checkout
+page posts the transient token to /process-payment instead, and the server
+runs the same completeMandate steps itself as a small dependency graph. Each
+step starts as soon as the steps it needs have finished, so steps that do not
+depend on each other overlap:
+
+    fraud ──┬──> authentication ──> authorization ──┬──> discard_tokens
+            └──> tokenize (speculative) ────────────┘
+
+With speculative tokens, TMS token creation runs alongside authentication and
+authorization. If the payment is not authorized, the customer it created is
+deleted again (discard_tokens). Without speculative tokens, tokenize waits
+for a successful authorization.
+
+The SDK is reached through call(service, *args). It returns the decoded
+response body for a 2xx response and raises ServiceError for anything else,
+so this module has no SDK dependency and can be driven by stubs.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# completeMandate consumerAuthentication results that may go on to authorization
+_AUTHENTICATED = ("AUTHENTICATION_SUCCESSFUL",)
+
+# Payer Authentication results copied into the authorization request
+_AUTHENTICATION_FIELDS = (
+    "cavv",
+    "xid",
+    "eciRaw",
+    "ucafAuthenticationData",
+    "ucafCollectionIndicator",
+    "directoryServerTransactionId",
+    "paSpecificationVersion",
+    "authenticationTransactionId",
+)
+
+
+class StepSkipped(Exception):
+    """Raised by a step that should not run for this payment (the reason is the message)."""
+
+
+class ServiceError(Exception):
+    """A non-2xx response from one of the payment services."""
+
+    def __init__(self, status, body=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.body = body if isinstance(body, dict) else {}
+
+
+class Step:
+    """One unit of work; run(results) gets the results of the steps it runs after."""
+
+    def __init__(self, name: str, run, after=(), always: bool = False):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        # always: run even when a dependency failed or was skipped (compensation)
+        self.always = always
+
+
+def run_steps(steps, max_workers: int = 4):
+    """
+    Run steps as their dependencies complete; return (results, timings).
+
+    results maps step name to its return value (completed steps only).
+    timings maps every step name to {"status": ok|skipped|failed,
+    "startedMs", "elapsedMs"} relative to the start of the run, plus
+    "reason" / "error" for skipped and failed steps. A step whose
+    dependency did not complete is skipped without running.
+    """
+    pending = {step.name: step for step in steps}
+    unknown = {d for step in steps for d in step.after} - set(pending)
+    if unknown:
+        raise ValueError(f"Unknown step dependencies: {sorted(unknown)}")
+
+    results = {}
+    timings = {}
+    started = time.perf_counter()
+
+    def offset_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    def execute(step, inputs):
+        record = {"startedMs": offset_ms()}
+        try:
+            value = step.run(inputs)
+            record["status"] = "ok"
+        except StepSkipped as e:
+            value = None
+            record["status"] = "skipped"
+            record["reason"] = str(e)
+        except Exception as e:
+            value = None
+            record["status"] = "failed"
+            record["error"] = str(e)
+            record["exception"] = e
+        record["elapsedMs"] = round(offset_ms() - record["startedMs"], 1)
+        return value, record
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+        while pending or running:
+            for name, step in list(pending.items()):
+                if not all(d in timings for d in step.after):
+                    continue
+                del pending[name]
+                blocked = [d for d in step.after if timings[d]["status"] != "ok"]
+                if blocked and not step.always:
+                    timings[name] = {
+                        "status": "skipped",
+                        "reason": f"{', '.join(blocked)} did not complete",
+                        "startedMs": offset_ms(),
+                        "elapsedMs": 0.0,
+                    }
+                    continue
+                inputs = {d: results[d] for d in step.after if d in results}
+                running[executor.submit(execute, step, inputs)] = name
+            if not running:
+                if pending:
+                    raise ValueError(f"Step dependency cycle: {sorted(pending)}")
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                value, timings[name] = future.result()
+                if timings[name]["status"] == "ok":
+                    results[name] = value
+    return results, timings
+
+
+def _mandate_token_types(complete_mandate: dict) -> list:
+    tms = complete_mandate.get("tms") or {}
+    if tms.get("tokenTypes"):
+        return list(tms["tokenTypes"])
+    if tms.get("tokenCreate"):
+        return ["customer", "paymentInstrument", "instrumentIdentifier"]
+    return []
+
+
+def _order_fields(order: dict) -> dict:
+    return {k: order[k] for k in ("amountDetails", "billTo", "shipTo") if order.get(k)}
+
+
+def build_steps(transient_token: str, jti: str, order: dict, complete_mandate: dict,
+                call, fraud_screening: bool = False, speculative_tokens: bool = True,
+                reference: str = None) -> list:
+    """The completeMandate steps for one transient token (see the module docstring)."""
+    reference = reference or jti
+    client_reference = {"code": reference}
+    order_information = _order_fields(order)
+    token_types = _mandate_token_types(complete_mandate)
+    steps = []
+
+    if fraud_screening:
+        def fraud(inputs):
+            decision = call("fraud", {
+                "clientReferenceInformation": client_reference,
+                "orderInformation": order_information,
+                "tokenInformation": {"jti": jti},
+            })
+            if decision.get("status") == "REJECTED":
+                raise StepSkipped("REJECTED by fraud screening")
+            return decision
+
+        steps.append(Step("fraud", fraud))
+    screened = ("fraud",) if fraud_screening else ()
+
+    authenticated = ()
+    if complete_mandate.get("consumerAuthentication"):
+        def authentication(inputs):
+            return call("authentication", {
+                "clientReferenceInformation": client_reference,
+                "orderInformation": order_information,
+                "tokenInformation": {"transientToken": jti},
+            })
+
+        steps.append(Step("authentication", authentication, after=screened))
+        authenticated = ("authentication",)
+
+    def authorization(inputs):
+        authentication = inputs.get("authentication")
+        processing = {"capture": complete_mandate.get("type") == "CAPTURE"}
+        if "fraud" in inputs:
+            # Already screened above; don't run Decision Manager again
+            processing["actionList"] = ["DECISION_SKIP"]
+        body = {
+            "clientReferenceInformation": client_reference,
+            "processingInformation": processing,
+            "orderInformation": order_information,
+            "tokenInformation": {"transientTokenJwt": transient_token},
+        }
+        if authentication is not None:
+            status = authentication.get("status")
+            if status not in _AUTHENTICATED:
+                raise StepSkipped(f"Payer Authentication returned {status}")
+            info = authentication.get("consumerAuthenticationInformation") or {}
+            body["consumerAuthenticationInformation"] = {
+                k: info[k] for k in _AUTHENTICATION_FIELDS if info.get(k)
+            }
+            if info.get("ecommerceIndicator"):
+                processing["commerceIndicator"] = info["ecommerceIndicator"]
+        return call("authorization", body)
+
+    steps.append(Step("authorization", authorization, after=screened + authenticated))
+
+    if token_types:
+        def tokenize(inputs):
+            payment = inputs.get("authorization")
+            if payment is not None and not _authorized(payment):
+                raise StepSkipped(f"Payment {payment.get('status')}")
+            response = call("tokenize", {
+                "processingInformation": {
+                    "actionList": ["TOKEN_CREATE"],
+                    "actionTokenTypes": token_types,
+                },
+                "tokenInformation": {"transientTokenJwt": transient_token},
+            })
+            return {
+                r["resource"]: {"id": r["id"]}
+                for r in response.get("responses") or []
+                if r.get("id") and r.get("resource")
+            }
+
+        tokenize_after = screened if speculative_tokens else ("authorization",)
+        steps.append(Step("tokenize", tokenize, after=tokenize_after))
+
+        if speculative_tokens:
+            def discard_tokens(inputs):
+                tokens = inputs.get("tokenize")
+                if not tokens:
+                    raise StepSkipped("No tokens created")
+                if _authorized(inputs.get("authorization")):
+                    raise StepSkipped("Payment authorized")
+                if "customer" not in tokens:
+                    raise StepSkipped("No customer token to delete")
+                call("delete_customer", tokens["customer"]["id"])
+                return sorted(tokens)
+
+            steps.append(Step(
+                "discard_tokens", discard_tokens, after=("authorization", "tokenize"), always=True,
+            ))
+    return steps
+
+
+def _authorized(payment) -> bool:
+    return isinstance(payment, dict) and str(payment.get("status", "")).startswith("AUTHORIZED")
+
+
+def orchestrate(transient_token: str, jti: str, order: dict, complete_mandate: dict, call,
+                fraud_screening: bool = False, speculative_tokens: bool = True,
+                max_workers: int = 4, reference: str = None) -> dict:
+    """
+    Run the payment for one transient token; return a widget-style result.
+
+    The result is the authorization response (id, status, ...) with the
+    created TMS tokens under tokenInformation, so it can go through the same
+    display and job-queue path as an up.complete() result. An "orchestration"
+    object carries the per-step timing breakdown.
+    """
+    started = time.perf_counter()
+    steps = build_steps(
+        transient_token, jti, order, complete_mandate, call,
+        fraud_screening=fraud_screening, speculative_tokens=speculative_tokens,
+        reference=reference,
+    )
+    results, timings = run_steps(steps, max_workers=max_workers)
+
+    payment = results.get("authorization")
+    result = dict(payment) if isinstance(payment, dict) else {}
+    if not result:
+        result["status"] = _unauthorized_status(results, timings)
+    tokens = results.get("tokenize")
+    if tokens and "discard_tokens" not in results:
+        result["tokenInformation"] = {**(result.get("tokenInformation") or {}), **tokens}
+
+    errors = {}
+    for name, record in timings.items():
+        error = record.pop("exception", None)
+        if isinstance(error, ServiceError):
+            record["httpStatus"] = error.status
+            if error.body:
+                errors[name] = error.body
+    if errors:
+        result["errors"] = errors
+    result["orchestration"] = {
+        "mode": "server",
+        "totalMs": round((time.perf_counter() - started) * 1000, 1),
+        "steps": timings,
+    }
+    return result
+
+
+def _unauthorized_status(results: dict, timings: dict) -> str:
+    """Status to report when no authorization response exists."""
+    for name in ("fraud", "authentication", "authorization"):
+        record = timings.get(name)
+        if record is None:
+            continue
+        if record["status"] == "failed":
+            error = record.get("exception")
+            body_status = error.body.get("status") if isinstance(error, ServiceError) else None
+            return body_status or "ERROR"
+        if record["status"] == "skipped" and name != "authorization":
+            upstream = results.get(name) or {}
+            return upstream.get("status") or record["reason"].split()[0]
+    auth = (results.get("authentication") or {}).get("status")
+    return auth or "ERROR"
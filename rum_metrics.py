@@ -0,0 +1,140 @@
+"""
+Real-user timing aggregation for the Unified Checkout widget lifecycle.
+
+checkout.html measures each widget step (client library load, Accept(),
+unifiedPayments(), show(), complete()) and posts the durations with
+navigator.sendBeacon. Each (template, client version, step) series is kept
+as a LatencySketch: a log-bucketed histogram with bounded relative error
+(the DDSketch scheme), so percentiles come from a few hundred counters
+instead of raw samples, and sketches from several workers or intervals can
+be merged exactly.
+"""
+
+import math
+import threading
+
+# Lifecycle steps checkout.html reports, in order
+STEPS = ("scriptLoad", "accept", "unifiedPayments", "interactive", "show", "complete", "total")
+MAX_DURATION_MS = 10 * 60 * 1000
+MAX_SERIES = 1000
+
+
+class LatencySketch:
+    """Mergeable quantile sketch with relative accuracy `relative_accuracy`."""
+
+    __slots__ = ("relative_accuracy", "_gamma_log", "buckets", "zero_count", "count", "total", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._gamma_log = math.log(gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        if value <= 0:
+            self.zero_count += 1
+            value = 0.0
+        else:
+            index = math.ceil(math.log(value) / self._gamma_log)
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencySketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float):
+        """Value at quantile q (0..1), within relative_accuracy; None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Midpoint (in relative terms) of the bucket's value range
+                estimate = 2 * math.exp(index * self._gamma_log) / (1 + math.exp(self._gamma_log))
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self, quantiles=(0.5, 0.75, 0.95, 0.99)) -> dict:
+        result = {"count": self.count}
+        if self.count:
+            result["mean"] = round(self.total / self.count, 1)
+            result["min"] = round(self.min, 1)
+            result["max"] = round(self.max, 1)
+            for q in quantiles:
+                result[f"p{q * 100:g}"] = round(self.quantile(q), 1)
+        return result
+
+
+class RumAggregator:
+    """Per (template, client version, step) latency sketches."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        self._series = {}
+        self.dropped = 0
+
+    def record(self, template: str, client_version: str, marks: dict) -> int:
+        """Add one beacon's step durations (ms); return how many were accepted."""
+        template = str(template or "unknown")[:100]
+        client_version = str(client_version or "unknown")[:20]
+        accepted = 0
+        with self._lock:
+            for step, value in marks.items():
+                if step not in STEPS or not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if not 0 <= value <= MAX_DURATION_MS:
+                    continue
+                key = (template, client_version, step)
+                sketch = self._series.get(key)
+                if sketch is None:
+                    if len(self._series) >= MAX_SERIES:
+                        self.dropped += 1
+                        continue
+                    sketch = self._series[key] = LatencySketch(self.relative_accuracy)
+                sketch.add(float(value))
+                accepted += 1
+        return accepted
+
+    def snapshot(self) -> list:
+        """Percentile summaries, one entry per template and client version."""
+        with self._lock:
+            grouped = {}
+            for (template, client_version, step), sketch in self._series.items():
+                grouped.setdefault((template, client_version), {})[step] = sketch.summary()
+        return [
+            {
+                "template": template,
+                "clientVersion": client_version,
+                "steps": {step: steps[step] for step in STEPS if step in steps},
+            }
+            for (template, client_version), steps in sorted(grouped.items())
+        ]
+
+
+_aggregator = RumAggregator()
+
+
+def get_rum_aggregator() -> RumAggregator:
+    """Return the process-wide aggregator."""
+    return _aggregator
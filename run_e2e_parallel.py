@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Run the E2E browser scenarios in parallel against one server.
+
+Each scenario runs in its own worker process with its own Chromium instance
+and browser context, so the whole suite takes about as long as its slowest
+scenario. Results are aggregated into e2e_parallel_report.json plus a summary
+table; per-scenario output and screenshots go to test_screenshots/<scenario>/.
+
+Usage:
+  python run_e2e_parallel.py                        # All scenarios, one worker each
+  python run_e2e_parallel.py --workers 2            # At most 2 browsers at once
+  python run_e2e_parallel.py --shard 1/2            # CI: run every 2nd scenario, starting at the 1st
+  python run_e2e_parallel.py --only default no_3ds_token
+  python run_e2e_parallel.py --no-server            # Use an already running app.py
+  python run_e2e_parallel.py --engine --workers 2   # Preset scenarios (e2e_scenarios.py), one browser per worker
+"""
+
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT = os.path.join(DIR, "e2e_parallel_report.json")
+SCREENSHOTS_DIR = os.path.join(DIR, "test_screenshots")
+
+# Scenario name -> test script
+SCENARIOS = {
+    "default": "test_e2e.py",
+    "card_only_token": "test_e2e_card_only_token.py",
+    "no_3ds_token": "test_e2e_no_3ds_token.py",
+}
+
+SUCCESS_MARKER = "=== TEST COMPLETE (SUCCESS) ==="
+
+
+def _wait_for_server(base_url: str, timeout: float = 30) -> bool:
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/", context=ctx, timeout=2)
+            return True
+        except Exception:
+            time.sleep(0.25)
+    return False
+
+
+def select_scenarios(names, shard, available=None):
+    """Apply --only and --shard K/N (1-based) to the scenario list."""
+    available = list(available or SCENARIOS)
+    unknown = set(names or ()) - set(available)
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    selected = [n for n in available if not names or n in names]
+    if shard:
+        index, count = (int(x) for x in shard.split("/"))
+        if not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {shard}")
+        selected = selected[index - 1::count]
+    return selected
+
+
+def run_scenario(name: str, base_url: str, headed: bool, timeout: float) -> dict:
+    """Run one scenario script in a subprocess and return its result record."""
+    out_dir = os.path.join(SCREENSHOTS_DIR, name)
+    os.makedirs(out_dir, exist_ok=True)
+    env = dict(os.environ, E2E_BASE_URL=base_url, E2E_SCREENSHOTS_DIR=out_dir)
+    cmd = [sys.executable, SCENARIOS[name]] + (["--headed"] if headed else [])
+
+    started = time.monotonic()
+    try:
+        proc = subprocess.run(
+            cmd, cwd=DIR, env=env, capture_output=True, text=True, timeout=timeout
+        )
+        output = (proc.stdout or "") + (proc.stderr or "")
+        exit_code = proc.returncode
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or ""
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        output += f"\nTIMEOUT after {timeout}s"
+        exit_code = None
+    duration = time.monotonic() - started
+
+    with open(os.path.join(out_dir, "run.log"), "w") as f:
+        f.write(output)
+
+    passed = exit_code == 0 and SUCCESS_MARKER in output
+    return {
+        "scenario": name,
+        "script": SCENARIOS[name],
+        "passed": passed,
+        "exit_code": exit_code,
+        "duration_s": round(duration, 1),
+        "log": os.path.relpath(os.path.join(out_dir, "run.log"), DIR),
+        "tail": output.strip().splitlines()[-5:],
+    }
+
+
+def run_engine_worker(names, base_url: str, headed: bool, timeout: float) -> list:
+    """
+    Run several preset scenarios in one e2e_scenarios.py process (one shared
+    browser) and return a result record per scenario.
+    """
+    out_dir = os.path.join(SCREENSHOTS_DIR, "engine-" + "-".join(names))[:200]
+    os.makedirs(out_dir, exist_ok=True)
+    log_path = os.path.join(out_dir, "run.log")
+    fd, report_path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    cmd = [sys.executable, "e2e_scenarios.py", "--only", *names, "--report", report_path]
+    if headed:
+        cmd.append("--headed")
+
+    started = time.monotonic()
+    try:
+        proc = subprocess.run(
+            cmd, cwd=DIR, env=dict(os.environ, E2E_BASE_URL=base_url),
+            capture_output=True, text=True, timeout=timeout * len(names),
+        )
+        output = (proc.stdout or "") + (proc.stderr or "")
+    except subprocess.TimeoutExpired:
+        output = f"TIMEOUT after {timeout * len(names)}s"
+    duration = time.monotonic() - started
+    with open(log_path, "w") as f:
+        f.write(output)
+
+    try:
+        with open(report_path) as f:
+            engine_results = {r["scenario"]: r for r in json.load(f)}
+    except (OSError, ValueError):
+        engine_results = {}
+    finally:
+        os.remove(report_path)
+
+    results = []
+    for name in names:
+        r = engine_results.get(name)
+        if r is None:
+            r = {"scenario": name, "passed": False, "duration_s": round(duration, 1),
+                 "error": "No result reported"}
+        r["log"] = os.path.relpath(log_path, DIR)
+        r["tail"] = [r["error"]] if r.get("error") else []
+        if not engine_results:
+            r["tail"] = output.strip().splitlines()[-5:]
+        results.append(r)
+    return results
+
+
+def print_summary(results, wall_time: float) -> None:
+    print("\n" + "=" * 64)
+    print(f"  {'Scenario':<20} {'Result':<8} {'Time (s)':>9}  Log")
+    print("-" * 64)
+    for r in results:
+        status = "PASS" if r["passed"] else "FAIL"
+        print(f"  {r['scenario']:<20} {status:<8} {r['duration_s']:>9.1f}  {r['log']}")
+    print("-" * 64)
+    serial = sum(r["duration_s"] for r in results)
+    print(f"  Wall time: {wall_time:.1f}s (serial sum: {serial:.1f}s)")
+    print("=" * 64)
+    for r in results:
+        if not r["passed"]:
+            print(f"\n[{r['scenario']}] last output:")
+            for line in r["tail"]:
+                print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run E2E scenarios in parallel")
+    parser.add_argument("--workers", type=int, default=0, help="Max parallel browsers (default: one per scenario)")
+    parser.add_argument("--shard", help="Run shard K of N, e.g. 1/3")
+    parser.add_argument("--only", nargs="*", help="Scenarios to run")
+    parser.add_argument("--engine", action="store_true",
+                        help="Run one scenario per data/ preset via e2e_scenarios.py (browser reused per worker)")
+    parser.add_argument("--headed", action="store_true", help="Run with visible browsers")
+    parser.add_argument("--base-url", default="https://localhost:5000")
+    parser.add_argument("--no-server", action="store_true", help="Don't start app.py (use a running server)")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-scenario timeout in seconds")
+    parser.add_argument("--report", default=REPORT, help="JSON report path")
+    args = parser.parse_args()
+
+    available = None
+    if args.engine:
+        from e2e_scenarios import discover_scenarios
+
+        available = [s["name"] for s in discover_scenarios()]
+    try:
+        scenarios = select_scenarios(args.only, args.shard, available)
+    except ValueError as e:
+        parser.error(str(e))
+    if not scenarios:
+        print("No scenarios selected.")
+        return 0
+
+    server = None
+    if not args.no_server:
+        print("Starting Flask server...")
+        server = subprocess.Popen(
+            [sys.executable, "app.py"], cwd=DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    try:
+        if not _wait_for_server(args.base_url):
+            print(f"ERROR: Server not reachable at {args.base_url}")
+            return 1
+
+        workers = min(args.workers or len(scenarios), len(scenarios))
+        print(f"Running {len(scenarios)} scenario(s) on {workers} worker(s): {', '.join(scenarios)}")
+        started = time.monotonic()
+        results = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if args.engine:
+                # Each worker process takes a round-robin bucket and reuses its browser
+                futures = [
+                    executor.submit(run_engine_worker, scenarios[i::workers], args.base_url,
+                                    args.headed, args.timeout)
+                    for i in range(workers)
+                ]
+            else:
+                futures = [
+                    executor.submit(lambda n: [run_scenario(n, args.base_url, args.headed, args.timeout)], name)
+                    for name in scenarios
+                ]
+            for future in as_completed(futures):
+                for r in future.result():
+                    print(f"  {r['scenario']}: {'PASS' if r['passed'] else 'FAIL'} ({r['duration_s']}s)")
+                    results.append(r)
+        wall_time = time.monotonic() - started
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=5)
+
+    results.sort(key=lambda r: scenarios.index(r["scenario"]))
+    with open(args.report, "w") as f:
+        json.dump(
+            {
+                "wall_time_s": round(wall_time, 1),
+                "shard": args.shard,
+                "passed": all(r["passed"] for r in results),
+                "scenarios": results,
+            },
+            f,
+            indent=2,
+        )
+    print_summary(results, wall_time)
+    print(f"\nReport: {os.path.relpath(args.report, DIR)}")
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
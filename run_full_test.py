@@ -1,5 +1,13 @@
 #!/usr/bin/env python3
-"""Start server, run e2e test, stop server. Writes all output to e2e_run.log"""
+"""
+Start server, run e2e test, stop server. Writes all output to e2e_run.log
+
+Soak mode loops the flows for a duration instead and reports server resource
+and latency drift (see e2e_soak.py):
+  python run_full_test.py --soak 4h --concurrency 2
+  python run_full_test.py --soak 30m --rate 6 --flow http
+"""
+import argparse
 import os
 import subprocess
 import sys
@@ -7,8 +15,22 @@ import time
 import urllib.request
 import ssl
 
+from e2e_soak import SERVER_LOG, add_soak_arguments, find_server_pid, parse_duration, run_soak
+
 DIR = os.path.dirname(os.path.abspath(__file__))
 LOG = os.path.join(DIR, "e2e_run.log")
+BASE_URL = "https://localhost:5000"
+
+parser = argparse.ArgumentParser(description="Start app.py, run the E2E test (or a soak), stop app.py")
+parser.add_argument("--no-server", action="store_true", help="Use an already running app.py")
+add_soak_arguments(parser)
+args = parser.parse_args()
+if args.soak:
+    try:
+        parse_duration(args.soak)
+        parse_duration(args.warmup)
+    except ValueError as e:
+        parser.error(str(e))
 
 def log(msg):
     with open(LOG, "a") as f:
@@ -19,21 +41,31 @@ def log(msg):
 with open(LOG, "w") as f:
     f.write("")
 
-log("=== Starting E2E Test ===")
+log("=== Starting E2E Test ===" if not args.soak else f"=== Starting E2E Soak ({args.soak}) ===")
 
-# Kill existing server
-subprocess.run(["lsof", "-ti:5000"], capture_output=True)
-kill = subprocess.run("lsof -ti:5000 | xargs kill -9 2>/dev/null", shell=True, capture_output=True)
-time.sleep(2)
+server = None
+if not args.no_server:
+    # Kill existing server
+    subprocess.run(["lsof", "-ti:5000"], capture_output=True)
+    kill = subprocess.run("lsof -ti:5000 | xargs kill -9 2>/dev/null", shell=True, capture_output=True)
+    time.sleep(2)
 
-# Start server
-log("Starting Flask server...")
-server = subprocess.Popen(
-    [sys.executable, "app.py"],
-    cwd=DIR,
-    stdout=subprocess.PIPE,
-    stderr=subprocess.STDOUT,
-)
+    # Start server. A soak runs for hours, so its output goes to a file
+    # rather than a pipe nobody reads (which would eventually block it).
+    # All soak traffic comes from this machine, so the per-client rate limit
+    # is lifted for it; the adaptive global limit still applies
+    log("Starting Flask server...")
+    env = dict(os.environ)
+    if args.soak:
+        env.setdefault("UC_ADMISSION_RATE_PER_CLIENT", "1000")
+        env.setdefault("UC_ADMISSION_BURST", "1000")
+    server = subprocess.Popen(
+        [sys.executable, "app.py"],
+        cwd=DIR,
+        env=env,
+        stdout=open(SERVER_LOG, "w") if args.soak else subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
 
 # Wait for server ready
 ctx = ssl.create_default_context()
@@ -41,18 +73,35 @@ ctx.check_hostname = False
 ctx.verify_mode = ssl.CERT_NONE
 for i in range(30):
     try:
-        urllib.request.urlopen("https://localhost:5000/", context=ctx, timeout=2)
+        urllib.request.urlopen(BASE_URL + "/", context=ctx, timeout=2)
         log("Server ready.")
         break
     except Exception:
         time.sleep(1)
 else:
     log("ERROR: Server did not start")
-    server.kill()
+    if server:
+        server.kill()
     sys.exit(1)
 
 time.sleep(2)
 
+if args.soak:
+    server_pid = server.pid if server else find_server_pid(5000)
+    if server_pid is None:
+        log("ERROR: Could not find the server process to sample")
+        sys.exit(1)
+    log(f"Running soak against pid {server_pid} (server output: {os.path.relpath(SERVER_LOG, DIR)})...")
+    try:
+        returncode = run_soak(args, server_pid, BASE_URL)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=5)
+    log(f"Soak exit code: {returncode}")
+    log("=== E2E Soak Complete ===")
+    sys.exit(returncode)
+
 # Run e2e test
 log("Running Playwright e2e test...")
 result = subprocess.run(
@@ -67,9 +116,13 @@ with open(LOG, "a") as f:
     f.write(result.stderr or "")
 log(f"Test exit code: {result.returncode}")
 
-# Stop server
-server.terminate()
-server.wait(timeout=5)
+# Stop server; its output (including the access log) goes into e2e_run.log too
+if server:
+    server.terminate()
+    server_output, _ = server.communicate(timeout=5)
+    with open(LOG, "ab") as f:
+        f.write(b"=== Server output ===\n")
+        f.write(server_output or b"")
 
 log("=== E2E Test Complete ===")
 sys.exit(result.returncode)
@@ -0,0 +1,161 @@
+"""
+On-demand sampling CPU profiler.
+
+While a session runs, a background thread wakes every ``interval`` seconds,
+reads every Python thread's current stack with sys._current_frames() and
+counts each distinct stack. Nothing is installed between sessions (no
+tracing hooks, no sampler thread), so the idle overhead is zero; during a
+session the profiled code runs unmodified and only pays for the GIL time
+the sampler takes.
+
+Results are collapsed stacks ("frame;frame;frame count" per line, the input
+format of flamegraph.pl and speedscope) or a self-contained SVG flamegraph.
+"""
+
+import contextlib
+import html
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+# Leaf frames of threads that are just waiting (server accept loops, idle
+# workers, Event.wait); left out unless include_idle is set
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("socket.py", "accept"),
+    ("queue.py", "get"),
+}
+
+
+class ProfilerBusy(RuntimeError):
+    """Another profiling session is already running."""
+
+
+_session_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiling_session():
+    """Hold the process's single profiling slot; raise ProfilerBusy if it is taken."""
+    if not _session_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profiling session is already running")
+    try:
+        yield
+    finally:
+        _session_lock.release()
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Stack sampler; sample() blocks for the session's duration."""
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.samples = Counter()
+        self.sample_count = 0
+
+    def _collect(self, thread_filter, names) -> None:
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (thread_filter is not None and not thread_filter(ident)):
+                continue
+            leaf = frame.f_code
+            if not self.include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(f"thread:{names.get(ident, ident)}")
+            self.samples[";".join(reversed(stack))] += 1
+
+    def sample(self, duration: float, thread_filter=None) -> Counter:
+        """
+        Sample all threads (or those where thread_filter(ident) is true) for
+        duration seconds and return the stack counts.
+        """
+        deadline = time.monotonic() + duration
+        next_tick = time.monotonic()
+        while next_tick < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self._collect(thread_filter, names)
+            self.sample_count += 1
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Fell behind (busy GIL); don't try to catch up in a burst
+                next_tick = time.monotonic()
+        return self.samples
+
+
+def collapsed_stacks(samples: Counter) -> str:
+    """flamegraph.pl / speedscope collapsed format, heaviest stacks first."""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def _color(name: str) -> str:
+    h = zlib.crc32(name.encode("utf-8"))
+    return f"rgb({205 + h % 50},{(h >> 8) % 180 + 40},{(h >> 16) % 55})"
+
+
+def flamegraph_svg(samples: Counter, title: str = "CPU profile", width: int = 1200) -> str:
+    """Render samples as a standalone SVG flamegraph (root at the bottom)."""
+    tree = {"name": "all", "count": 0, "children": {}}
+    for stack, count in samples.items():
+        node = tree
+        node["count"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"name": frame, "count": 0, "children": {}})
+            node["count"] += count
+
+    def depth(node):
+        return 1 + max((depth(c) for c in node["children"].values()), default=0)
+
+    row, top = 16, 36
+    height = top + depth(tree) * row + 10
+    total = tree["count"] or 1
+    scale = (width - 20) / total
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana" font-size="11">',
+        '<rect width="100%" height="100%" fill="#fafafa"/>',
+        f'<text x="{width // 2}" y="20" text-anchor="middle" font-size="15">'
+        f"{html.escape(title)} ({tree['count']} samples)</text>",
+    ]
+
+    def emit(node, x, level):
+        w = node["count"] * scale
+        if w < 0.5:
+            return
+        y = height - 10 - (level + 1) * row
+        name = html.escape(node["name"])
+        pct = 100.0 * node["count"] / total
+        chars = int((w - 6) / 7)
+        if len(node["name"]) <= chars:
+            label = name
+        else:
+            label = html.escape(node["name"][: chars - 2]) + ".." if chars > 3 else ""
+        parts.append(
+            f'<g><title>{name} ({node["count"]} samples, {pct:.2f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{_color(node["name"])}" rx="2"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row - 4}">{label}</text></g>'
+        )
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda c: c["name"]):
+            emit(child, child_x, level + 1)
+            child_x += child["count"] * scale
+
+    emit(tree, 10, 0)
+    parts.append("</svg>")
+    return "\n".join(parts)
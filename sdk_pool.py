@@ -0,0 +1,73 @@
+"""
+Pool of configured CyberSource SDK API instances.
+
+Constructing an API object (PaymentsApi(config, ApiClient())) runs
+ApiClient.set_configuration(): the merchant configuration is parsed and
+validated, and a logger is set up. That includes reopening the rotating log
+file. The HTTP connection pools are already shared by the SDK, so this setup
+is the per-request cost worth avoiding. An ApiClient keeps per-call state
+(headers, last_response), so an instance is leased to one caller at a time
+and returned afterwards instead of being shared.
+"""
+
+import contextlib
+import json
+import threading
+
+
+class SdkClientPool:
+    """Idle API instances of one class and configuration."""
+
+    def __init__(self, api_class, config_dict: dict, client_factory, max_idle: int = 16):
+        self.api_class = api_class
+        self.config_dict = config_dict
+        self.client_factory = client_factory
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.leased = 0
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Borrow an instance for one call (created when none is idle)."""
+        with self._lock:
+            api = self._idle.pop() if self._idle else None
+            self.leased += 1
+        if api is None:
+            api = self.api_class(self.config_dict, self.client_factory())
+            with self._lock:
+                self.created += 1
+        try:
+            yield api
+        finally:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(api)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"api": self.api_class.__name__, "created": self.created,
+                    "leased": self.leased, "idle": len(self._idle)}
+
+
+def _config_key(config_dict: dict) -> str:
+    # log_config is an object; everything else is plain settings
+    return json.dumps(
+        {k: v for k, v in config_dict.items() if k != "log_config"}, sort_keys=True, default=str
+    )
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_sdk_pool(api_class, config_dict: dict, client_factory) -> SdkClientPool:
+    """Return this process's pool for api_class and these settings (created on first use)."""
+    key = (api_class, client_factory, _config_key(config_dict))
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SdkClientPool(api_class, config_dict, client_factory)
+        return pool
+
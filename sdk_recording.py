@@ -0,0 +1,195 @@
+"""
+Record/replay layer for CyberSource SDK calls.
+
+Modes (``[App] sdk_recording_mode`` in config.ini, or ``SDK_RECORDING_MODE``):
+  off     - every call goes to CyberSource (default)
+  record  - live calls; each request/response pair is saved under
+            recordings/<template>/<key>.json
+  replay  - no network; responses are served from the recordings, after an
+            optional ``sdk_replay_latency_ms`` delay
+
+Recordings are keyed by template name (the data/ preset the request came from,
+or "adhoc") and a hash of the canonical request body (parsed JSON re-dumped
+with sorted keys), so whitespace and key order do not matter. A replay miss
+raises RecordingMismatch describing how the request differs from the closest
+recording for that template.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from CyberSource.rest import ApiException
+
+MODES = ("off", "record", "replay")
+ADHOC_TEMPLATE = "adhoc"
+# Template names become directory names under the recordings directory
+_TEMPLATE_RE = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]*$")
+
+
+class RecordingMismatch(LookupError):
+    """Raised in replay mode when no recording matches a request."""
+
+
+def canonical_body(request_json_str: str) -> str:
+    """Return the request body re-serialized with sorted keys and no whitespace."""
+    return json.dumps(
+        json.loads(request_json_str), sort_keys=True, separators=(",", ":")
+    )
+
+
+def recording_key(template: str, request_json_str: str) -> str:
+    template = template or ADHOC_TEMPLATE
+    if not _TEMPLATE_RE.match(template):
+        raise ValueError(f"Unsafe recording template name: {template!r}")
+    body = canonical_body(request_json_str)
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()[:24]
+    return f"{template}/{digest}"
+
+
+def _diff_paths(expected, actual, path="", limit=10):
+    """List JSON paths where two documents differ (at most `limit`)."""
+    diffs = []
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual)):
+            sub = f"{path}.{key}" if path else key
+            if key not in expected:
+                diffs.append(f"+{sub}")
+            elif key not in actual:
+                diffs.append(f"-{sub}")
+            else:
+                diffs.extend(_diff_paths(expected[key], actual[key], sub, limit))
+            if len(diffs) >= limit:
+                break
+    elif expected != actual:
+        diffs.append(f"~{path or '<root>'}")
+    return diffs[:limit]
+
+
+class SdkRecorder:
+    """Wraps a live SDK call with record or replay behaviour."""
+
+    def __init__(self, mode: str, directory: str, latency_ms: float = 0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown SDK recording mode: {mode} (expected one of {MODES})")
+        self.mode = mode
+        self.directory = directory
+        self.latency_ms = latency_ms
+        self.mismatches = []
+        self._lock = threading.Lock()
+        self._index = None
+
+    def call(self, template: str, request_json_str: str, live_call):
+        """
+        Return live_call()'s (data, status) or the recorded equivalent.
+
+        live_call is only invoked in "off" and "record" mode.
+        """
+        if self.mode == "off":
+            return live_call()
+        if self.mode == "replay":
+            return self._replay(template, request_json_str)
+
+        try:
+            data, status = live_call()
+        except ApiException as e:
+            self._save(template, request_json_str, {
+                "error": {"status": e.status, "reason": e.reason, "body": _text(e.body)},
+            })
+            raise
+        self._save(template, request_json_str, {"data": data, "status": status})
+        return data, status
+
+    # Recording store ---------------------------------------------------
+
+    def _load_index(self):
+        index = {}
+        if os.path.isdir(self.directory):
+            for template in os.listdir(self.directory):
+                template_dir = os.path.join(self.directory, template)
+                if not os.path.isdir(template_dir):
+                    continue
+                for name in os.listdir(template_dir):
+                    if name.endswith(".json"):
+                        with open(os.path.join(template_dir, name), "r") as f:
+                            index[f"{template}/{name[:-5]}"] = json.load(f)
+        return index
+
+    def _get_index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            return self._index
+
+    def _save(self, template: str, request_json_str: str, response: dict) -> None:
+        key = recording_key(template, request_json_str)
+        entry = {
+            "template": template or ADHOC_TEMPLATE,
+            "request": json.loads(request_json_str),
+            "response": response,
+            "recordedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        path = os.path.join(self.directory, key + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, path)
+        self._get_index()[key] = entry
+
+    def _replay(self, template: str, request_json_str: str):
+        key = recording_key(template, request_json_str)
+        entry = self._get_index().get(key)
+        if entry is None:
+            self._report_mismatch(template or ADHOC_TEMPLATE, key, request_json_str)
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        response = entry["response"]
+        if "error" in response:
+            error = ApiException(status=response["error"]["status"], reason=response["error"]["reason"])
+            error.body = response["error"].get("body")
+            raise error
+        return response["data"], response["status"]
+
+    def _report_mismatch(self, template: str, key: str, request_json_str: str):
+        request_doc = json.loads(request_json_str)
+        candidates = [
+            entry for k, entry in self._get_index().items() if k.startswith(template + "/")
+        ]
+        if candidates:
+            closest = min(
+                (_diff_paths(c["request"], request_doc, limit=50) for c in candidates),
+                key=len,
+            )
+            detail = f"closest recording differs at: {', '.join(closest[:10])}"
+        else:
+            detail = f"no recordings for template '{template}'"
+        message = f"No SDK recording for {key} ({detail})"
+        with self._lock:
+            self.mismatches.append({"key": key, "template": template, "detail": detail})
+        print(f"[sdk-replay] MISMATCH {message}", file=sys.stderr)
+        raise RecordingMismatch(message)
+
+
+def _text(body):
+    if isinstance(body, bytes):
+        return body.decode("utf-8", errors="replace")
+    return body
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_sdk_recorder(mode: str, directory: str, latency_ms: float = 0) -> SdkRecorder:
+    """Return a shared recorder for the given settings (the recording index is loaded once)."""
+    key = (mode, directory, latency_ms)
+    with _recorders_lock:
+        if key not in _recorders:
+            _recorders[key] = SdkRecorder(mode, directory, latency_ms)
+        return _recorders[key]
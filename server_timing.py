@@ -0,0 +1,182 @@
+"""
+Server-Timing instrumentation: where a request's server time goes.
+
+Each timed request gets a RequestTiming, held in a context variable so code
+deep in the call stack can add to it without being handed anything.
+phase(name) and @timed(name) add perf_counter (monotonic) durations to it.
+A phase that runs several times in one request, such as two JWT decodes,
+is summed, and a phase entered again while it is already open (a decoder
+calling itself) is only counted once. When the response is ready app.py
+writes the phases as a Server-Timing header, which browser devtools and
+PerformanceResourceTiming.serverTiming show:
+
+    Server-Timing: config;dur=0.4;desc="Config load", sdk;dur=612.8;desc="SDK call", total;dur=640.2
+
+Phases can overlap: a tojson filter inside a template counts as both
+"render" and "json". Outside a timed request phase() does nothing beyond
+one context variable lookup.
+
+Finished requests also go into the process-wide ServerTimingStats, which
+keeps a LatencySketch per (route, phase) as rum_metrics does, and then to
+its listeners, so other metrics sinks can take the same numbers.
+"""
+
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+from rum_metrics import LatencySketch
+
+# Phase name -> Server-Timing desc, in header order
+PHASES = {
+    "config": "Config load",
+    "sdk": "SDK call",
+    "jwt": "JWT decode",
+    "json": "JSON serialization",
+    "render": "Template render",
+}
+MAX_ROUTES = 200
+
+_current = contextvars.ContextVar("server_timing", default=None)
+
+
+class RequestTiming:
+    """Summed phase durations (ms) for one request."""
+
+    __slots__ = ("started", "phases", "_open")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._open = {}
+
+    def begin(self, name: str) -> None:
+        entry = self._open.get(name)
+        if entry is None:
+            self._open[name] = [time.perf_counter(), 1]
+        else:
+            entry[1] += 1
+
+    def end(self, name: str) -> None:
+        entry = self._open.get(name)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if not entry[1]:
+            del self._open[name]
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - entry[0]) * 1000
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self, total_ms: float) -> str:
+        """Server-Timing header value: the recorded phases in PHASES order, then total."""
+        names = [n for n in PHASES if n in self.phases] + [n for n in self.phases if n not in PHASES]
+        parts = [f'{n};dur={self.phases[n]:.1f};desc="{PHASES.get(n, n)}"' for n in names]
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+def start() -> contextvars.Token:
+    """Begin timing the current request; pass the token to finish()."""
+    return _current.set(RequestTiming())
+
+
+def finish(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current():
+    """The current request's RequestTiming, or None when it is not being timed."""
+    return _current.get()
+
+
+def begin(name: str) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.begin(name)
+
+
+def end(name: str) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.end(name)
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    """Add the time spent in the with block to the current request's name phase."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    timing.begin(name)
+    try:
+        yield
+    finally:
+        timing.end(name)
+
+
+def timed(name: str):
+    """Decorator form of phase()."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ServerTimingStats:
+    """Per (route, phase) latency sketches over timed requests."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        self._routes = {}
+        self.dropped = 0
+        # Called as listener(route, phases, total_ms) after each record()
+        self.listeners = []
+
+    def record(self, route: str, phases: dict, total_ms: float) -> None:
+        with self._lock:
+            series = self._routes.get(route)
+            if series is None:
+                if len(self._routes) >= MAX_ROUTES:
+                    self.dropped += 1
+                    return
+                series = self._routes[route] = {"count": 0, "phases": {}}
+            series["count"] += 1
+            for name, value in list(phases.items()) + [("total", total_ms)]:
+                sketch = series["phases"].get(name)
+                if sketch is None:
+                    sketch = series["phases"][name] = LatencySketch(self.relative_accuracy)
+                sketch.add(value)
+        for listener in self.listeners:
+            listener(route, phases, total_ms)
+
+    def snapshot(self) -> list:
+        """Percentile summaries (ms), one entry per route."""
+        with self._lock:
+            return [
+                {
+                    "route": route,
+                    "count": series["count"],
+                    "phases": {name: sketch.summary() for name, sketch in series["phases"].items()},
+                }
+                for route, series in sorted(self._routes.items())
+            ]
+
+
+_stats = ServerTimingStats()
+
+
+def get_server_timing_stats() -> ServerTimingStats:
+    """Return the process-wide stats."""
+    return _stats
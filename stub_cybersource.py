@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Capture Context API, for exercising run_environments.
+
+Each --stub starts one HTTPS server (certs/server.cert) on its own port, with
+its own injected latency, jitter and error rate. POST /up/v1/capture-contexts
+answers 201 with an unsigned capture-context-shaped JWT. The JWT echoes the
+request's targetOrigins, orderInformation and completeMandate, and has a 15
+minute exp. Error responses are 503. Nothing is validated, and the JWT is
+not signed, so the browser widget cannot load from it. It is for the server
+side only.
+
+The JWT's clientLibrary points at a small stub script on the same server
+(GET /up/v1/assets/0.34.0/SecureAcceptance.js), with its real SRI value.
+That makes the stub a stand-in library host for client_library_mirror.py.
+
+Usage:
+  python stub_cybersource.py --stub 9001:40 --stub 9002:250 --stub 9003:80:20:0.3
+      (port[:latency_ms[:jitter_ms[:error_rate]]])
+
+  config.ini:
+      [CyberSource]
+      run_environments = localhost:9001, localhost:9002, localhost:9003
+
+Then generate capture contexts as usual and watch GET /api/environments.
+Loopback hosts are called without certificate verification.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+CAPTURE_CONTEXT_PATH = "/up/v1/capture-contexts"
+
+
+def _b64(document) -> str:
+    return base64.urlsafe_b64encode(json.dumps(document).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+# Served at LIBRARY_PATH and named (with its real SRI value) in every stub
+# capture context, so client_library_mirror.py can be tried against the stub
+LIBRARY_PATH = "/up/v1/assets/0.34.0/SecureAcceptance.js"
+STUB_LIBRARY = (
+    b"/* Stub Unified Checkout client library (stub_cybersource.py) */\n"
+    b"window.Accept = function () { return Promise.reject(new Error('stub client library')); };\n"
+)
+LIBRARY_INTEGRITY = "sha384-" + base64.b64encode(hashlib.sha384(STUB_LIBRARY).digest()).decode("ascii")
+
+
+def stub_capture_context(request_body: dict, port: int) -> str:
+    now = int(time.time())
+    data = {
+        "clientLibrary": f"https://localhost:{port}{LIBRARY_PATH}",
+        "clientLibraryIntegrity": LIBRARY_INTEGRITY,
+        "clientVersion": request_body.get("clientVersion", "0.34"),
+    }
+    for key in ("targetOrigins", "orderInformation", "completeMandate", "allowedPaymentTypes"):
+        if key in request_body:
+            data[key] = request_body[key]
+    payload = {
+        "jti": str(uuid.uuid4()),
+        "iat": now,
+        "exp": now + 900,
+        "type": "gda-0.9.0",
+        "ctx": [{"type": "mf-2.0.0", "data": data}],
+    }
+    return f"{_b64({'kid': 'stub', 'alg': 'RS256'})}.{_b64(payload)}.c3R1Yg"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Set per server in make_server()
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    error_rate = 0.0
+    library_fetches = 0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str) -> None:
+        encoded = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != LIBRARY_PATH:
+            self._send(404, json.dumps({"status": "NOT_FOUND"}), "application/json")
+            return
+        type(self).library_fetches += 1
+        time.sleep(self.latency_ms / 1000)
+        self._send(200, STUB_LIBRARY.decode("utf-8"), "application/javascript")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+        if self.path.split("?")[0] != CAPTURE_CONTEXT_PATH:
+            self._send(404, json.dumps({"status": "NOT_FOUND"}), "application/json")
+            return
+        if random.random() < self.error_rate:
+            self._send(503, json.dumps({"status": "SERVER_ERROR", "reason": "STUB_INJECTED"}), "application/json")
+            return
+        try:
+            request_body = json.loads(raw or b"{}")
+        except ValueError:
+            request_body = {}
+        body = stub_capture_context(request_body if isinstance(request_body, dict) else {},
+                                    self.server.server_port)
+        self._send(201, body, "application/jwt")
+
+
+def make_server(port: int, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """An HTTPS stub server (not started) with the given injected behaviour."""
+    handler = type("Handler", (StubHandler,), {
+        "latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(
+        os.path.join(DIR, "certs", "server.cert"), os.path.join(DIR, "certs", "server.key")
+    )
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    return server
+
+
+def parse_stub(spec: str) -> tuple:
+    """"port[:latency_ms[:jitter_ms[:error_rate]]]" -> (port, latency, jitter, error_rate)."""
+    parts = spec.split(":")
+    if not 1 <= len(parts) <= 4:
+        raise argparse.ArgumentTypeError(f"Bad stub spec {spec!r}")
+    try:
+        port = int(parts[0])
+        latency, jitter, error_rate = (float(p) for p in (parts[1:] + ["0", "0", "0"])[:3])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Bad stub spec {spec!r}") from None
+    if not 0 <= error_rate <= 1:
+        raise argparse.ArgumentTypeError(f"Error rate must be 0..1 in {spec!r}")
+    return port, latency, jitter, error_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Capture Context API stubs with injected latency")
+    parser.add_argument("--stub", action="append", type=parse_stub, required=True,
+                        help="port[:latency_ms[:jitter_ms[:error_rate]]] (repeatable)")
+    parser.add_argument("--bind", default="127.0.0.1", help="Address to listen on")
+    args = parser.parse_args()
+
+    servers = []
+    for port, latency, jitter, error_rate in args.stub:
+        server = make_server(port, latency, jitter, error_rate, args.bind)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        print(f"stub https://localhost:{port}{CAPTURE_CONTEXT_PATH} "
+              f"latency={latency:g}ms jitter={jitter:g}ms errors={error_rate:.0%}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            print(f"stub :{server.server_port} served the client library "
+                  f"{server.RequestHandlerClass.library_fetches} time(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Weighted routing of checkout sessions across capture context presets.
+
+template_routing in config.ini lists presets with weights, e.g.
+
+    template_routing = default-uc-capture-context-request.json=50,
+                       default-uc-capture-context-request-no-3ds.json=50
+
+Each browser session gets a random ID cookie. The ID is hashed (with a salt)
+to a point in [0, 1), and that point falls in one preset's share of the
+cumulative weights, so a session keeps its variant across visits, restarts
+and workers. Changing the weights only moves the sessions whose point now
+falls on the other side of a boundary.
+
+VariantStats keeps per-variant measurements for routed sessions only (a
+shopper who picks another preset by hand is not counted): capture context
+generation latency, widget time-to-interactive and end-to-end time from the
+RUM beacon, and payment outcomes. The latencies use the same mergeable
+LatencySketch as rum_metrics.
+"""
+
+import hashlib
+import threading
+from collections import Counter
+
+from rum_metrics import LatencySketch
+
+SESSION_COOKIE = "uc_session"
+
+# Latency series kept per variant, reported in this order
+METRICS = ("captureContextMs", "interactiveMs", "totalMs")
+
+
+def parse_weights(spec: str) -> list:
+    """Parse "preset=weight, preset=weight" into [(preset, weight)]; raise ValueError."""
+    weights = []
+    for item in (spec or "").replace("\n", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, weight = item.rpartition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"Expected preset=weight, got {item!r}")
+        try:
+            value = float(weight)
+        except ValueError:
+            raise ValueError(f"Bad weight in {item!r}") from None
+        if value < 0:
+            raise ValueError(f"Negative weight in {item!r}")
+        if value:
+            weights.append((name.strip(), value))
+    return weights
+
+
+class TemplateRouter:
+    """Sticky weighted assignment of session IDs to presets."""
+
+    def __init__(self, weights: list, salt: str = ""):
+        if not weights:
+            raise ValueError("No variants with a positive weight")
+        self.weights = list(weights)
+        self.salt = salt
+        total = sum(weight for _, weight in weights)
+        self._bounds = []
+        cumulative = 0.0
+        for name, weight in weights:
+            cumulative += weight / total
+            self._bounds.append((cumulative, name))
+
+    def _point(self, session_id: str) -> float:
+        digest = hashlib.sha256(f"{self.salt}:{session_id}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2**64
+
+    def assign(self, session_id: str) -> str:
+        point = self._point(session_id)
+        for bound, name in self._bounds:
+            if point < bound:
+                return name
+        return self._bounds[-1][1]
+
+    def shares(self) -> dict:
+        total = sum(weight for _, weight in self.weights)
+        return {name: round(weight / total, 4) for name, weight in self.weights}
+
+
+class VariantStats:
+    """Routed page views, latency sketches and payment outcomes per variant."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._lock = threading.Lock()
+        self._variants = {}
+
+    def _variant(self, name: str) -> dict:
+        variant = self._variants.get(name)
+        if variant is None:
+            variant = self._variants[name] = {
+                "routed": 0,
+                "latency": {m: LatencySketch(self.relative_accuracy) for m in METRICS},
+                "outcomes": Counter(),
+            }
+        return variant
+
+    def record_routed(self, name: str) -> None:
+        with self._lock:
+            self._variant(name)["routed"] += 1
+
+    def record_latency(self, name: str, metric: str, value_ms: float) -> None:
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}")
+        with self._lock:
+            self._variant(name)["latency"][metric].add(float(value_ms))
+
+    def record_outcome(self, name: str, status: str) -> None:
+        with self._lock:
+            self._variant(name)["outcomes"][str(status or "UNKNOWN")[:40]] += 1
+
+    def snapshot(self, shares: dict = None) -> list:
+        """One summary per variant: routed page views, latency percentiles, outcomes."""
+        shares = shares or {}
+        with self._lock:
+            names = sorted(set(self._variants) | set(shares))
+            result = []
+            for name in names:
+                variant = self._variants.get(name) or {"routed": 0, "latency": {}, "outcomes": {}}
+                outcomes = dict(variant["outcomes"])
+                completed = sum(outcomes.values())
+                authorized = sum(n for status, n in outcomes.items() if status.startswith("AUTHORIZED"))
+                result.append({
+                    "template": name,
+                    "weight": shares.get(name, 0.0),
+                    "routed": variant["routed"],
+                    "latency": {
+                        m: variant["latency"][m].summary()
+                        for m in METRICS if m in variant["latency"]
+                    },
+                    "outcomes": outcomes,
+                    "completed": completed,
+                    "authorizedRate": round(authorized / completed, 4) if completed else None,
+                })
+        return result
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+_stats = VariantStats()
+
+
+def get_template_router(spec: str, salt: str = ""):
+    """Return the router for this weights spec, or None when routing is off (empty spec)."""
+    if not (spec or "").strip():
+        return None
+    key = (spec, salt)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = _routers[key] = TemplateRouter(parse_weights(spec), salt)
+        return router
+
+
+def get_variant_stats() -> VariantStats:
+    """Return the process-wide variant stats."""
+    return _stats
@@ -15,10 +15,16 @@ import os
 import sys
 from playwright.async_api import async_playwright
 
-SCREENSHOTS_DIR = os.path.join(os.path.dirname(__file__), "test_screenshots")
-os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
+from e2e_waits import (
+    BASE_URL,
+    SCREENSHOTS_DIR,
+    wait_for_frame,
+    wait_for_payment_result,
+    wait_for_selector_in_any_frame,
+    wait_for_widget_ready,
+)
 
-BASE_URL = "https://localhost:5000"
+os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
 
 
 async def _screenshot(page, name: str, **kwargs) -> None:
@@ -87,23 +93,16 @@ async def run_test(headed: bool = False):
         # Step 4: Launch Checkout
         await page.click("button:has-text('Launch checkout page')")
         await page.wait_for_load_state("domcontentloaded", timeout=15000)
-        await asyncio.sleep(3)
         print(f"  4. Checkout page loaded: {await page.title()}")
 
         # ============================================================
         # STEP 5: Wait for payment widget to load
         # ============================================================
         print("\n=== STEP 5: Wait for Payment Widget ===")
+        buttonlist_frame = None
         try:
-            await page.wait_for_function(
-                """() => {
-                    const c = document.getElementById('buttonPaymentListContainer');
-                    return c && c.querySelectorAll('iframe').length > 0;
-                }""",
-                timeout=30000,
-            )
-            await asyncio.sleep(8)
-            print("  Widget loaded (iframes present)")
+            buttonlist_frame = await wait_for_widget_ready(page, timeout=30000)
+            print("  Widget loaded (button list ready)")
         except Exception as e:
             print(f"  Widget load error: {e}")
 
@@ -115,12 +114,6 @@ async def run_test(headed: bool = False):
         # ============================================================
         print("\n=== STEP 6: Click 'Checkout With Card' ===")
 
-        buttonlist_frame = None
-        for frame in page.frames:
-            if "buttonlist" in frame.url:
-                buttonlist_frame = frame
-                break
-
         if not buttonlist_frame:
             print("  ERROR: No buttonlist frame found!")
             await browser.close()
@@ -136,11 +129,12 @@ async def run_test(headed: bool = False):
         if await card_btn.count() > 0:
             await card_btn.first.click()
             print("  Clicked 'Checkout With Card'")
-            await asyncio.sleep(5)
         else:
             await buttons[0].click()
             print(f"  Clicked first button")
-            await asyncio.sleep(5)
+
+        # Find the MCE (Manual Card Entry) iframe once its card number field is shown
+        mce_frame = await wait_for_frame(page, "mce", "input[id*='card-number']", timeout=30000)
 
         await _screenshot(page, "06_card_form.png", full_page=True)
         print("  Screenshot: 06_card_form.png")
@@ -150,13 +144,6 @@ async def run_test(headed: bool = False):
         # ============================================================
         print("\n=== STEP 7: Fill Card Details ===")
 
-        # Find the MCE (Manual Card Entry) iframe
-        mce_frame = None
-        for frame in page.frames:
-            if "mce" in frame.url:
-                mce_frame = frame
-                break
-
         if not mce_frame:
             print("  ERROR: No MCE frame found!")
             # List all frames for debugging
@@ -217,37 +204,29 @@ async def run_test(headed: bool = False):
 
         # Wait for the confirmation step
         print("  Waiting for confirmation step...")
-        await asyncio.sleep(8)
+        confirm_frame, confirm_btn = await wait_for_selector_in_any_frame(
+            page, "button:has-text('Confirm and Continue'), button:has-text('Confirm')", timeout=30000
+        )
         await _screenshot(page, "07b_confirm_step.png", full_page=True)
 
-        # Click "Confirm and Continue" in the MCE frame
-        confirm_btn = mce_frame.locator("button:has-text('Confirm and Continue'), button:has-text('Confirm')")
-        if await confirm_btn.count() > 0:
-            print("  Found 'Confirm and Continue' button")
-            await confirm_btn.first.click()
+        # Click "Confirm and Continue" (normally in the MCE frame)
+        if confirm_btn:
+            print(f"  Found 'Confirm and Continue' in frame: {confirm_frame.url[:60]}")
+            await confirm_btn.click()
             print("  Clicked 'Confirm and Continue'!")
         else:
-            # Try all frames
-            for frame in page.frames:
-                cb = frame.locator("button:has-text('Confirm and Continue')")
-                if await cb.count() > 0:
-                    print(f"  Found 'Confirm and Continue' in frame: {frame.url[:60]}")
-                    await cb.first.click()
-                    print("  Clicked!")
-                    break
+            print("  'Confirm and Continue' button did not appear")
 
         # ============================================================
         # Wait for 3DS step-up challenge (Visa 4000000000002503 triggers it)
         # ============================================================
         print("\n=== Waiting for payment processing (may include 3DS step-up) ===")
-        # Give 3DS challenge iframe time to load (Cardinal/ACS can take several seconds)
-        await asyncio.sleep(5)
 
         # Visa 4000000000002503 triggers 3DS challenge. Mastercard 5200000000001096 also supported.
         # Cardinal/CyberSource 3DS sandbox may show: OTP input, or "Authenticate"/"Approve" button.
-        for _ in range(90):  # Up to 90 seconds
-            await asyncio.sleep(1)
-            if "/process-payment" in page.url:
+        # Each round returns as soon as the result page loads, else checks for a challenge.
+        for _ in range(90):  # Up to ~90 seconds
+            if await wait_for_payment_result(page, timeout=1000):
                 print(f"  Form submitted! Now at: {page.url}")
                 break
             # Check for 3DS challenge in any frame
@@ -268,20 +247,14 @@ async def run_test(headed: bool = False):
                     if await btn.count() > 0:
                         await btn.first.click()
                         print("  3DS challenge: clicked submit/authenticate")
-                        await asyncio.sleep(5)
                         break
                 except Exception:
                     pass
         else:
-            try:
-                await page.wait_for_url("**/process-payment*", timeout=15000, wait_until="load")
-            except Exception:
-                pass
+            await wait_for_payment_result(page, timeout=15000)
 
         # The /process-payment endpoint may redirect to step_up.html or complete_response.html
-        # Wait a bit for server processing
-        await asyncio.sleep(5)
-        await page.wait_for_load_state("domcontentloaded", timeout=30000)
+        await page.wait_for_load_state("load", timeout=30000)
 
         await _screenshot(page, "08_result.png", full_page=True)
 
@@ -304,7 +277,9 @@ async def run_test(headed: bool = False):
             step_up_iframe = page.locator("iframe[name='step-up-iframe']")
             if await step_up_iframe.count() > 0:
                 print("  Found 3DS step-up iframe, waiting for challenge...")
-                await asyncio.sleep(10)
+                await wait_for_selector_in_any_frame(
+                    page, "input[type='text'], input[type='password'], button[type='submit']", timeout=15000
+                )
                 await _screenshot(page, "08_3ds_challenge.png", full_page=True)
 
                 # Try to interact with the 3DS challenge
@@ -320,7 +295,7 @@ async def run_test(headed: bool = False):
                         if await submit.count() > 0:
                             await submit.first.click()
                             print("  Clicked 3DS submit")
-                            await asyncio.sleep(10)
+                            await page.wait_for_load_state("load", timeout=15000)
                         break
 
         elif "DECLINED" in content:
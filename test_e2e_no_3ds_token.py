@@ -18,13 +18,20 @@ Usage:
 import argparse
 import asyncio
 import os
-import re
 from playwright.async_api import async_playwright
 
-SCREENSHOTS_DIR = os.path.join(os.path.dirname(__file__), "test_screenshots")
+from e2e_scenarios import tick_save_card
+from e2e_waits import (
+    BASE_URL,
+    SCREENSHOTS_DIR,
+    wait_for_frame,
+    wait_for_payment_result,
+    wait_for_selector_in_any_frame,
+    wait_for_widget_ready,
+)
+
 os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
 
-BASE_URL = "https://localhost:5000"
 CONFIG_FILE = "default-uc-capture-context-request-no-3ds-token-with-prefix.json"
 
 
@@ -36,67 +43,6 @@ async def _screenshot(page, name: str, **kwargs) -> None:
         print(f"  Screenshot {name} skipped: {e}")
 
 
-async def _tick_save_card(page, mce_frame) -> bool:
-    """Find and tick 'Save my card for future ...' checkbox. Searches MCE frame and all frames."""
-    frames_to_try = [mce_frame] + [f for f in page.frames if f != mce_frame]
-
-    for frame in frames_to_try:
-        try:
-            # Playwright getByLabel finds by associated label text
-            lb = frame.get_by_label(re.compile(r"save my card", re.I))
-            if await lb.count() > 0:
-                await lb.first.click()
-                print("  Tick Save card: clicked via getByLabel('save my card')")
-                return True
-        except Exception:
-            pass
-        try:
-            cb = frame.get_by_role("checkbox", name=re.compile(r"save|future", re.I))
-            if await cb.count() > 0:
-                el = cb.first
-                if not await el.is_checked():
-                    await el.check()
-                print("  Tick Save card: checked via getByRole(checkbox)")
-                return True
-        except Exception:
-            pass
-
-    selectors = [
-        "label:has-text('Save my card')",
-        "label:has-text('Save my card for future')",
-        "label:has-text('save my card' i)",
-        "text=Save my card for future",
-        "label:has-text('future')",
-        "input[type='checkbox'][id*='save']",
-        "input[type='checkbox'][name*='save']",
-        "input[type='checkbox'][aria-label*='save' i]",
-        "label:has-text('Save'):has(input[type='checkbox'])",
-        "input[type='checkbox']",
-    ]
-    for frame in frames_to_try:
-        for sel in selectors:
-            try:
-                loc = frame.locator(sel)
-                if await loc.count() > 0:
-                    el = loc.first
-                    tag = await el.evaluate("e => e.tagName.toLowerCase()")
-                    if tag == "label":
-                        await el.click()
-                        print(f"  Tick Save card: clicked label '{sel}'")
-                        return True
-                    if tag == "input":
-                        is_checked = await el.is_checked()
-                        if not is_checked:
-                            await el.check()
-                            print(f"  Tick Save card: checked ({sel})")
-                            return True
-                        print(f"  Save card already checked")
-                        return True
-            except Exception:
-                continue
-    return False
-
-
 async def run_test(headed: bool = False):
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=not headed)
@@ -142,23 +88,16 @@ async def run_test(headed: bool = False):
 
         await page.click("button:has-text('Launch checkout page')")
         await page.wait_for_load_state("domcontentloaded", timeout=15000)
-        await asyncio.sleep(3)
         print(f"  4. Checkout page loaded: {await page.title()}")
 
         # ============================================================
         # STEP 5: Wait for payment widget
         # ============================================================
         print("\n=== STEP 5: Wait for Payment Widget ===")
+        buttonlist_frame = None
         try:
-            await page.wait_for_function(
-                """() => {
-                    const c = document.getElementById('buttonPaymentListContainer');
-                    return c && c.querySelectorAll('iframe').length > 0;
-                }""",
-                timeout=30000,
-            )
-            await asyncio.sleep(8)
-            print("  Widget loaded (iframes present)")
+            buttonlist_frame = await wait_for_widget_ready(page, timeout=30000)
+            print("  Widget loaded (button list ready)")
         except Exception as e:
             print(f"  Widget load error: {e}")
         await _screenshot(page, "05_widget.png", full_page=True)
@@ -167,11 +106,6 @@ async def run_test(headed: bool = False):
         # STEP 6: Click "Checkout With Card"
         # ============================================================
         print("\n=== STEP 6: Click 'Checkout With Card' ===")
-        buttonlist_frame = None
-        for frame in page.frames:
-            if "buttonlist" in frame.url:
-                buttonlist_frame = frame
-                break
         if not buttonlist_frame:
             print("  ERROR: No buttonlist frame found!")
             await browser.close()
@@ -184,18 +118,13 @@ async def run_test(headed: bool = False):
         else:
             await buttonlist_frame.locator("button").first.click()
             print("  Clicked first button")
-        await asyncio.sleep(5)
+        mce_frame = await wait_for_frame(page, "mce", "input[id*='card-number']", timeout=30000)
         await _screenshot(page, "06_card_form.png", full_page=True)
 
         # ============================================================
         # STEP 7: Fill card details + tick Save card
         # ============================================================
         print("\n=== STEP 7: Fill Card Details + Save Card ===")
-        mce_frame = None
-        for frame in page.frames:
-            if "mce" in frame.url:
-                mce_frame = frame
-                break
         if not mce_frame:
             print("  ERROR: No MCE frame found!")
             await browser.close()
@@ -224,8 +153,7 @@ async def run_test(headed: bool = False):
         await _screenshot(page, "07_filled.png", full_page=True)
 
         # Tick Save card before Pay (or may appear on confirm step)
-        await asyncio.sleep(1)
-        ticked = await _tick_save_card(page, mce_frame)
+        ticked = await tick_save_card(page, mce_frame)
 
         # Click Pay/Submit
         submit_btn = mce_frame.locator(
@@ -235,40 +163,33 @@ async def run_test(headed: bool = False):
         if await submit_btn.count() > 0:
             await submit_btn.first.click()
             print("  Clicked Pay/Submit")
-        await asyncio.sleep(5)
+        confirm_frame, confirm_btn = await wait_for_selector_in_any_frame(
+            page, "button:has-text('Confirm and Continue'), button:has-text('Confirm')", timeout=30000
+        )
 
         # Save card may appear on confirm step - try again
         if not ticked:
-            ticked = await _tick_save_card(page, mce_frame)
+            ticked = await tick_save_card(page, mce_frame)
         if not ticked:
             print("  Save card checkbox not found (may not be visible in this flow)")
 
         await _screenshot(page, "07b_confirm_step.png", full_page=True)
 
         # Confirm and Continue
-        confirm_btn = mce_frame.locator("button:has-text('Confirm and Continue'), button:has-text('Confirm')")
-        if await confirm_btn.count() > 0:
-            await confirm_btn.first.click()
+        if confirm_btn:
+            await confirm_btn.click()
             print("  Clicked 'Confirm and Continue'")
         else:
-            for frame in page.frames:
-                cb = frame.locator("button:has-text('Confirm and Continue')")
-                if await cb.count() > 0:
-                    await cb.first.click()
-                    break
+            print("  'Confirm and Continue' button did not appear")
 
         # ============================================================
         # STEP 8: Wait for payment result (no 3DS/OTP in this config)
         # ============================================================
         print("\n=== STEP 8: Wait for payment result (no 3DS) ===")
-        try:
-            await page.wait_for_url("**/process-payment*", timeout=60000, wait_until="load")
+        if await wait_for_payment_result(page, timeout=60000):
             print("  Form submitted to /process-payment")
-        except Exception:
-            pass
 
-        await asyncio.sleep(5)
-        await page.wait_for_load_state("domcontentloaded", timeout=30000)
+        await page.wait_for_load_state("load", timeout=30000)
         await _screenshot(page, "08_result.png", full_page=True)
 
         # ============================================================